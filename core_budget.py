@@ -0,0 +1,96 @@
+import logging
+import os
+
+# Intra-op threads one worker needs per method. Lexical methods are single-threaded Python, so they get one core
+# each; the dense methods spend their time in PyTorch/BLAS/faiss kernels that scale up to a few threads.
+METHOD_THREADS = {
+    "bm25": 1,
+    "tfidf": 1,
+    "flash": 1,
+    "lunr": 1,
+    "fuzz": 1,
+    "positional": 1,
+    "bm25_wand": 1,
+    "tfidf_wand": 1,
+    "embedding": 4,
+    "encoder": 4,
+    "dpr": 4,
+}
+
+# Thread pools read these when they start; set before the libraries are imported in a fresh process
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS",
+                   "VECLIB_MAXIMUM_THREADS")
+
+
+def available_cores():
+    """Cores this process may run on (respects taskset/cgroup affinity, unlike cpu_count)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class CoreBudget:
+    def __init__(self, cores=None, threads=None, pin=False):
+        """
+        Split a core budget between worker processes and the intra-op threads of each worker.
+
+        workers x threads never exceeds the budget, so PyTorch, faiss and BLAS in every worker stop
+        competing for the same cores.
+
+        :param cores: Number of cores to use (default: all cores available to this process).
+        :param threads: Threads per worker for every method, overriding METHOD_THREADS.
+        :param pin: Pin each worker to its own set of cores with sched_setaffinity (Linux only).
+        """
+        self.core_ids = available_cores()[:cores] if cores else available_cores()
+        self.cores = len(self.core_ids)
+        self.threads = threads
+        self.pin = pin and hasattr(os, "sched_setaffinity")
+
+    def threads_for(self, method):
+        return max(1, min(self.threads or METHOD_THREADS.get(method, 1), self.cores))
+
+    def workers_for(self, method):
+        return max(1, self.cores // self.threads_for(method))
+
+    def plan(self, methods):
+        """{method: (workers, threads per worker)} for a run over methods."""
+        return {method: (self.workers_for(method), self.threads_for(method)) for method in methods}
+
+    def initializer(self, method, counter=None):
+        """(initializer, initargs) for a process pool whose workers run method; counter numbers the workers."""
+        return init_worker, (self.threads_for(method), self.core_ids if self.pin else None, counter)
+
+
+def limit_threads(threads):
+    """Cap the intra-op threads of every numeric library in this process."""
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")  # Hugging Face tokenizers spawn their own pool
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)  # BLAS/OpenMP pools already loaded (e.g. numpy inherited over fork)
+    except ImportError:
+        pass
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    try:
+        import faiss
+        faiss.omp_set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def init_worker(threads, core_ids=None, counter=None):
+    """Process pool initializer: limit threads and optionally pin this worker to its block of cores."""
+    limit_threads(threads)
+    if core_ids and counter is not None:
+        with counter.get_lock():
+            index = counter.value
+            counter.value += 1
+        start = (index * threads) % len(core_ids)
+        cores = {core_ids[(start + offset) % len(core_ids)] for offset in range(threads)}
+        os.sched_setaffinity(0, cores)
+        logging.debug(f"Worker {index} pinned to cores {sorted(cores)}")
@@ -34,7 +34,7 @@ def get_results(method, queries, results):
 
 def main():
     if len(sys.argv) < 5:
-        print("Usage: python main.py <method> <queries> <documents> <key> <on>")
+        print("Usage: python main.py <method> <queries> <documents> <key> <on> [candidates]")
         sys.exit(1)
 
     method = sys.argv[1]
@@ -42,12 +42,15 @@ def main():
     documents_str = sys.argv[3]
     key = sys.argv[4]
     on_str = sys.argv[5]
+    # Optional first-stage candidate ids per query, e.g. from documentretriever; only these are scored
+    candidates_str = sys.argv[6] if len(sys.argv) > 6 else None
 
     # Convert JSON strings to Python objects
     try:
         queries = json.loads(queries_str)
         documents = json.loads(documents_str)
         on = ast.literal_eval(on_str)
+        candidates = json.loads(candidates_str) if candidates_str else None
         if not isinstance(on, list):
             raise ValueError("The 'on' argument should be a list.")
     except (ValueError, SyntaxError) as e:
@@ -57,13 +60,15 @@ def main():
     ranker = DocumentRanker(documents, key=key, on=on)
 
     if method == "encoder":
-        results = ranker.rank_encoder(queries)
+        results = ranker.rank_encoder(queries, candidates=candidates)
     elif method == "dpr":
-        results = ranker.rank_dpr(queries)
+        results = ranker.rank_dpr(queries, candidates=candidates)
     elif method == "cross_encoder":
-        results = ranker.rank_cross_encoder(queries)
+        results = ranker.rank_cross_encoder(queries, candidates=candidates)
+    elif method == "cross_encoder_cascade":
+        results = ranker.rank_cross_encoder(queries, cascade=True, candidates=candidates)
     elif method == "embedding":
-        results = ranker.rank_embedding(queries)
+        results = ranker.rank_embedding(queries, candidates=candidates)
     else:
         print(f"Unknown method: {method}")
         sys.exit(1)
@@ -2,59 +2,158 @@
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning, message="`clean_up_tokenization_spaces` was not set")
 
-from cherche import retrieve, rank
-from sentence_transformers import SentenceTransformer, CrossEncoder
+import os
+import sys
+import json
+import hashlib
+from cherche import retrieve
 import numpy as np
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from documentretriever.retrievers.embedding_cache import cached_encoder
+from documentretriever.retrievers.inference import load_sentence_transformer, load_cross_encoder, model_key
+from reranker import CrossEncoderReranker
+
+ENCODER_MODEL = "sentence-transformers/all-mpnet-base-v2"
+DPR_QUERY_MODEL = 'facebook-dpr-question_encoder-single-nq-base'
+
+# First-stage TF-IDF index shared by every ranker over the same corpus, keyed by corpus fingerprint
+_tfidf_indexes = {}
+
+def corpus_fingerprint(documents, key, on):
+    """Hash of the identifiers and indexed fields of a corpus."""
+    digest = hashlib.sha1(json.dumps([key, on]).encode("utf-8"))
+    for doc in documents:
+        digest.update(json.dumps([doc.get(key)] + [doc.get(field, "") for field in on], default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+def shared_tfidf(documents, key, on):
+    """Return the TF-IDF retriever for this corpus, building it only the first time it is requested."""
+    fingerprint = corpus_fingerprint(documents, key, on)
+    if fingerprint not in _tfidf_indexes:
+        _tfidf_indexes.clear()  # Only the latest version of a corpus is worth keeping
+        _tfidf_indexes[fingerprint] = retrieve.TfIdf(key=key, on=on, documents=documents)
+    return _tfidf_indexes[fingerprint]
+
 class DocumentRanker:
-    def __init__(self, documents, key="id", on=["title", "article"]):
+    def __init__(self, documents, key="id", on=["title", "article"], retriever=None, backend=None):
+        """
+        Second-stage ranker over candidates produced by a first-stage retriever.
+
+        :param documents: Corpus the candidates refer to.
+        :param key: Document identifier field.
+        :param on: Fields used as the document text.
+        :param retriever: Optional first-stage handle, e.g. a retriever from documentretriever.retrievers
+            (anything with retrieve(queries, k=...) or callable as retriever(queries, k=...)). Without one,
+            and without explicit candidates, a TF-IDF index shared by all rankers over this corpus is used.
+        :param backend: CPU inference backend for all four models ("torch", "int8" or "onnx"; see inference.py).
+        """
         self.documents = documents
         self.key = key
         self.on = on
-        self.retriever = retrieve.TfIdf(key=self.key, on=self.on, documents=documents)
-        self.encoder = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
-        self.dpr_encoder = SentenceTransformer('facebook-dpr-ctx_encoder-single-nq-base')
-        self.dpr_query_encoder = SentenceTransformer('facebook-dpr-question_encoder-single-nq-base')
-        self.cross_encoder = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
-
-    def rank_encoder(self, queries):
-        embeddings_documents = self.encoder.encode([doc["article"] for doc in self.documents])
-        embeddings_queries = self.encoder.encode(queries)
-        self.retriever += self.documents
-        ranker = rank.Embedding(key=self.key, normalize=True)
-        ranker = ranker.add(documents=self.documents, embeddings_documents=embeddings_documents)
-        match = self.retriever(queries, k=100)
-        results = ranker(q=embeddings_queries, documents=match, k=30)
-        return results
+        # Resolved once: fingerprinting the corpus is O(corpus), too much to repeat on every rank call
+        self.first_stage = retriever if retriever is not None else shared_tfidf(documents, key, on)
+        self.documents_by_key = {doc[key]: doc for doc in documents}
+        self.encoder = load_sentence_transformer(ENCODER_MODEL, backend=backend)
+        self.dpr_encoder = load_sentence_transformer('facebook-dpr-ctx_encoder-single-nq-base', backend=backend)
+        self.dpr_query_encoder = load_sentence_transformer(DPR_QUERY_MODEL, backend=backend)
+        self.cross_encoder = load_cross_encoder("cross-encoder/ms-marco-MiniLM-L-6-v2", backend=backend)
+        # Query embeddings are shared with documentretriever through the persistent cache
+        self.encode_queries = cached_encoder(model_key(ENCODER_MODEL, backend), self.encoder.encode)
+        self.encode_dpr_queries = cached_encoder(model_key(DPR_QUERY_MODEL, backend), self.dpr_query_encoder.encode)
+        # Kept on the instance so pair scores are reused across calls
+        self.reranker = CrossEncoderReranker(self.cross_encoder.predict, on=self.on, key=self.key)
+        # Document embeddings are computed only for documents that show up as candidates, then reused
+        self.document_embeddings = {"encoder": {}, "dpr": {}, "embedding": {}}
 
-    def rank_dpr(self, queries):
-        ranker = rank.DPR(
-            key=self.key,
-            on=self.on,
-            encoder=self.dpr_encoder.encode,
-            query_encoder=self.dpr_query_encoder.encode,
-            normalize=True
-        )
-        ranker.add(self.documents, batch_size=64)
-        match = self.retriever(queries, k=100)
-        results = ranker(queries, documents=match, k=30)
-        return results
+    @property
+    def retriever(self):
+        """The first-stage retriever: the handle given at construction or the shared TF-IDF index."""
+        return self.first_stage
 
-    def rank_cross_encoder(self, queries):
-        self.retriever += self.documents
-        ranker = rank.CrossEncoder(
-            on=self.on,
-            encoder=self.cross_encoder.predict
-        )
-        match = self.retriever(queries, k=100)
-        results = ranker(queries, documents=match, k=30)
-        return results
+    def _hydrate(self, matches):
+        """Turn ids or {key, similarity} results into full documents, keeping the first-stage similarity."""
+        documents = []
+        for match in matches:
+            doc_id = match[self.key] if isinstance(match, dict) else match
+            if doc_id not in self.documents_by_key:
+                continue
+            document = dict(self.documents_by_key[doc_id])
+            if isinstance(match, dict) and "similarity" in match:
+                document["similarity"] = match["similarity"]
+            documents.append(document)
+        return documents
+
+    def candidates(self, queries, candidates=None, k=100):
+        """
+        First-stage candidates for each query as full documents.
 
-    def rank_embedding(self, queries):
-        embeddings_documents = self.encoder.encode([doc["article"] for doc in self.documents])
-        embeddings_queries = self.encoder.encode(queries)
-        ranker = rank.Embedding(key=self.key, normalize=True)
-        ranker = ranker.add(documents=self.documents, embeddings_documents=embeddings_documents)
-        match = self.retriever(queries, k=100)
-        results = ranker(q=embeddings_queries, documents=match, k=30)
+        :param candidates: Optional candidate ids (or retriever results) per query; the first stage is skipped.
+        :param k: Number of candidates to pull from the first stage when candidates are not given.
+        """
+        query_list = [queries] if isinstance(queries, str) else queries
+        if candidates is None:
+            first_stage = self.retriever
+            search = first_stage.retrieve if hasattr(first_stage, "retrieve") else first_stage
+            candidates = search(query_list, k=k)
+        elif isinstance(queries, str):
+            candidates = [candidates]
+        # Some retrievers return a flat list for a single query
+        if len(query_list) == 1 and candidates and not isinstance(candidates[0], list):
+            candidates = [candidates]
+        return [self._hydrate(matches) for matches in candidates]
+
+    def _text(self, document):
+        return " ".join(str(document.get(field, "")) for field in self.on)
+
+    def _rank_dense(self, queries, candidates, k, query_embeddings, model_name, encode, text=None):
+        """
+        Cosine similarity between each query and only its candidates, encoding unseen candidates once.
+
+        :param text: Document text to embed (default: the self.on fields joined); model_name keys its cache.
+        """
+        cache = self.document_embeddings[model_name]
+        text = text or self._text
+        missing = list({doc[self.key]: doc for matches in candidates for doc in matches
+                        if doc[self.key] not in cache}.values())
+        if missing:
+            for doc, embedding in zip(missing, encode([text(doc) for doc in missing])):
+                cache[doc[self.key]] = embedding / (np.linalg.norm(embedding) or 1.0)
+
+        query_embeddings = np.atleast_2d(query_embeddings)
+        query_embeddings = query_embeddings / np.maximum(np.linalg.norm(query_embeddings, axis=1, keepdims=True), 1e-12)
+        results = []
+        for query_embedding, matches in zip(query_embeddings, candidates):
+            if not matches:
+                results.append([])
+                continue
+            scores = np.stack([cache[doc[self.key]] for doc in matches]) @ query_embedding
+            order = np.argsort(-scores)[:k]
+            results.append([{**matches[i], "similarity": float(scores[i])} for i in order])
         return results
+
+    def _shape(self, queries, results):
+        return results[0] if isinstance(queries, str) else results
+
+    def rank_encoder(self, queries, candidates=None, k=30, first_stage_k=100):
+        candidates = self.candidates(queries, candidates, k=first_stage_k)
+        results = self._rank_dense(queries, candidates, k, self.encode_queries(queries), "encoder", self.encoder.encode)
+        return self._shape(queries, results)
+
+    def rank_dpr(self, queries, candidates=None, k=30, first_stage_k=100):
+        candidates = self.candidates(queries, candidates, k=first_stage_k)
+        results = self._rank_dense(queries, candidates, k, self.encode_dpr_queries(queries), "dpr", self.dpr_encoder.encode)
+        return self._shape(queries, results)
+
+    def rank_cross_encoder(self, queries, cascade=False, candidates=None, k=30, first_stage_k=100):
+        candidates = self.candidates(queries, candidates, k=first_stage_k)
+        query_list = [queries] if isinstance(queries, str) else queries
+        results = self.reranker.rerank(query_list, candidates, k=k, cascade=cascade)
+        return self._shape(queries, results)
+
+    def rank_embedding(self, queries, candidates=None, k=30, first_stage_k=100):
+        """Like rank_encoder, but documents are embedded from their article field alone, as this ranking always was."""
+        candidates = self.candidates(queries, candidates, k=first_stage_k)
+        results = self._rank_dense(queries, candidates, k, self.encode_queries(queries), "embedding",
+                                   self.encoder.encode, text=lambda doc: str(doc.get("article", "")))
+        return self._shape(queries, results)
@@ -0,0 +1,122 @@
+# reranker.py
+import hashlib
+from collections import OrderedDict
+
+class CrossEncoderReranker:
+    def __init__(self, predict, on, key="id", batch_size=64, cache_size=100000):
+        """
+        Cross-encoder reranking with batching across queries, a pair score cache and an optional cascade.
+
+        :param predict: Scoring function taking a list of [query, passage] pairs, e.g. CrossEncoder.predict.
+        :param on: Document fields concatenated into the passage.
+        :param key: Document identifier field.
+        :param batch_size: Number of pairs per predict call.
+        :param cache_size: Maximum number of pair scores kept, keyed by a hash of the query and passage text.
+        """
+        self.predict = predict
+        self.on = on if isinstance(on, list) else [on]
+        self.key = key
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def _passage(self, document):
+        return " ".join(str(document.get(field, "")) for field in self.on)
+
+    @staticmethod
+    def _pair_key(query, passage):
+        return hashlib.sha1(f"{query}\x1f{passage}".encode("utf-8")).digest()
+
+    def score_pairs(self, pairs):
+        """Score (query, passage) pairs, sending only pairs that are not cached to the model, in batches."""
+        keys = [self._pair_key(query, passage) for query, passage in pairs]
+        missing = OrderedDict()
+        for pair_key, pair in zip(keys, pairs):
+            if pair_key in self.cache:
+                self.cache.move_to_end(pair_key)
+            else:
+                missing.setdefault(pair_key, pair)
+        if missing:
+            missing_keys, missing_pairs = list(missing), [list(pair) for pair in missing.values()]
+            for start in range(0, len(missing_pairs), self.batch_size):
+                batch_scores = self.predict(missing_pairs[start:start + self.batch_size])
+                for pair_key, score in zip(missing_keys[start:start + self.batch_size], batch_scores):
+                    self.cache[pair_key] = float(score)
+        scores = [self.cache[pair_key] for pair_key in keys]
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return scores
+
+    def _score_depths(self, queries, candidates, depths, scored):
+        """Score candidates[i][:depths[i]] for every query in one batched pass; scored[i] maps position -> score."""
+        positions, pairs = [], []
+        for i, (query, documents) in enumerate(zip(queries, candidates)):
+            for position in range(len(scored[i]), depths[i]):
+                positions.append((i, position))
+                pairs.append((query, self._passage(documents[position])))
+        for (i, position), score in zip(positions, self.score_pairs(pairs)):
+            scored[i][position] = score
+
+    def _top(self, documents, scored, k):
+        ranked = sorted(scored.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [{**documents[position], "similarity": score} for position, score in ranked]
+
+    @staticmethod
+    def _initial_depth(scores, k, min_depth, max_depth):
+        """Cut the first-stage list at its largest score gap between min_depth and max_depth."""
+        if len(scores) <= min_depth:
+            return len(scores)
+        best_depth, best_gap = min_depth, 0.0
+        for depth in range(min_depth, min(max_depth, len(scores))):
+            gap = scores[depth - 1] - scores[depth]
+            if gap > best_gap:
+                best_depth, best_gap = depth, gap
+        return max(best_depth, min(k, len(scores)))
+
+    def rerank(self, queries, candidates, k=30, cascade=False, min_depth=None, max_depth=None, step=None):
+        """
+        Rerank first-stage candidates for each query and return the top k with cross-encoder similarities.
+
+        :param queries: A query string or list of query strings.
+        :param candidates: For each query, the first-stage documents (with `on` fields and "similarity"), best first.
+        :param k: Number of results per query.
+        :param cascade: Only rerank the head of each candidate list. The head starts at the largest first-stage
+            score gap between min_depth and max_depth and grows by `step` until the top k stops changing.
+        """
+        single = isinstance(queries, str)
+        if single:
+            queries, candidates = [queries], [candidates]
+        candidates = [sorted(documents, key=lambda document: document.get("similarity", 0.0), reverse=True)
+                      for documents in candidates]
+        scored = [{} for _ in queries]
+
+        if not cascade:
+            self._score_depths(queries, candidates, [len(documents) for documents in candidates], scored)
+            results = [self._top(documents, scores, k) for documents, scores in zip(candidates, scored)]
+            return results[0] if single else results
+
+        min_depth = min_depth or max(k, 10)
+        step = step or max(k // 2, 5)
+        depths = []
+        for documents in candidates:
+            limit = min(max_depth or len(documents), len(documents))
+            first_stage = [document.get("similarity", 0.0) for document in documents]
+            depths.append(min(self._initial_depth(first_stage, k, min_depth, limit), limit))
+
+        active = list(range(len(queries)))
+        previous_top = [None] * len(queries)
+        while active:
+            self._score_depths(queries, candidates, depths, scored)
+            still_active = []
+            for i in active:
+                top = [document[self.key] for document in self._top(candidates[i], scored[i], k)]
+                limit = min(max_depth or len(candidates[i]), len(candidates[i]))
+                if top != previous_top[i] and depths[i] < limit:
+                    previous_top[i] = top
+                    depths[i] = min(depths[i] + step, limit)
+                    still_active.append(i)
+            active = still_active
+            depths = [depths[i] if i in active else len(scored[i]) for i in range(len(queries))]
+
+        results = [self._top(documents, scores, k) for documents, scores in zip(candidates, scored)]
+        return results[0] if single else results
@@ -40,7 +40,7 @@ def run_main(method, queries, documents, key, on):
 
 if __name__ == "__main__":
     # Example usage
-    method = "encoder"  # or "dpr", "cross_encoder", "embedding"
+    method = "encoder"  # or "dpr", "cross_encoder", "cross_encoder_cascade", "embedding"
     queries = ["paris", "art", "fashion"]
     documents = [
         {"id": 0, "article": "Paris is the capital and most populous city of France", "title": "Paris", "url": "https://en.wikipedia.org/wiki/Paris"},
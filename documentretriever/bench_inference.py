@@ -0,0 +1,60 @@
+import json
+import time
+import random
+import argparse
+import logging
+from retrievers.inference import INFERENCE_BACKENDS, load_sentence_transformer, parity_check
+
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def load_texts(processed_docs_path, limit, seed=0):
+    """Sample up to limit paragraph texts from an extracted_data.json file."""
+    with open(processed_docs_path, 'r') as f:
+        texts = [doc["text"] for doc in json.load(f) if doc.get("text")]
+    random.Random(seed).shuffle(texts)
+    return texts[:limit]
+
+def throughput(encode, texts, batch_size, repeat):
+    """Best texts/second over repeat runs, after one warm-up batch."""
+    encode(texts[:batch_size], batch_size=batch_size)
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encode(texts, batch_size=batch_size)
+        best = min(best, time.perf_counter() - started)
+    return len(texts) / best
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CPU inference backends for throughput and embedding/ranking parity.")
+    parser.add_argument('processed_docs_path', help="extracted_data.json produced by process.py")
+    parser.add_argument('--model', default="sentence-transformers/all-mpnet-base-v2")
+    parser.add_argument('--backends', nargs='+', choices=INFERENCE_BACKENDS, default=["int8", "onnx"])
+    parser.add_argument('--documents', type=int, default=1000, help="Number of paragraphs to encode")
+    parser.add_argument('--queries', type=int, default=100, help="Paragraphs reused as queries for the ranking parity")
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=2)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    texts = load_texts(args.processed_docs_path, args.documents + args.queries)
+    documents, queries = texts[:args.documents], texts[args.documents:]
+    reference = load_sentence_transformer(args.model, backend="torch")
+    reference_rate = throughput(reference.encode, documents, args.batch_size, args.repeat)
+
+    print(f"{args.model}: {len(documents)} documents, {len(queries)} queries")
+    print(f"{'backend':<8}{'texts/s':>10}{'speedup':>9}{'cos mean':>10}{'cos min':>9}{f'top{args.k}':>8}{'top1':>7}")
+    print(f"{'torch':<8}{reference_rate:>10.1f}{1.0:>9.2f}{1.0:>10.4f}{1.0:>9.4f}{1.0:>8.3f}{1.0:>7.3f}")
+    for backend in args.backends:
+        try:
+            model = load_sentence_transformer(args.model, backend=backend)
+        except Exception as e:
+            print(f"{backend:<8} unavailable: {e}")
+            continue
+        rate = throughput(model.encode, documents, args.batch_size, args.repeat)
+        parity = parity_check(reference.encode, model.encode, documents, queries, k=args.k)
+        print(f"{backend:<8}{rate:>10.1f}{rate / reference_rate:>9.2f}{parity['cosine_mean']:>10.4f}"
+              f"{parity['cosine_min']:>9.4f}{parity[f'top{min(args.k, len(documents))}_overlap']:>8.3f}"
+              f"{parity['top1_agreement']:>7.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import os
+import time
+import argparse
+import logging
+from collections import Counter
+from pdf_backends import BACKENDS, get_backend, pdfium
+
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def find_pdfs(folder_path, limit=None):
+    """Collect PDF paths under folder_path, optionally capped at limit files."""
+    pdfs = []
+    for root, _, files in os.walk(folder_path):
+        for file_name in sorted(files):
+            if file_name.lower().endswith('.pdf'):
+                pdfs.append(os.path.join(root, file_name))
+                if limit and len(pdfs) >= limit:
+                    return pdfs
+    return pdfs
+
+def token_f1(reference, candidate):
+    """Bag-of-words F1 between two texts; 1.0 means the same words regardless of order and spacing."""
+    reference_tokens, candidate_tokens = Counter(reference.split()), Counter(candidate.split())
+    if not reference_tokens and not candidate_tokens:
+        return 1.0
+    common = sum((reference_tokens & candidate_tokens).values())
+    if common == 0:
+        return 0.0
+    precision = common / sum(candidate_tokens.values())
+    recall = common / sum(reference_tokens.values())
+    return 2 * precision * recall / (precision + recall)
+
+def run_backend(backend, pdfs):
+    """Extract every PDF with backend; returns (seconds, pages, {path: [page texts]})."""
+    texts = {}
+    pages = 0
+    started = time.perf_counter()
+    for path in pdfs:
+        try:
+            texts[path] = [text for _, text in backend.iter_pages(path)]
+            pages += len(texts[path])
+        except Exception as e:
+            logging.warning(f"{backend.name} failed on {path}: {e}")
+    return time.perf_counter() - started, pages, texts
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare PDF extraction backends for throughput and text parity.")
+    parser.add_argument('folder_path', help="Folder containing the PDF corpus")
+    parser.add_argument('--limit', type=int, default=None, help="Maximum number of PDFs to benchmark")
+    parser.add_argument('--reference', default="pdfplumber", choices=sorted(BACKENDS), help="Backend that defines parity 1.0")
+    args = parser.parse_args()
+    if args.reference != "pdfplumber" and pdfium is None:
+        parser.error(f"--reference {args.reference} needs pypdfium2 (pip install pypdfium2); use --reference pdfplumber")
+
+    pdfs = find_pdfs(args.folder_path, args.limit)
+    if not pdfs:
+        print(f"No PDF files found in {args.folder_path}")
+        return
+
+    names = [name for name in BACKENDS if pdfium is not None or name == "pdfplumber"]
+    runs = {name: run_backend(get_backend(name), pdfs) for name in names}
+    _, _, reference_texts = runs[args.reference]
+
+    print(f"{len(pdfs)} PDF files; parity is bag-of-words F1 per page against {args.reference}")
+    print(f"{'backend':<12}{'seconds':>10}{'pages':>8}{'pages/s':>10}{'speedup':>9}{'parity':>8}{'min':>8}")
+    reference_seconds = runs[args.reference][0]
+    for name, (seconds, pages, texts) in runs.items():
+        scores = [token_f1(reference_page, page)
+                  for path, reference_pages in reference_texts.items() if path in texts
+                  for reference_page, page in zip(reference_pages, texts[path])]
+        mean_parity = sum(scores) / len(scores) if scores else float('nan')
+        min_parity = min(scores) if scores else float('nan')
+        print(f"{name:<12}{seconds:>10.2f}{pages:>8}{pages / seconds if seconds else 0:>10.1f}"
+              f"{reference_seconds / seconds if seconds else 0:>9.1f}{mean_parity:>8.3f}{min_parity:>8.3f}")
+
+if __name__ == "__main__":
+    main()
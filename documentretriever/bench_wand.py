@@ -0,0 +1,52 @@
+import json
+import time
+import random
+import argparse
+import logging
+from retrievers.wand import TopKIndex, check_exactness
+
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def load_documents(processed_docs_path):
+    """Paragraph records with text from an extracted_data.json file, keyed by their position."""
+    with open(processed_docs_path, 'r') as f:
+        return [{"_row": row, "text": doc["text"]} for row, doc in enumerate(json.load(f)) if doc.get("text")]
+
+def timed(search, weights, k, repeat):
+    """Best seconds over repeat runs of search over every query."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for query_weights in weights:
+            search(query_weights, k)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pruned and exhaustive top-k BM25/TF-IDF for speed and exactness.")
+    parser.add_argument('processed_docs_path', help="extracted_data.json produced by process.py")
+    parser.add_argument('--scoring', nargs='+', choices=["bm25", "tfidf"], default=["bm25", "tfidf"])
+    parser.add_argument('--queries', type=int, default=200, help="Paragraphs reused as queries")
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    documents = load_documents(args.processed_docs_path)
+    queries = [doc["text"] for doc in random.Random(0).sample(documents, min(args.queries, len(documents)))]
+
+    print(f"{len(documents)} documents, {len(queries)} queries")
+    print(f"{'scoring':<8}{'k':>4}{'pruned s':>10}{'full s':>9}{'speedup':>9}{'scored %':>10}{'mismatch':>10}")
+    for scoring in args.scoring:
+        index = TopKIndex(documents, key="_row", on=["text"], scoring=scoring)
+        weights = [index.query_weights(query) for query in queries]
+        for k in args.k:
+            index.stats = {"postings_scored": 0, "postings_total": 0}
+            pruned = timed(index.top_k, weights, k, args.repeat)
+            scored = index.stats["postings_scored"] / max(index.stats["postings_total"], 1)
+            exhaustive = timed(index.score_all, weights, k, args.repeat)
+            mismatches = len(check_exactness(index, queries, k=k))
+            print(f"{scoring:<8}{k:>4}{pruned:>10.3f}{exhaustive:>9.3f}{exhaustive / pruned:>9.2f}"
+                  f"{100 * scored:>10.1f}{mismatches:>10}")
+
+if __name__ == "__main__":
+    main()
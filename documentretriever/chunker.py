@@ -0,0 +1,162 @@
+import re
+
+# Lines that look like clause/section headings, e.g. "4.2 Payment Terms", "(a) Scope", "GENERAL CONDITIONS"
+HEADING_RE = re.compile(
+    r'^\s*(?:'
+    r'(?:\d+(?:\.\d+)*\.?|[A-Z]\.|\([a-zA-Z0-9]{1,4}\))\s+\S.{0,120}'
+    r'|[A-Z][A-Z0-9 ,&/()\-]{3,80}'
+    r')$'
+)
+
+# Sentence boundary: terminal punctuation followed by whitespace and an upper-case/numeric start
+SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+(?=["\'(\[]?[A-Z0-9])')
+
+# Abbreviations that commonly end in a period without ending the sentence
+ABBREVIATIONS = {"e.g.", "i.e.", "etc.", "no.", "nos.", "cl.", "para.", "art.", "sec.", "fig.", "vol.",
+                 "approx.", "incl.", "ltd.", "co.", "inc.", "mr.", "mrs.", "ms.", "dr.", "st.", "vs."}
+
+WORD_RE = re.compile(r'\S+')
+
+
+def whitespace_token_count(text):
+    """Approximate token count using whitespace-separated words."""
+    return len(text.split())
+
+
+def make_token_counter(tokenizer_name):
+    """Build a token counter backed by a Hugging Face tokenizer."""
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+
+    def count(text):
+        return len(tokenizer.tokenize(text))
+    return count
+
+
+def _trimmed_span(text, start, end):
+    """Shrink a span so it does not start or end on whitespace."""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _split_sentences(text, start, end):
+    """Split text[start:end] into sentence spans."""
+    spans = []
+    sentence_start = start
+    for match in SENTENCE_END_RE.finditer(text, start, end):
+        last_word = text[sentence_start:match.start()].rsplit(None, 1)
+        if last_word and last_word[-1].lower() in ABBREVIATIONS:
+            continue
+        spans.append(_trimmed_span(text, sentence_start, match.start()))
+        sentence_start = match.end()
+    spans.append(_trimmed_span(text, sentence_start, end))
+    return [span for span in spans if span[0] < span[1]]
+
+
+def segment(text):
+    """
+    Segment text into units as (start, end, is_heading) spans.
+
+    Blank lines close a block, heading lines become units of their own and
+    every other block is split into sentences.
+    """
+    units = []
+    block_start = block_end = None
+
+    def flush_block():
+        if block_start is not None:
+            units.extend((s, e, False) for s, e in _split_sentences(text, block_start, block_end))
+
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        line_start, line_end = offset, offset + len(line.rstrip('\r\n'))
+        offset += len(line)
+        stripped = text[line_start:line_end].strip()
+        if not stripped:
+            flush_block()
+            block_start = block_end = None
+        elif HEADING_RE.match(stripped) and len(stripped.split()) <= 16:
+            flush_block()
+            block_start = block_end = None
+            units.append((*_trimmed_span(text, line_start, line_end), True))
+        else:
+            if block_start is None:
+                block_start = line_start
+            block_end = line_end
+    flush_block()
+    return units
+
+
+def _split_long_unit(text, start, end, max_tokens, count_tokens):
+    """Break a unit that exceeds the budget into word windows of at most max_tokens."""
+    pieces = []
+    piece_start = piece_end = None
+    piece_tokens = 0
+    for word in WORD_RE.finditer(text, start, end):
+        word_tokens = count_tokens(word.group())
+        if piece_start is not None and piece_tokens + word_tokens > max_tokens:
+            pieces.append((piece_start, piece_end, piece_tokens))
+            piece_start, piece_tokens = None, 0
+        if piece_start is None:
+            piece_start = word.start()
+        piece_end = word.end()
+        piece_tokens += word_tokens
+    if piece_start is not None:
+        pieces.append((piece_start, piece_end, piece_tokens))
+    return pieces
+
+
+def chunk_text(text, max_tokens=200, overlap=20, count_tokens=whitespace_token_count):
+    """
+    Split text into chunks of at most max_tokens tokens.
+
+    Chunks are built from whole sentences where possible, start a new chunk at
+    every heading and repeat up to `overlap` tokens of trailing sentences from
+    the previous chunk. Each chunk is returned as a dictionary with the
+    whitespace-normalised "text" and the "start"/"end" character offsets of the
+    chunk in the source text.
+    """
+    if max_tokens <= 0:
+        raise ValueError("max_tokens must be positive")
+    overlap = max(0, min(overlap, max_tokens // 2))
+
+    units = []
+    for start, end, is_heading in segment(text):
+        tokens = count_tokens(text[start:end])
+        if tokens > max_tokens:
+            units.extend((s, e, t, False) for s, e, t in _split_long_unit(text, start, end, max_tokens, count_tokens))
+        else:
+            units.append((start, end, tokens, is_heading))
+
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    def emit():
+        start, end = current[0][0], current[-1][1]
+        chunks.append({"text": " ".join(text[start:end].split()), "start": start, "end": end})
+
+    for unit in units:
+        _, _, tokens, is_heading = unit
+        if current and is_heading:
+            emit()
+            current, current_tokens = [], 0
+        elif current and current_tokens + tokens > max_tokens:
+            emit()
+            carried, carried_tokens = [], 0
+            for previous in reversed(current):
+                if carried_tokens + previous[2] > overlap:
+                    break
+                carried.insert(0, previous)
+                carried_tokens += previous[2]
+            if carried_tokens + tokens > max_tokens:
+                carried, carried_tokens = [], 0
+            current, current_tokens = carried, carried_tokens
+        current.append(unit)
+        current_tokens += tokens
+    if current:
+        emit()
+    return chunks
@@ -0,0 +1,103 @@
+import hashlib
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+# Mersenne prime used for the universal hash family; keeps (a * x + b) within uint64 for 32-bit x
+MERSENNE_PRIME = (1 << 31) - 1
+OCCURRENCE_FIELDS = ("source", "folder", "doc_type", "modified", "page", "unit", "start", "end")
+
+NON_WORD_RE = re.compile(r'[\W_]+')
+
+
+def normalize_for_dedup(text):
+    """Lower-case text and collapse punctuation and whitespace so formatting differences do not matter."""
+    return NON_WORD_RE.sub(' ', text.lower()).strip()
+
+
+class NearDuplicateIndex:
+    def __init__(self, threshold=0.9, num_perm=64, bands=16, shingle_size=5, seed=1):
+        """
+        Incremental MinHash/LSH index for detecting near-duplicate paragraphs.
+
+        :param threshold: Minimum estimated Jaccard similarity of word shingles to treat two texts as duplicates.
+        :param num_perm: Number of MinHash permutations per signature.
+        :param bands: Number of LSH bands; num_perm must be divisible by it.
+        :param shingle_size: Number of words per shingle.
+        :param seed: Seed for the hash permutations, fixed so signatures are stable across runs.
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._exact = {}
+        self._signatures = {}
+        self._buckets = defaultdict(list)
+
+    def _shingles(self, normalized):
+        words = normalized.split()
+        if len(words) <= self.shingle_size:
+            return {normalized}
+        return {' '.join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def signature(self, normalized):
+        """Compute the MinHash signature of normalised text."""
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in self._shingles(normalized)), dtype=np.uint64)
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % MERSENNE_PRIME
+        return permuted.min(axis=1)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def find_or_add(self, key, text):
+        """
+        Return the key of an already indexed near-duplicate of text.
+
+        If there is none, text is indexed under key and None is returned.
+        """
+        normalized = normalize_for_dedup(text)
+        digest = hashlib.sha1(normalized.encode('utf-8')).digest()
+        if digest in self._exact:
+            return self._exact[digest]
+
+        signature = self.signature(normalized)
+        best_key, best_score = None, self.threshold
+        seen = set()
+        for band_key in self._band_keys(signature):
+            for candidate in self._buckets.get(band_key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                score = float(np.mean(self._signatures[candidate] == signature))
+                if score >= best_score:
+                    best_key, best_score = candidate, score
+        if best_key is not None:
+            self._exact[digest] = best_key
+            return best_key
+
+        self._exact[digest] = key
+        self._signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self._buckets[band_key].append(key)
+        return None
+
+
+def occurrence_of(record):
+    """Return the location fields of a paragraph record."""
+    return {field: record[field] for field in OCCURRENCE_FIELDS if field in record}
+
+
+def merge_occurrence(canonical, record):
+    """Record that `record` is a near-duplicate of `canonical`."""
+    if "occurrences" not in canonical:
+        canonical["occurrences"] = [occurrence_of(canonical)]
+    canonical["occurrences"].append(occurrence_of(record))
@@ -0,0 +1,180 @@
+import itertools
+import logging
+import os
+import resource
+import pdfplumber
+
+try:
+    import pypdfium2 as pdfium
+    import pypdfium2.raw as pdfium_c
+except ImportError:  # Optional fast path; pdfplumber is used for everything without it
+    pdfium = None
+    pdfium_c = None
+
+# Pages with more vector paths than this usually carry ruled tables or forms that need layout analysis
+LAYOUT_PATH_THRESHOLD = 40
+# Share of unusable characters (replacement/private-use) above which the text layer is treated as unreliable
+GARBLED_CHAR_RATIO = 0.05
+# Backend to continue with when a file exceeds its memory ceiling; pdfium keeps no per-page state
+LIGHTER_BACKEND = {"auto": "pdfium", "pdfplumber": "pdfium"}
+
+
+def release_page(page):
+    """Drop the parsed objects and layout pdfplumber caches on a page (the PDF object keeps every page alive)."""
+    if hasattr(page, "close"):
+        page.close()  # pdfplumber >= 0.10
+    else:
+        page.flush_cache()
+
+
+class PdfplumberBackend:
+    """Layout-aware extraction with pdfplumber; slow but handles tables and multi-column pages."""
+    name = "pdfplumber"
+
+    def iter_pages(self, file_path, start=0):
+        """Yield (page_number, text) for every page of the PDF from page index start, releasing each page after use."""
+        with pdfplumber.open(file_path) as pdf:
+            for index in range(start, len(pdf.pages)):
+                page = pdf.pages[index]
+                try:
+                    text = page.extract_text() or ""
+                finally:
+                    release_page(page)
+                yield index + 1, text
+
+
+class PdfiumBackend:
+    """Plain text-layer extraction with pypdfium2 (PDFium); an order of magnitude faster than pdfplumber."""
+    name = "pdfium"
+
+    def __init__(self):
+        if pdfium is None:
+            raise ImportError("pypdfium2 is required for the pdfium backend: pip install pypdfium2")
+
+    @staticmethod
+    def page_text(page):
+        textpage = page.get_textpage()
+        try:
+            return textpage.get_text_range().replace('\r\n', '\n')
+        finally:
+            textpage.close()
+
+    def iter_pages(self, file_path, start=0):
+        """Yield (page_number, text) for every page of the PDF from page index start."""
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            for index in range(start, len(pdf)):
+                page = pdf[index]
+                try:
+                    yield index + 1, self.page_text(page)
+                finally:
+                    page.close()
+        finally:
+            pdf.close()
+
+
+def is_garbled(text):
+    """Whether a text layer is mostly unusable (broken font encodings map glyphs to replacement/private-use characters)."""
+    if not text:
+        return False
+    bad = sum(1 for char in text if char == '\ufffd' or '\ue000' <= char <= '\uf8ff')
+    return bad / len(text) > GARBLED_CHAR_RATIO
+
+
+def needs_layout(page, text):
+    """Whether a page should be re-extracted with pdfplumber: ruled tables/forms or an unreliable text layer."""
+    if is_garbled(text):
+        return True
+    paths = page.get_objects(filter=(pdfium_c.FPDF_PAGEOBJ_PATH,), max_depth=1)
+    return sum(1 for _ in itertools.islice(paths, LAYOUT_PATH_THRESHOLD + 1)) > LAYOUT_PATH_THRESHOLD
+
+
+class AutoBackend:
+    """Fast pdfium text layer per page, falling back to pdfplumber only for layout-sensitive pages."""
+    name = "auto"
+
+    def __init__(self):
+        self.fast = PdfiumBackend()
+
+    def iter_pages(self, file_path, start=0):
+        """Yield (page_number, text) for every page of the PDF from page index start."""
+        pdf = pdfium.PdfDocument(file_path)
+        plumber = None
+        layout_pages = 0
+        try:
+            for index in range(start, len(pdf)):
+                page = pdf[index]
+                try:
+                    text = self.fast.page_text(page)
+                    if needs_layout(page, text):
+                        if plumber is None:
+                            plumber = pdfplumber.open(file_path)
+                        layout_page = plumber.pages[index]
+                        try:
+                            text = layout_page.extract_text() or ""
+                        finally:
+                            release_page(layout_page)
+                        layout_pages += 1
+                finally:
+                    page.close()
+                yield index + 1, text
+        finally:
+            if plumber is not None:
+                plumber.close()
+            pdf.close()
+        if layout_pages:
+            logging.info(f"Used pdfplumber for {layout_pages} layout-sensitive pages of {file_path}")
+
+
+def current_rss_mb():
+    """Resident memory of this process in MB right now (peak RSS where /proc is not available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def iter_pages_bounded(backend, file_path, max_memory_mb=None):
+    """
+    Yield (page_number, text) like backend.iter_pages, with a per-file memory ceiling.
+
+    When resident memory has grown by more than max_memory_mb since the file was opened, the backend is closed
+    (freeing its parsed pages) and the remaining pages are read with the lighter pdfium text layer. Without
+    pypdfium2, pdfplumber is reopened at the next page instead, and the ceiling applies again from there.
+    """
+    start = 0
+    while max_memory_mb and backend.name in LIGHTER_BACKEND:
+        pages = backend.iter_pages(file_path, start=start)
+        baseline = current_rss_mb()
+        for page_number, text in pages:
+            yield page_number, text
+            growth = current_rss_mb() - baseline
+            if growth > max_memory_mb:
+                pages.close()
+                break
+        else:
+            return
+        lighter = LIGHTER_BACKEND[backend.name] if pdfium is not None else "pdfplumber"
+        logging.warning(f"{file_path} grew memory by {growth:.0f} MB after {page_number} pages (ceiling "
+                        f"{max_memory_mb} MB); reading the remaining pages with {lighter}"
+                        f"{' reopened' if lighter == backend.name else ''}")
+        backend, start = BACKENDS[lighter](), page_number
+    yield from backend.iter_pages(file_path, start=start)
+
+
+BACKENDS = {
+    "auto": AutoBackend,
+    "pdfium": PdfiumBackend,
+    "pdfplumber": PdfplumberBackend,
+}
+
+
+def get_backend(name="auto"):
+    """Instantiate a PDF backend by name, falling back to pdfplumber when pypdfium2 is not installed."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown PDF backend: {name}. Choose from {sorted(BACKENDS)}")
+    if name != "pdfplumber" and pdfium is None:
+        logging.warning(f"pypdfium2 is not installed; using pdfplumber instead of the {name} backend")
+        name = "pdfplumber"
+    return BACKENDS[name]()
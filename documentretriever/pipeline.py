@@ -0,0 +1,328 @@
+import os
+import json
+import queue
+import time
+import argparse
+import logging
+import threading
+from chunker import make_token_counter, whitespace_token_count
+from dedup import NearDuplicateIndex
+from pdf_backends import get_backend
+from process import extract_file, file_metadata, iter_file_records, add_record
+from retrievers.embedding_cache import DOCUMENT_EMBEDDINGS_FILE, save_document_embeddings, text_digest
+from upload import make_destination_folder, iter_copied_files
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_EMBED_MODEL = "sentence-transformers/all-mpnet-base-v2"
+DONE = object()  # End-of-stream marker passed down every queue
+
+
+class PipelineAborted(Exception):
+    """Raised inside a stage when another stage failed, so every thread unwinds."""
+
+
+class IngestionPipeline:
+    def __init__(self, source_folder, max_tokens=200, overlap=20, count_tokens=whitespace_token_count,
+                 dedup_threshold=0.9, pdf_backend="auto", max_pdf_memory_mb=None, extract_workers=2, queue_size=8,
+                 batch_size=256, embed_model=None, embed_backend=None, index_method=None):
+        """
+        Streaming ingestion: copy -> extract -> chunk -> embed -> index as concurrent stages.
+
+        Stages are threads connected by bounded queues, so a fast stage blocks (backpressure) instead of
+        buffering the whole corpus, and embedding starts with the first batch of paragraphs instead of after
+        the last file. The result is the same extracted_data.json as upload.py + process.py; paragraph ids
+        follow copy order even with several extractor threads.
+
+        :param max_pdf_memory_mb: Per-file memory ceiling for PDFs, see process.extract_paragraphs_from_pdf. It is
+            measured on the whole process, so with several extractors it bounds their combined growth.
+        :param extract_workers: Files parsed concurrently (pdfium and the XML parsers release the GIL in C code).
+        :param queue_size: Capacity of every queue between stages, in files or batches.
+        :param batch_size: Paragraphs per embedding/indexing batch.
+        :param embed_model: Sentence-transformers model for the embed stage (None skips it); the vectors are
+            written to document_embeddings.npz next to extracted_data.json, where the embedding method of
+            retrievers.main.retrieve picks them up instead of encoding the corpus again.
+        :param index_method: A persistent method (retrievers.main.PERSISTENT_METHODS) whose index is built
+            incrementally while ingesting and saved next to extracted_data.json for retrieve() to load.
+        """
+        if index_method:
+            from retrievers.main import PERSISTENT_METHODS  # Imports the retriever libraries
+            if index_method not in PERSISTENT_METHODS:
+                raise ValueError(f"Only persistent indexes ({', '.join(PERSISTENT_METHODS)}) can be built while "
+                                 f"ingesting; {index_method} would be rebuilt on the first query anyway")
+        self.source_folder = source_folder
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.count_tokens = count_tokens
+        self.dedup = NearDuplicateIndex(threshold=dedup_threshold) if dedup_threshold else None
+        self.pdf_backend = get_backend(pdf_backend)
+        self.max_pdf_memory_mb = max_pdf_memory_mb
+        self.extract_workers = max(1, extract_workers)
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.embed_model = embed_model
+        self.embed_backend = embed_backend
+        self.index_method = index_method
+
+        self.destination_folder = None
+        self.documents = []
+        self.unsupported_files = []
+        self.duplicates = 0
+        self.retriever = None
+        self.document_embeddings = {}  # Text digest -> vector
+        self.stats = {}  # Stage -> {"busy": seconds spent working, "items": items processed}
+        self.first_indexed = None  # Seconds from start until the first batch was searchable
+        self._errors = []
+        self._abort = threading.Event()
+        self._next_sequence = 0  # Next file, in copy order, the chunk stage is waiting for
+        self._turn = threading.Condition()
+
+    def _put(self, q, item):
+        # Block while the next stage is full, but give up if any stage failed
+        while True:
+            if self._abort.is_set():
+                raise PipelineAborted()
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q):
+        while True:
+            if self._abort.is_set():
+                raise PipelineAborted()
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def _timed(self, stage, started, items=1):
+        stats = self.stats.setdefault(stage, {"busy": 0.0, "items": 0})
+        stats["busy"] += time.perf_counter() - started
+        stats["items"] += items
+
+    def _run(self, stage, target, *args):
+        def run():
+            try:
+                target(*args)
+            except PipelineAborted:
+                pass
+            except Exception as e:
+                logging.error(f"Ingestion stage {stage} failed: {e}")
+                self._errors.append((stage, e))
+                self._abort.set()
+        thread = threading.Thread(target=run, name=f"ingest-{stage}", daemon=True)
+        thread.start()
+        return thread
+
+    def _copy(self, files):
+        self.destination_folder = make_destination_folder()
+        sequence = 0
+        copied = iter_copied_files(self.source_folder, self.destination_folder)
+        while True:
+            started = time.perf_counter()
+            file_path = next(copied, None)
+            if file_path is None:
+                break
+            self._timed("copy", started)
+            self._put(files, (sequence, file_path))
+            sequence += 1
+        for _ in range(self.extract_workers):
+            self._put(files, DONE)
+
+    def _wait_turn(self, sequence):
+        # Extractors may run at most queue_size files ahead of the chunk stage, which bounds its reorder buffer
+        with self._turn:
+            while sequence >= self._next_sequence + self.queue_size:
+                if self._abort.is_set():
+                    raise PipelineAborted()
+                self._turn.wait(timeout=0.1)
+
+    def _extract(self, files, extracted):
+        while True:
+            item = self._get(files)
+            if item is DONE:
+                self._put(extracted, DONE)
+                return
+            sequence, file_path = item
+            self._wait_turn(sequence)
+            logging.info(f"Processing file: {file_path}")
+            started = time.perf_counter()
+            paragraphs = extract_file(file_path, self.pdf_backend, self.max_pdf_memory_mb)
+            if paragraphs is not None:
+                paragraphs = list(paragraphs)  # PDFs stream their pages; parse them here, in the extractor thread
+            self._timed("extract", started)
+            self._put(extracted, (sequence, file_path, paragraphs))
+
+    def _chunk(self, extracted, batches):
+        # Files finish out of order with several extractors; hold them back so ids follow copy order. At most
+        # queue_size files are pending, see _wait_turn.
+        pending, next_sequence, finished = {}, 0, 0
+        batch = []
+        while finished < self.extract_workers:
+            item = self._get(extracted)
+            if item is DONE:
+                finished += 1
+                continue
+            pending[item[0]] = item[1:]
+            while next_sequence in pending:
+                file_path, paragraphs = pending.pop(next_sequence)
+                next_sequence += 1
+                with self._turn:
+                    self._next_sequence = next_sequence
+                    self._turn.notify_all()
+                started = time.perf_counter()
+                if paragraphs is None:
+                    self.unsupported_files.append(os.path.basename(file_path))
+                    logging.warning(f"Skipping unsupported file format: {os.path.basename(file_path)}")
+                    continue
+                metadata = file_metadata(file_path, self.destination_folder)
+                for record in iter_file_records(paragraphs, metadata, self.max_tokens, self.overlap, self.count_tokens):
+                    added = add_record(self.documents, record, self.dedup)
+                    if added is None:
+                        self.duplicates += 1
+                    else:
+                        batch.append(added)
+                self._timed("chunk", started)
+                while len(batch) >= self.batch_size:
+                    self._put(batches, batch[:self.batch_size])
+                    batch = batch[self.batch_size:]
+        if batch:
+            self._put(batches, batch)
+        self._put(batches, DONE)
+
+    def _embed(self, batches, embedded):
+        if self.embed_model:
+            from retrievers.inference import load_sentence_transformer
+            model = load_sentence_transformer(self.embed_model, backend=self.embed_backend)
+        while True:
+            batch = self._get(batches)
+            if batch is DONE:
+                self._put(embedded, DONE)
+                return
+            if self.embed_model:
+                started = time.perf_counter()
+                vectors = model.encode([record["text"] for record in batch], batch_size=64)
+                self.document_embeddings.update(zip((text_digest(record["text"]) for record in batch), vectors))
+                self._timed("embed", started, len(batch))
+            self._put(embedded, batch)
+
+    def _index(self, embedded, started_at):
+        if self.index_method:
+            from retrievers.main import build_retriever
+        while True:
+            batch = self._get(embedded)
+            if batch is DONE:
+                return
+            if not self.index_method:
+                continue
+            started = time.perf_counter()
+            if self.retriever is None:
+                self.retriever = build_retriever(batch, self.index_method)
+                self.first_indexed = time.perf_counter() - started_at
+                logging.info(f"First {len(batch)} paragraphs searchable after {self.first_indexed:.1f}s")
+            else:
+                self.retriever.upsert(batch)
+            self._timed("index", started, len(batch))
+
+    def run(self):
+        """Run every stage to completion and return (documents, unsupported_files)."""
+        started_at = time.perf_counter()
+        files, extracted, batches, embedded = (queue.Queue(maxsize=self.queue_size) for _ in range(4))
+        threads = [self._run("copy", self._copy, files)]
+        threads += [self._run("extract", self._extract, files, extracted) for _ in range(self.extract_workers)]
+        threads += [self._run("chunk", self._chunk, extracted, batches),
+                    self._run("embed", self._embed, batches, embedded),
+                    self._run("index", self._index, embedded, started_at)]
+        for thread in threads:
+            thread.join()
+        if self._errors:
+            stage, error = self._errors[0]
+            raise RuntimeError(f"Ingestion stage {stage} failed") from error
+
+        elapsed = time.perf_counter() - started_at
+        if self.duplicates:
+            logging.info(f"Collapsed {self.duplicates} near-duplicate paragraphs into their canonical copies")
+        logging.info(f"Extracted a total of {len(self.documents)} paragraphs from all documents in {elapsed:.1f}s")
+        for stage, stats in self.stats.items():
+            # Extractor threads overlap, so their busy time is divided by the number of workers
+            busy = stats["busy"] / (self.extract_workers if stage == "extract" else 1)
+            logging.info(f"  {stage:<8}{busy:>8.1f}s busy ({busy / elapsed:.0%} of wall time), {stats['items']} items")
+        return self.documents, self.unsupported_files
+
+    def save(self):
+        """
+        Write extracted_data.json under <destination>/sys/temp, with document_embeddings.npz and the persistent
+        index next to it when those stages ran; returns the JSON path.
+        """
+        output_dir = os.path.join(self.destination_folder, 'sys', 'temp')
+        os.makedirs(output_dir, exist_ok=True)
+        output_file_path = os.path.join(output_dir, 'extracted_data.json')
+        with open(output_file_path, 'w') as f:
+            json.dump(self.documents, f, indent=2)
+        logging.info(f"Wrote extracted data to JSON file: {output_file_path}")
+        if self.embed_model and self.document_embeddings:
+            from retrievers.inference import model_key  # Imports sentence-transformers
+            texts = list(dict.fromkeys(doc["text"] for doc in self.documents))
+            vectors = [self.document_embeddings[text_digest(text)] for text in texts]
+            save_document_embeddings(os.path.join(output_dir, DOCUMENT_EMBEDDINGS_FILE),
+                                     model_key(self.embed_model, self.embed_backend), texts, vectors)
+        if self.retriever is not None:
+            from retrievers.main import index_file
+            self.retriever.save_index(index_file(output_dir, self.index_method))
+        return output_file_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy, extract, chunk, embed and index documents as one streaming pipeline.")
+    parser.add_argument('folder_path', type=str, help="Path to the folder containing the documents")
+    parser.add_argument('--max_tokens', type=int, default=200, help="Maximum number of tokens per chunk")
+    parser.add_argument('--overlap', type=int, default=20, help="Number of tokens repeated between consecutive chunks")
+    parser.add_argument('--tokenizer', type=str, default=None,
+                        help="Hugging Face tokenizer used to count tokens (default: whitespace words)")
+    parser.add_argument('--dedup_threshold', type=float, default=0.9,
+                        help="Estimated Jaccard similarity above which paragraphs are collapsed as near-duplicates")
+    parser.add_argument('--no_dedup', action='store_true', help="Index every copy of repeated paragraphs")
+    parser.add_argument('--pdf_backend', choices=["auto", "pdfium", "pdfplumber"], default="auto")
+    parser.add_argument('--max_pdf_memory_mb', type=int, default=1024,
+                        help="Memory one PDF may add before its remaining pages are read with pdfium (0 = no limit)")
+    parser.add_argument('--extract_workers', type=int, default=2, help="Files parsed concurrently")
+    parser.add_argument('--queue_size', type=int, default=8, help="Capacity of the queues between stages")
+    parser.add_argument('--batch_size', type=int, default=256, help="Paragraphs per embedding/indexing batch")
+    parser.add_argument('--embed_model', type=str, default=None,
+                        help="Embed paragraphs while ingesting and save them to document_embeddings.npz, which the "
+                             f"embedding retrieval method reuses (it uses {DEFAULT_EMBED_MODEL})")
+    parser.add_argument('--embed_backend', choices=["torch", "int8", "onnx"], default=None)
+    parser.add_argument('--index_method', choices=["positional"], default=None,
+                        help="Build this persistent index while ingesting and save it next to extracted_data.json")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.folder_path):
+        logging.error(f"The provided path '{args.folder_path}' is not a valid directory.")
+        print(f"Error: The provided path '{args.folder_path}' is not a valid directory.")
+        return
+
+    count_tokens = make_token_counter(args.tokenizer) if args.tokenizer else whitespace_token_count
+    pipeline = IngestionPipeline(args.folder_path, max_tokens=args.max_tokens, overlap=args.overlap,
+                                 count_tokens=count_tokens,
+                                 dedup_threshold=None if args.no_dedup else args.dedup_threshold,
+                                 pdf_backend=args.pdf_backend, max_pdf_memory_mb=args.max_pdf_memory_mb,
+                                 extract_workers=args.extract_workers,
+                                 queue_size=args.queue_size, batch_size=args.batch_size,
+                                 embed_model=args.embed_model, embed_backend=args.embed_backend,
+                                 index_method=args.index_method)
+    pipeline.run()
+    output_file_path = pipeline.save()
+
+    # Same output line as upload.py/process.py, which initial_processor.py parses
+    print(f"Files have been saved to {output_file_path}")
+    if pipeline.unsupported_files:
+        logging.warning("The following files were skipped due to unsupported format:")
+        for file in pipeline.unsupported_files:
+            logging.warning(f"  - {file}")
+        print("Warning: Some files were skipped due to unsupported format. Check the log for details.")
+
+if __name__ == "__main__":
+    main()
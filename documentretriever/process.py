@@ -2,33 +2,40 @@ import os
 import json
 import argparse
 import logging
-import pdfplumber
-from docx import Document
-from odf.opendocument import load
-from odf.text import P
+from datetime import datetime, timezone
+from chunker import chunk_text, make_token_counter, whitespace_token_count
+from dedup import NearDuplicateIndex, merge_occurrence
+from pdf_backends import get_backend, iter_pages_bounded
+from textnorm import normalize_texts
+from xml_stream import iter_paragraphs
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def extract_paragraphs_from_pdf(file_path):
-    paragraphs = []
+NORMALIZE_BATCH_SIZE = 256  # Chunks normalized per batched regex pass; bounds what a streamed PDF holds back
+
+def extract_paragraphs_from_pdf(file_path, backend=None, max_memory_mb=None):
+    """
+    Yield the text of every page as soon as it is extracted, so a 1,000-page PDF is never held in memory at once.
+
+    Past max_memory_mb of growth the rest of the file is read with a lighter parser (see iter_pages_bounded).
+    """
+    backend = backend or get_backend()
+    pages = 0
     try:
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text()
-                if text:
-                    paragraphs.extend(text.split('\n\n'))  # Assuming paragraphs are separated by double newlines
-        logging.info(f"Successfully extracted {len(paragraphs)} paragraphs from PDF: {file_path}")
+        for _, text in iter_pages_bounded(backend, file_path, max_memory_mb):
+            # Whole page; split into bounded chunks by chunk_text. Empty pages are kept so unit + 1 is the page number
+            pages += bool(text)
+            yield text
+        logging.info(f"Successfully extracted {pages} pages from PDF: {file_path}")
     except Exception as e:
         logging.error(f"Error reading .pdf file '{file_path}': {e}")
-    return paragraphs
 
 def extract_paragraphs_from_docx(file_path):
     paragraphs = []
     try:
-        doc = Document(file_path)
-        for paragraph in doc.paragraphs:
-            paragraphs.append(paragraph.text)
+        # Stream word/document.xml instead of loading the whole document model
+        paragraphs.extend(iter_paragraphs(file_path))
         logging.info(f"Successfully extracted {len(paragraphs)} paragraphs from DOCX: {file_path}")
     except Exception as e:
         logging.error(f"Error reading .docx file '{file_path}': {e}")
@@ -37,38 +44,97 @@ def extract_paragraphs_from_docx(file_path):
 def extract_paragraphs_from_odt(file_path):
     paragraphs = []
     try:
-        odt_file = load(file_path)
-        paragraphs_elements = odt_file.getElementsByType(P)
-        for paragraph in paragraphs_elements:
-            paragraphs.append(paragraph.textContent)
+        # Stream content.xml instead of building the odfpy DOM
+        paragraphs.extend(iter_paragraphs(file_path))
         logging.info(f"Successfully extracted {len(paragraphs)} paragraphs from ODT: {file_path}")
     except Exception as e:
         logging.error(f"Error reading .odt file '{file_path}': {e}")
     return paragraphs
 
-def extract_text_from_folder(folder_path):
+def file_metadata(file_path, folder_path):
+    """Metadata recorded on every paragraph of a file, used by retrieval filters."""
+    source = os.path.relpath(file_path, folder_path)
+    modified = datetime.fromtimestamp(os.path.getmtime(file_path), tz=timezone.utc)
+    return {
+        "source": source,
+        "folder": os.path.dirname(source).split(os.sep)[0] or ".",  # Top-level folder, i.e. the tender
+        "doc_type": os.path.splitext(file_path)[1].lstrip('.').lower(),
+        "modified": modified.date().isoformat(),
+    }
+
+def extract_file(file_path, pdf_backend=None, max_pdf_memory_mb=None):
+    """Paragraphs (PDF: pages, streamed) of one file, or None if its format is not supported."""
+    if file_path.endswith('.pdf'):
+        return extract_paragraphs_from_pdf(file_path, backend=pdf_backend, max_memory_mb=max_pdf_memory_mb)
+    elif file_path.endswith('.docx'):
+        return extract_paragraphs_from_docx(file_path)
+    elif file_path.endswith('.odt'):
+        return extract_paragraphs_from_odt(file_path)
+    return None
+
+def iter_file_records(paragraphs, metadata, max_tokens=200, overlap=20, count_tokens=whitespace_token_count):
+    """Chunk the paragraphs of one file into paragraph records, still without an id."""
+    pending = []  # (unit, chunk) pairs waiting for the next batched normalization pass
+    for unit, para in enumerate(paragraphs):
+        if not para:
+            continue
+        pending.extend((unit, chunk) for chunk in chunk_text(para, max_tokens=max_tokens, overlap=overlap,
+                                                             count_tokens=count_tokens))
+        if len(pending) >= NORMALIZE_BATCH_SIZE:
+            yield from chunk_records(pending, metadata)
+            pending = []
+    yield from chunk_records(pending, metadata)
+
+def chunk_records(chunks, metadata):
+    """Normalize a batch of (unit, chunk) pairs in one pass and turn them into paragraph records."""
+    # Same normalization rules as the pastcod clause cleaning
+    texts = normalize_texts([chunk["text"] for _, chunk in chunks])
+    for (unit, chunk), text in zip(chunks, texts):
+        if not text:  # Ensure that we are not adding empty paragraphs
+            continue
+        record = {"text": text, **metadata, "unit": unit, "start": chunk["start"], "end": chunk["end"]}
+        if metadata["doc_type"] == "pdf":
+            record["page"] = unit + 1
+        yield record
+
+def add_record(output, record, dedup=None):
+    """
+    Append record to output under the next paragraph id, or merge it into its near-duplicate.
+
+    Returns the record if it was added, None if it was collapsed into an earlier one.
+    """
+    canonical = dedup.find_or_add(len(output), record["text"]) if dedup else None
+    if canonical is not None:
+        merge_occurrence(output[canonical], record)
+        return None
+    record = {"id": len(output) + 1, **record}
+    output.append(record)
+    return record
+
+def extract_text_from_folder(folder_path, max_tokens=200, overlap=20, count_tokens=whitespace_token_count,
+                             dedup_threshold=0.9, pdf_backend="auto", max_pdf_memory_mb=None):
     output = []
-    paragraph_id = 1
+    pdf_backend = get_backend(pdf_backend)
     unsupported_files = []
+    duplicates = 0
+    # Near-duplicate paragraphs are stored once, with the locations of every copy in "occurrences"
+    dedup = NearDuplicateIndex(threshold=dedup_threshold) if dedup_threshold else None
     # Traverse the folder and subfolders
     for root, _, files in os.walk(folder_path):
         for file_name in files:
             file_path = os.path.join(root, file_name)
             logging.info(f"Processing file: {file_path}")
-            if file_name.endswith('.pdf'):
-                paragraphs = extract_paragraphs_from_pdf(file_path)
-            elif file_name.endswith('.docx'):
-                paragraphs = extract_paragraphs_from_docx(file_path)
-            elif file_name.endswith('.odt'):
-                paragraphs = extract_paragraphs_from_odt(file_path)
-            else:
+            paragraphs = extract_file(file_path, pdf_backend, max_pdf_memory_mb)
+            if paragraphs is None:
                 unsupported_files.append(file_name)
                 logging.warning(f"Skipping unsupported file format: {file_name}")
                 continue
-            for para in paragraphs:
-                if para:  # Ensure that we are not adding empty paragraphs
-                    output.append({"id": paragraph_id, "text": para})
-                    paragraph_id += 1
+            metadata = file_metadata(file_path, folder_path)
+            for record in iter_file_records(paragraphs, metadata, max_tokens, overlap, count_tokens):
+                if add_record(output, record, dedup) is None:
+                    duplicates += 1
+    if duplicates:
+        logging.info(f"Collapsed {duplicates} near-duplicate paragraphs into their canonical copies")
     logging.info(f"Extracted a total of {len(output)} paragraphs from all documents")
     return output, unsupported_files
 
@@ -76,6 +142,17 @@ def main():
     # Set up argument parsing
     parser = argparse.ArgumentParser(description="Extract text from documents in a specified folder.")
     parser.add_argument('folder_path', type=str, help="Path to the folder containing the documents")
+    parser.add_argument('--max_tokens', type=int, default=200, help="Maximum number of tokens per chunk")
+    parser.add_argument('--overlap', type=int, default=20, help="Number of tokens repeated between consecutive chunks")
+    parser.add_argument('--tokenizer', type=str, default=None,
+                        help="Hugging Face tokenizer used to count tokens (default: whitespace words)")
+    parser.add_argument('--dedup_threshold', type=float, default=0.9,
+                        help="Estimated Jaccard similarity above which paragraphs are collapsed as near-duplicates")
+    parser.add_argument('--no_dedup', action='store_true', help="Index every copy of repeated paragraphs")
+    parser.add_argument('--pdf_backend', choices=["auto", "pdfium", "pdfplumber"], default="auto",
+                        help="PDF text extractor; auto uses the fast text layer and pdfplumber for layout-sensitive pages")
+    parser.add_argument('--max_pdf_memory_mb', type=int, default=1024,
+                        help="Memory one PDF may add before its remaining pages are read with pdfium (0 = no limit)")
     args = parser.parse_args()
 
     # Check if the provided path is a directory
@@ -90,7 +167,12 @@ def main():
     logging.info(f"Created output directory: {output_dir}")
 
     # Process the folder and extract text
-    documents, unsupported_files = extract_text_from_folder(args.folder_path)
+    count_tokens = make_token_counter(args.tokenizer) if args.tokenizer else whitespace_token_count
+    documents, unsupported_files = extract_text_from_folder(args.folder_path, max_tokens=args.max_tokens,
+                                                            overlap=args.overlap, count_tokens=count_tokens,
+                                                            dedup_threshold=None if args.no_dedup else args.dedup_threshold,
+                                                            pdf_backend=args.pdf_backend,
+                                                            max_pdf_memory_mb=args.max_pdf_memory_mb)
 
     # Write the extracted text data to a JSON file
     output_file_path = os.path.join(output_dir, 'extracted_data.json')
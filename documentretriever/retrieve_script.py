@@ -3,46 +3,40 @@ import json
 import sys
 import logging
 import time
-import signal
 import os
 import hashlib
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
-from retrievers.main import main as retriever_main
+from retrievers.main import retrieve_from_documents
+from retrievers.deadline import Deadline, DeadlineExceeded
 
 def setup_logging():
     logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def timeout_handler(signum, frame):
-    raise TimeoutError("Function call timed out")
-
 def get_cache_key(query, method, k):
     """Generate a unique cache key based on the query, method, and k."""
     return hashlib.md5(f"{query}_{method}_{k}".encode()).hexdigest()
 
 def execute_retrieval(documents, query, method, k, timeout=300):
-    """Calls the main retrieval function with a timeout."""
-    def retrieval_wrapper():
-        return retriever_main(documents, query, method, k)
-
-    signal.signal(signal.SIGALRM, timeout_handler)
-    signal.alarm(timeout)
-
+    """Calls the retrieval function with a deadline, degrading to a cheaper method if it is at risk."""
     try:
-        with ThreadPoolExecutor() as executor:
-            future = executor.submit(retrieval_wrapper)
-            result = future.result(timeout=timeout)
+        result = retrieve_from_documents(documents, query, method, k, deadline=Deadline(timeout))
 
         logging.info(f"Retriever result type: {type(result)}")
         logging.info(f"Retriever result: {result}")
         return result
-    except TimeoutError:
+    except DeadlineExceeded:
         logging.error(f"Retrieval operation timed out after {timeout} seconds")
         raise
     except Exception as e:
-        logging.error(f"Error in retriever_main: {str(e)}")
+        logging.error(f"Error in retrieve_from_documents: {str(e)}")
         raise
-    finally:
-        signal.alarm(0)
+
+def is_degraded(similar_documents):
+    """Whether any result was produced by a fallback method or a partial index."""
+    if isinstance(similar_documents, dict):
+        return bool(similar_documents.get("degraded"))
+    if isinstance(similar_documents, list):
+        return any(is_degraded(item) for item in similar_documents)
+    return False
 
 def display_similar_documents(documents, similar_documents):
     """Displays similar documents."""
@@ -71,7 +65,7 @@ def display_similar_documents(documents, similar_documents):
         logging.error(f"Error in display_similar_documents: {str(e)}")
         raise
 
-def retrieve_documents(query, method, k, json_output_path):
+def retrieve_documents(query, method, k, json_output_path, timeout=300):
     """Retrieves documents with caching."""
     cache_key = get_cache_key(query, method, k)
     cache_dir = "retrieval_cache"
@@ -92,12 +86,15 @@ def retrieve_documents(query, method, k, json_output_path):
         logging.info(f"Loaded {len(documents)} documents from {json_output_path}")
         logging.info(f"Sample document structure: {documents[0] if documents else 'No documents'}")
         
-        similar_documents = execute_retrieval(documents, query, method, k)
+        similar_documents = execute_retrieval(documents, query, method, k, timeout=timeout)
         display_similar_documents(documents, similar_documents)
 
-        # Cache the results
-        with open(cache_file, 'w') as f:
-            json.dump(similar_documents, f)
+        # Cache the results, unless the deadline forced a degraded answer
+        if is_degraded(similar_documents):
+            logging.warning("Results are degraded; not caching them")
+        else:
+            with open(cache_file, 'w') as f:
+                json.dump(similar_documents, f)
 
         return similar_documents
 
@@ -107,7 +104,7 @@ def retrieve_documents(query, method, k, json_output_path):
     except json.JSONDecodeError:
         logging.error(f"Invalid JSON in file: {json_output_path}")
         raise
-    except TimeoutError:
+    except DeadlineExceeded:
         logging.error("The retrieval operation timed out")
         raise
     except Exception as e:
@@ -125,6 +122,7 @@ def main():
     parser.add_argument("method", choices=["bm25", "dpr", "encoder"], help="Retrieval method.")
     parser.add_argument("k", type=int, help="Number of results to retrieve.")
     parser.add_argument("json_output_path", help="Path to the JSON file with documents.")
+    parser.add_argument("--timeout", type=float, default=300, help="Deadline for the request in seconds.")
     args = parser.parse_args()
 
     if args.json_output_path.startswith("Skipping unsupported file format:"):
@@ -135,7 +133,7 @@ def main():
     try:
         start_time = time.time()
         
-        results = retrieve_documents(args.query, args.method, args.k, args.json_output_path)
+        results = retrieve_documents(args.query, args.method, args.k, args.json_output_path, timeout=args.timeout)
         print(json.dumps(results, indent=2))  # Print the results
 
         end_time = time.time()
@@ -0,0 +1,94 @@
+import time
+
+# Rough CPU cost of building each index, in seconds per document. Refined at runtime by record_index_time.
+INDEX_SECONDS_PER_DOCUMENT = {
+    "bm25": 0.00005,
+    "tfidf": 0.00005,
+    "flash": 0.00002,
+    "lunr": 0.0005,
+    "fuzz": 0.0002,
+    "positional": 0.0001,
+    "bm25_wand": 0.00005,
+    "tfidf_wand": 0.00005,
+    "embedding": 0.02,
+    "encoder": 0.02,
+    "dpr": 0.04,
+}
+
+# Cheaper method to fall back to when the requested one cannot finish before the deadline
+FALLBACK_METHODS = {
+    "dpr": "bm25",
+    "encoder": "bm25",
+    "embedding": "bm25",
+    "fuzz": "bm25",
+    "lunr": "bm25",
+}
+
+# Longest a dense index build works between two deadline checks, so a deadline is overrun by about this much at most
+CHECK_INTERVAL_SECONDS = 1.0
+
+_observed_seconds_per_document = {}
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a retrieval stage cannot produce any result before its deadline."""
+
+
+class Deadline:
+    def __init__(self, seconds):
+        """
+        A point in time by which a retrieval request should have returned.
+
+        :param seconds: Time budget from now, in seconds.
+        """
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        """Seconds left before the deadline (negative once it has passed)."""
+        return self.expires_at - time.monotonic()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def at_risk(self, estimated_seconds):
+        """Whether work estimated to take estimated_seconds would overrun the deadline."""
+        return estimated_seconds >= self.remaining()
+
+    def check(self, stage):
+        """Raise DeadlineExceeded if the deadline has passed before stage starts."""
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline of {self.seconds}s exceeded before {stage}")
+
+
+def timed_batches(count, max_batch_size, interval=CHECK_INTERVAL_SECONDS, first_batch_size=8):
+    """
+    Yield (start, end) ranges covering count items, sized so that each takes about interval seconds.
+
+    The first batch is small; later ones follow the rate measured on the previous batch (the time the caller spends
+    between two yields), capped at max_batch_size. Checking a deadline between batches then catches it within
+    about interval seconds, whatever the per-item cost.
+    """
+    start, size = 0, max(1, min(first_batch_size, max_batch_size))
+    while start < count:
+        end = min(start + size, count)
+        began = time.monotonic()
+        yield start, end
+        rate = (end - start) / max(time.monotonic() - began, 1e-6)
+        size = max(1, min(max_batch_size, int(rate * interval)))
+        start = end
+
+
+def estimate_index_seconds(method, num_documents):
+    """Estimate how long building the index for method over num_documents documents takes."""
+    per_document = _observed_seconds_per_document.get(method, INDEX_SECONDS_PER_DOCUMENT.get(method, 0.0))
+    return per_document * num_documents
+
+
+def record_index_time(method, num_documents, seconds, weight=0.3):
+    """Fold an observed index build time into the estimate used for later requests in this process."""
+    if num_documents <= 0:
+        return
+    observed = seconds / num_documents
+    previous = _observed_seconds_per_document.get(method)
+    _observed_seconds_per_document[method] = observed if previous is None else (1 - weight) * previous + weight * observed
@@ -1,9 +1,16 @@
+import logging
 from cherche import retrieve
-from sentence_transformers import SentenceTransformer
 import faiss
+from .deadline import DeadlineExceeded, timed_batches
+from .embedding_cache import cached_encoder
+from .inference import load_sentence_transformer, model_key
+from .incremental import IncrementalIndex, ROW_KEY
+from .projection import build_projection, resolve_projection
 
-class DPRRetriever:
-    def __init__(self, documents, document_model="facebook-dpr-ctx_encoder-single-nq-base", query_model="facebook-dpr-question_encoder-single-nq-base", device="cpu"):
+class DPRRetriever(IncrementalIndex):
+    def __init__(self, documents, document_model="facebook-dpr-ctx_encoder-single-nq-base", query_model="facebook-dpr-question_encoder-single-nq-base", device="cpu",
+                 deadline=None, index_batch_size=1024, key="id", on=["title", "article"], backend=None,
+                 projection_dim=None, projection=None):
         """
         Initialize the DPRRetriever with a list of documents and DPR models for both documents and queries.
         
@@ -11,36 +18,87 @@ class DPRRetriever:
         :param document_model: Name of the document encoder model from Sentence Transformers.
         :param query_model: Name of the query encoder model from Sentence Transformers.
         :param device: Device to run the models on ("cpu" or "cuda").
+        :param deadline: Optional Deadline; indexing stops early (partial index) once it expires.
+        :param index_batch_size: Most documents added to the index between deadline checks; batches are sized
+            to about CHECK_INTERVAL_SECONDS of encoding below that.
+        :param key: Document identifier field.
+        :param on: Fields embedded as the document text.
+        :param backend: CPU inference backend ("torch", "int8" or "onnx"; default from INFERENCE_BACKEND).
+        :param projection_dim: Store and search embeddings reduced to this many dimensions (default from
+            EMBEDDING_PROJECTION; None keeps full width). Recall against full-width search is logged at build time.
+        :param projection: "pca" (fitted on the corpus) or "truncate" (for Matryoshka-style models).
         """
         self.documents = documents
         self.device = device
+        self.key = key
+        self.on = on
+        self.index_batch_size = index_batch_size
         
         # Load the document and query encoders
-        self.document_encoder = SentenceTransformer(document_model, device=device)
-        self.query_encoder = SentenceTransformer(query_model, device=device)
+        self.document_encoder = load_sentence_transformer(document_model, device=device, backend=backend)
+        self.query_encoder = load_sentence_transformer(query_model, device=device, backend=backend)
         
         # Get the embedding dimension from the document encoder
-        embedding_dim = self.document_encoder.encode("Test document").shape[0]
+        self.embedding_dim = self.document_encoder.encode("Test document").shape[0]
+        self.query_encode = cached_encoder(model_key(query_model, backend), self.query_encoder.encode)
+        self.document_encode = self.document_encoder.encode
+
+        # Optionally store and search fewer dimensions: a projection fitted on a sample of the corpus, applied to
+        # documents and queries alike
+        self.projection = None
+        projection_dim, projection = resolve_projection(projection_dim, projection)
+        if projection_dim:
+            self.projection = build_projection(documents, on, self.document_encoder.encode,
+                                               self.query_encoder.encode, projection_dim, projection)
+        if self.projection is not None:
+            self.embedding_dim = self.projection.dim
+            self.document_encode = self.projection.wrap_documents(self.document_encode)
+            self.query_encode = self.projection.wrap(self.query_encode)
         
+        # Documents are indexed under an internal row number so they can be replaced and deleted later
+        self.partial = False
+        rows = self._init_incremental(documents)
+        self.retriever = self._build_index(rows, deadline=deadline)
+        self._indexed = len(rows)
+        if self.projection is not None:
+            self.projection.sample_embeddings.clear()  # Only the initial build covers the sampled documents
+
+    def _build_index(self, rows, deadline=None):
         # Create a Faiss index for storing document embeddings
-        if device == "cuda":
-            self.index = faiss.IndexFlatL2(embedding_dim)
-            self.index = faiss.index_cpu_to_gpu(faiss.StandardGpuResources(), 0, self.index)
+        if self.device == "cuda":
+            index = faiss.IndexFlatL2(self.embedding_dim)
+            index = faiss.index_cpu_to_gpu(faiss.StandardGpuResources(), 0, index)
         else:
-            self.index = faiss.IndexFlatL2(embedding_dim)
-        
-        # Initialize the retriever with the encoders and index
-        self.retriever = retrieve.DPR(
-            encoder=self.document_encoder.encode,
-            query_encoder=self.query_encoder.encode,
-            key="id",
-            on=["title", "article"],
-            index=self.index,
+            index = faiss.IndexFlatL2(self.embedding_dim)
+
+        retriever = retrieve.DPR(
+            key=ROW_KEY,
+            on=self.on,
+            encoder=self.document_encode,
+            query_encoder=self.query_encode,
+            index=index,
             normalize=True
         )
-        
-        # Add documents to the retriever
-        self.retriever = self.retriever.add(documents=documents)
+
+        # Add documents to the retriever in batches of about CHECK_INTERVAL_SECONDS of encoding (at most
+        # index_batch_size documents), stopping early if the deadline expires
+        for start, end in timed_batches(len(rows), self.index_batch_size):
+            if deadline is not None and deadline.expired():
+                if start == 0:
+                    raise DeadlineExceeded("Deadline exceeded before any document was encoded")
+                logging.warning(f"Deadline reached after indexing {start} of {len(rows)} documents")
+                self.partial = True
+                break
+            retriever = retriever.add(documents=rows[start:end])
+        return retriever
+
+    def _add_to_index(self, index, rows):
+        index.add(documents=rows)
+        return True
+
+    def _search(self, index, queries, k):
+        results = index(queries, k=k)
+        return results if results and isinstance(results[0], list) else [results]
     
     def retrieve(self, query, k=10):
         """
@@ -50,8 +108,8 @@ class DPRRetriever:
         :param k: Number of top documents to retrieve.
         :return: List of dictionaries with document IDs and their similarity scores.
         """
-        results = self.retriever(query, k=k)
-        return results
+        results = self._search_live([query] if isinstance(query, str) else query, k)
+        return results[0] if isinstance(query, str) else results
 
 ''' # Example usage
 documents = [
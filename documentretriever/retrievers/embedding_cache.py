@@ -0,0 +1,167 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Anchored at the repository root so that runner.py, retrieve_script.py and documentranker share one cache
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_CACHE_PATH = os.environ.get("QUERY_EMBEDDING_CACHE",
+                                    os.path.join(REPO_ROOT, "retrieval_cache", "query_embeddings.sqlite"))
+
+
+def normalize_query(text):
+    """Collapse whitespace so trivially different copies of a clause share a cache entry."""
+    return " ".join(text.split())
+
+
+class QueryEmbeddingCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, capacity=10000):
+        """
+        Persistent cache of query embeddings keyed by (model, normalised text).
+
+        Lookups go to an in-memory LRU first and then to an SQLite file, which is
+        shared by every process and every run that uses the same path.
+
+        :param path: SQLite file backing the cache, or None for an in-memory cache only.
+        :param capacity: Maximum number of embeddings kept in the in-memory LRU.
+        """
+        self.path = path
+        self.capacity = capacity
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+    def _db(self):
+        # SQLite connections must not be shared across fork(), so open one per process
+        if self.path is None:
+            return None
+        if self._connection is None or self._connection_pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings "
+                "(model TEXT NOT NULL, digest TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, digest))"
+            )
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    @staticmethod
+    def _digest(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
+
+    def get_many(self, model, texts):
+        """Return {normalised text: embedding} for the texts that are cached."""
+        found = {}
+        missing = []
+        with self._lock:
+            for text in texts:
+                key = (model, text)
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    found[text] = self._lru[key]
+                else:
+                    missing.append(text)
+            db = self._db()
+            if db is not None and missing:
+                digests = {self._digest(text): text for text in missing}
+                for start in range(0, len(digests), 500):
+                    batch = list(digests)[start:start + 500]
+                    rows = db.execute(
+                        f"SELECT digest, vector FROM query_embeddings WHERE model = ? AND digest IN ({','.join('?' * len(batch))})",
+                        [model, *batch],
+                    ).fetchall()
+                    for digest, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[digests[digest]] = vector
+                        self._remember((model, digests[digest]), vector)
+        return found
+
+    def put_many(self, model, texts, vectors):
+        """Store embeddings for normalised texts."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                self._remember((model, text), vector)
+            db = self._db()
+            if db is not None:
+                db.executemany(
+                    "INSERT OR REPLACE INTO query_embeddings (model, digest, vector) VALUES (?, ?, ?)",
+                    [(model, self._digest(text), vector.tobytes()) for text, vector in zip(texts, vectors)],
+                )
+                db.commit()
+
+    def encode(self, model, encode, texts, **kwargs):
+        """
+        Encode texts with encode(), reusing cached embeddings and only encoding the misses.
+
+        Mirrors SentenceTransformer.encode: a single string gives a 1-D array, a list gives a 2-D array.
+        """
+        single = isinstance(texts, str)
+        normalized = [normalize_query(text) for text in ([texts] if single else texts)]
+        found = self.get_many(model, set(normalized))
+        missing = [text for text in dict.fromkeys(normalized) if text not in found]
+        if missing:
+            logging.debug(f"Query embedding cache: {len(found)} hits, {len(missing)} misses for {model}")
+            vectors = np.asarray(encode(missing, **kwargs), dtype=np.float32)
+            self.put_many(model, missing, vectors)
+            found.update(zip(missing, vectors))
+        embeddings = np.stack([found[text] for text in normalized])
+        return embeddings[0] if single else embeddings
+
+
+_default_cache = None
+
+
+def default_cache():
+    """Process-wide cache instance backed by DEFAULT_CACHE_PATH."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = QueryEmbeddingCache()
+    return _default_cache
+
+
+# Saved next to extracted_data.json by the ingestion pipeline and picked up by retrievers.main.retrieve
+DOCUMENT_EMBEDDINGS_FILE = "document_embeddings.npz"
+
+
+def text_digest(text):
+    """Key of a document text in a document embeddings file."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def save_document_embeddings(path, model, texts, vectors):
+    """Write document embeddings keyed by text digest, so they stay valid when ids or chunk order change."""
+    np.savez(path, model=np.array(model), digests=np.array([text_digest(text) for text in texts]),
+             vectors=np.asarray(vectors, dtype=np.float32))
+    logging.info(f"Wrote {len(texts)} document embeddings for {model} to {path}")
+
+
+def load_document_embeddings(path, model):
+    """{text digest: embedding} from a file written by save_document_embeddings; empty if it is for another model."""
+    with np.load(path) as data:
+        if str(data["model"]) != model:
+            logging.warning(f"Ignoring document embeddings in {path}: computed with {data['model']}, not {model}")
+            return {}
+        return dict(zip(data["digests"].tolist(), data["vectors"]))
+
+
+def cached_encoder(model, encode, cache=None):
+    """Wrap a query encoder so that it goes through the query embedding cache."""
+    cache = cache or default_cache()
+
+    def wrapped(texts, **kwargs):
+        return cache.encode(model, encode, texts, **kwargs)
+    return wrapped
@@ -0,0 +1,132 @@
+import bisect
+import re
+from collections import defaultdict
+
+# Metadata fields written by process.py that filters can refer to; "file" is accepted as an alias of "source"
+FILTER_FIELDS = ("source", "folder", "doc_type", "page", "modified")
+FIELD_ALIASES = {"file": "source", "date": "modified", "type": "doc_type"}
+
+CLAUSE_RE = re.compile(r'^\s*(\w+)\s*(>=|<=|=)\s*(.+?)\s*$')
+
+
+def parse_filter(expression):
+    """
+    Parse a filter string such as "folder=Tender A;doc_type=pdf,docx;modified>=2024-01-01".
+
+    Clauses separated by ";" must all hold; comma-separated values in one clause are alternatives.
+    Returns the dict form accepted by FilterIndex.select: {field: [values]} or {field: {">=": v, "<=": v}}.
+    """
+    filters = {}
+    for clause in filter(None, (part.strip() for part in expression.split(';'))):
+        match = CLAUSE_RE.match(clause)
+        if not match:
+            raise ValueError(f"Invalid filter clause: {clause!r}")
+        field, operator, value = match.groups()
+        field = FIELD_ALIASES.get(field, field)
+        if operator == "=":
+            filters[field] = [v.strip() for v in value.split(',')]
+        else:
+            filters.setdefault(field, {})[operator] = value
+    return filters
+
+
+def _values(document, field):
+    """Values of field in a document and in every near-duplicate occurrence collapsed into it."""
+    values = {document.get(field)}
+    values.update(occurrence.get(field) for occurrence in document.get("occurrences", ()))
+    values.discard(None)
+    return values
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _value_range(values, condition, convert):
+    """The slice of sorted values within the >= / <= bounds of condition, bounds converted to the values' type."""
+    low = bisect.bisect_left(values, convert(condition[">="])) if ">=" in condition else 0
+    high = bisect.bisect_right(values, convert(condition["<="])) if "<=" in condition else len(values)
+    return values[low:high]
+
+
+class FilterIndex:
+    def __init__(self, documents, fields=FILTER_FIELDS):
+        """
+        Precomputed bitmaps over document metadata for restricting retrieval before any index is built.
+
+        Each (field, value) pair maps to a bitmap (a Python int, bit i = documents[i]). A document matches a value
+        if the canonical record or any of its collapsed occurrences carries it, so deduplication never hides a
+        paragraph from the tender it also appears in.
+
+        :param documents: Processed documents, in the order later passed to subset().
+        :param fields: Metadata fields to index.
+        """
+        self.size = len(documents)
+        self.bitmaps = {}
+        self.sorted_values = {}
+        for field in fields:
+            positions = defaultdict(list)
+            numbers = set()
+            for position, document in enumerate(documents):
+                for value in _values(document, field):
+                    positions[str(value)].append(position)
+                    if _is_number(value):
+                        numbers.add(value)
+            self.bitmaps[field] = {value: self._bitmap(value_positions) for value, value_positions in positions.items()}
+            # Numeric values (e.g. page) are ranged as numbers, everything else (e.g. ISO dates) as strings
+            strings = set(positions) - {str(number) for number in numbers}
+            self.sorted_values[field] = (sorted(numbers), sorted(strings))
+
+    def _bitmap(self, positions):
+        # Set bits in a byte buffer and convert once; OR-ing 1 << position into an int is quadratic
+        buffer = bytearray((self.size + 7) // 8)
+        for position in positions:
+            buffer[position >> 3] |= 1 << (position & 7)
+        return int.from_bytes(buffer, "little")
+
+    def _field_bitmap(self, field, condition):
+        field = FIELD_ALIASES.get(field, field)
+        if field not in self.bitmaps:
+            raise ValueError(f"Cannot filter on {field!r}; indexed fields are {sorted(self.bitmaps)}")
+        bitmaps, values = self.bitmaps[field], self.sorted_values[field]
+        if isinstance(condition, dict):
+            # Range over the sorted distinct values: numbers numerically, strings lexicographically (which orders
+            # ISO dates and zero-padded strings correctly)
+            numbers, strings = values
+            try:
+                selected = _value_range(numbers, condition, float)
+            except ValueError:  # A non-numeric bound only ranges over the string values
+                selected = []
+            selected = [str(number) for number in selected] + _value_range(strings, condition, str)
+        else:
+            selected = [condition] if isinstance(condition, (str, int)) else condition
+        bitmap = 0
+        for value in selected:
+            bitmap |= bitmaps.get(str(value), 0)
+        return bitmap
+
+    def select(self, filters):
+        """Bitmap of the documents matching every clause of filters (a dict or a parse_filter string)."""
+        if isinstance(filters, str):
+            filters = parse_filter(filters)
+        bitmap = (1 << self.size) - 1
+        for field, condition in filters.items():
+            bitmap &= self._field_bitmap(field, condition)
+            if not bitmap:
+                break
+        return bitmap
+
+    @staticmethod
+    def positions(bitmap):
+        """Positions of the set bits of a bitmap, in increasing order."""
+        positions = []
+        for index, byte in enumerate(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")):
+            while byte:
+                low = byte & -byte
+                positions.append(index * 8 + low.bit_length() - 1)
+                byte ^= low
+        return positions
+
+    def subset(self, documents, filters):
+        """The documents matching filters, in corpus order."""
+        return [documents[position] for position in self.positions(self.select(filters))]
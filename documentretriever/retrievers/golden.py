@@ -1,62 +1,110 @@
+import logging
 from cherche import retrieve
-from sentence_transformers import SentenceTransformer
 import faiss
+import numpy as np
 from rapidfuzz import fuzz
 from lenlp import sparse
+from .deadline import DeadlineExceeded, timed_batches
+from .embedding_cache import cached_encoder, load_document_embeddings, text_digest
+from .inference import load_sentence_transformer, model_key
+from .incremental import IncrementalIndex, ROW_KEY
+from .positional import PositionalIndex, corpus_fingerprint
+from .projection import build_projection, resolve_projection
+from .wand import TopKIndex
 
-class DocumentRetriever:
-    def __init__(self, method, documents, on, key="id", use_gpu=False, **kwargs):
+class DocumentRetriever(IncrementalIndex):
+    def __init__(self, method, documents, on, key="id", use_gpu=False, deadline=None, **kwargs):
         self.method = method.lower()
         self.documents = documents
         self.key = key
         self.on = on
         self.use_gpu = use_gpu
+        self.deadline = deadline
         self.kwargs = kwargs
+        self.partial = False  # Set when the deadline stopped indexing before all documents were added
         self.retriever = None
         self.encoder_model = None  # Ensuring it's defined for encoder methods
         self.query_encoder = None  # Ensuring it's defined for DPR method
+        self.projection = None  # Embedding method with projection_dim set, see _load_projection
 
-        if self.method == "bm25":
-            self.retriever = self._init_bm25()
-        elif self.method == "tfidf":
-            self.retriever = self._init_tfidf()
-        elif self.method == "flash":
-            self.retriever = self._init_flash()
-        elif self.method == "lunr":
-            self.retriever = self._init_lunr()
-        elif self.method == "fuzz":
-            self.retriever = self._init_fuzz()
-        elif self.method == "embedding":
-            self.retriever = self._init_embedding()
+        if self.method not in self.BUILDERS:
+            return
+        if self.method == "embedding":
+            self._load_encoder()
+        # Indexes are keyed on an internal row number so documents can be replaced and deleted later (upsert/delete)
+        rows = self._init_incremental(documents)
+        if self.method == "embedding":
+            self._load_projection(rows)
+        self.retriever = self._build_index(rows, deadline=deadline)
+        self._indexed = len(rows)
+
+    BUILDERS = {
+        "bm25": "_init_bm25",
+        "tfidf": "_init_tfidf",
+        "flash": "_init_flash",
+        "lunr": "_init_lunr",
+        "fuzz": "_init_fuzz",
+        "embedding": "_init_embedding",
+        "positional": "_init_positional",
+        "bm25_wand": "_init_bm25_wand",
+        "tfidf_wand": "_init_tfidf_wand",
+    }
+    # Indexes that take new documents in place; the others are rebuilt in the background on upsert
+    GROWABLE = {"flash", "fuzz", "embedding", "positional"}
+
+    def _build_index(self, rows, deadline=None):
+        builder = getattr(self, self.BUILDERS[self.method])
+        return builder(rows, deadline=deadline) if self.method == "embedding" else builder(rows)
+
+    def _add_to_index(self, index, rows):
+        if self.method not in self.GROWABLE:
+            return False
+        if self.method == "embedding":
+            index.add(documents=rows, embeddings_documents=self._encode_documents(rows))
+        else:
+            index.add(rows)
+        return True
 
     def _filter_kwargs(self, valid_params):
         return {k: v for k, v in self.kwargs.items() if k in valid_params}
 
-    def _init_bm25(self):
+    def _init_bm25(self, documents):
         valid_params = ['k']
         filtered_kwargs = self._filter_kwargs(valid_params)
-        return retrieve.BM25(key=self.key, on=self.on, documents=self.documents, **filtered_kwargs)
+        return retrieve.BM25(key=ROW_KEY, on=self.on, documents=documents, **filtered_kwargs)
 
-    def _init_tfidf(self):
+    def _init_tfidf(self, documents):
         valid_params = ['vectorizer_params']
         filtered_kwargs = self._filter_kwargs(valid_params)
         count_vectorizer = sparse.TfidfVectorizer(**filtered_kwargs.get("vectorizer_params", {}))
-        return retrieve.TfIdf(key=self.key, on=self.on, documents=self.documents, tfidf=count_vectorizer)
+        return retrieve.TfIdf(key=ROW_KEY, on=self.on, documents=documents, tfidf=count_vectorizer)
 
-    def _init_flash(self):
-        retriever = retrieve.Flash(key=self.key, on=self.on)
-        retriever.add(self.documents)
+    def _init_flash(self, documents):
+        retriever = retrieve.Flash(key=ROW_KEY, on=self.on)
+        retriever.add(documents)
         return retriever
 
-    def _init_lunr(self):
-        return retrieve.Lunr(key=self.key, on=self.on, documents=self.documents)
+    def _init_lunr(self, documents):
+        return retrieve.Lunr(key=ROW_KEY, on=self.on, documents=documents)
+
+    def _init_positional(self, documents):
+        # Only the first build is persisted; compactions cover other document sets
+        index_path = self._filter_kwargs(['index_path']).get("index_path") if self.retriever is None else None
+        return PositionalIndex.open_or_build(documents, key=ROW_KEY, on=self.on, path=index_path, corpus_key=self.key)
 
-    def _init_fuzz(self):
+    def _init_bm25_wand(self, documents):
+        filtered_kwargs = self._filter_kwargs(['k1', 'b'])
+        return TopKIndex(documents, key=ROW_KEY, on=self.on, scoring="bm25", **filtered_kwargs)
+
+    def _init_tfidf_wand(self, documents):
+        return TopKIndex(documents, key=ROW_KEY, on=self.on, scoring="tfidf")
+
+    def _init_fuzz(self, documents):
         valid_params = ['fuzzer']
         filtered_kwargs = self._filter_kwargs(valid_params)
         fuzzer = filtered_kwargs.get("fuzzer", fuzz.partial_ratio)
-        retriever = retrieve.Fuzz(key=self.key, on=self.on, fuzzer=fuzzer)
-        retriever.add(self.documents)
+        retriever = retrieve.Fuzz(key=ROW_KEY, on=self.on, fuzzer=fuzzer)
+        retriever.add(documents)
         return retriever
     '''
 # List of available scoring function
@@ -77,41 +125,107 @@ class DocumentRetriever:
 
 
 
-    def _init_embedding(self):
-        valid_params = ['model_name']
-        filtered_kwargs = self._filter_kwargs(valid_params)
+    def _load_encoder(self):
+        filtered_kwargs = self._filter_kwargs(['model_name', 'backend'])
         model_name = filtered_kwargs.get("model_name", "sentence-transformers/all-mpnet-base-v2")
-        self.encoder_model = SentenceTransformer(model_name, device="cuda" if self.use_gpu else "cpu")
-        encoder = self.encoder_model.encode
-
-        def wrapped_encoder(texts):
-            if isinstance(texts, str):
-                texts = [texts]
-            return encoder(texts)
-        d = wrapped_encoder(["This is a sample document."])[0].shape[0] # Leave it here to calculate the embedding size.
+        backend = filtered_kwargs.get("backend")  # CPU inference backend, see inference.py
+        self.encoder_model = load_sentence_transformer(model_name, device="cuda" if self.use_gpu else "cpu", backend=backend)
+        self.query_encoder = cached_encoder(model_key(model_name, backend), self.encoder_model.encode)
+        # Precomputed vectors (e.g. from the ingestion pipeline): {text digest: embedding} or the path of a
+        # document embeddings file. Only texts missing from it are encoded.
+        self.document_embeddings = self._filter_kwargs(["document_embeddings"]).get("document_embeddings", {})
+        if isinstance(self.document_embeddings, str):
+            self.document_embeddings = load_document_embeddings(self.document_embeddings, model_key(model_name, backend))
+
+    def _load_projection(self, documents):
+        # Optionally store and search fewer dimensions: a projection fitted on a sample of the corpus, applied to
+        # documents and queries alike
+        filtered_kwargs = self._filter_kwargs(['projection_dim', 'projection'])
+        projection_dim, projection = resolve_projection(filtered_kwargs.get("projection_dim"),
+                                                        filtered_kwargs.get("projection"))
+        if projection_dim:
+            # The embedding index ranks by L2 distance between unnormalised vectors
+            self.projection = build_projection(documents, ["text"], self._encode_texts, self.encoder_model.encode,
+                                               projection_dim, projection, normalize=False)
+        if self.projection is not None:
+            self.query_encoder = self.projection.wrap(self.query_encoder)
+            # The sample was encoded at full width to fit the projection; index those documents from these vectors
+            self.document_embeddings.update(self.projection.sample_embeddings)
+            self.projection.sample_embeddings = {}
+
+    def _encode_texts(self, texts):
+        digests = [text_digest(text) for text in texts]
+        missing = [text for text, digest in zip(texts, digests) if digest not in self.document_embeddings]
+        if not missing:
+            return np.stack([self.document_embeddings[digest] for digest in digests])
+        encoded = iter(self.encoder_model.encode(missing))
+        return np.stack([self.document_embeddings[digest] if digest in self.document_embeddings else next(encoded)
+                         for digest in digests])
+
+    def _encode_documents(self, documents):
+        embeddings = self._encode_texts([doc["text"] for doc in documents])
+        return embeddings if self.projection is None else self.projection(embeddings)
+
+    def _init_embedding(self, documents, deadline=None):
+        d = self.encoder_model.encode(["This is a sample document."])[0].shape[0] # Leave it here to calculate the embedding size.
+        if self.projection is not None:
+            d = self.projection.dim
         index = faiss.IndexFlatL2(d)
         if self.use_gpu:
             index = faiss.index_cpu_to_gpu(faiss.StandardGpuResources(), 0, index)
 
-        retriever = retrieve.Embedding(key=self.key, index=index)
-        embeddings_documents = wrapped_encoder([doc["text"] for doc in self.documents])
-        retriever.add(documents=self.documents, embeddings_documents=embeddings_documents)
-        return retriever
+        retriever = retrieve.Embedding(key=ROW_KEY, index=index)
 
-    def retrieve(self, query, k=10, batch_size=64):
-        if isinstance(query, str):
-            query = [query]
+        # Encode in batches of about CHECK_INTERVAL_SECONDS (at most batch_size documents), so an expiring deadline
+        # leaves a searchable index over the documents encoded so far
+        batch_size = self._filter_kwargs(['batch_size']).get("batch_size", 256)
+        indexed_documents, embeddings = [], []
+        for start, end in timed_batches(len(documents), batch_size):
+            if deadline is not None and deadline.expired():
+                if not indexed_documents:
+                    raise DeadlineExceeded("Deadline exceeded before any document was encoded")
+                logging.warning(f"Deadline reached after encoding {len(indexed_documents)} of {len(documents)} documents")
+                self.partial = True
+                break
+            batch = documents[start:end]
+            embeddings.append(self._encode_documents(batch))
+            indexed_documents.extend(batch)
+        if indexed_documents:
+            retriever.add(documents=indexed_documents, embeddings_documents=np.concatenate(embeddings))
+        return retriever
 
+    def _search(self, index, queries, k):
         if self.method in ["encoder", "embedding"]:
-            query_embeddings = self.encoder_model.encode(query)
-            return self.retriever(q=query_embeddings, k=k)
-        elif self.method == "dpr":
-            query_embeddings = self.query_encoder(query)
-            return self.retriever(q=query_embeddings, k=k)
+            query_embeddings = self.query_encoder(queries)
+            results = index(q=query_embeddings, k=k)
         elif self.method == "flash":
-            return self.retriever(query)
+            results = index(queries)
+        elif self.method in ["positional", "bm25_wand", "tfidf_wand"]:
+            results = index.search(queries, k=k)
         else:
-            return self.retriever(query, k=k)
+            results = index(queries, k=k)
+        # Normalise to one result list per query
+        return results if results and isinstance(results[0], list) else [results]
+
+    def save_index(self, path):
+        """
+        Save a persistent (positional) index so that a later build over the same documents loads it from path.
+
+        The main index is compacted first if documents were replaced or deleted, so it covers exactly the live rows.
+        """
+        if self.method != "positional":
+            raise ValueError(f"The {self.method} index cannot be saved")
+        if self._tombstones:
+            self.compact(background=False)
+        with self._lock:
+            rows = [self._row_document(row) for row in sorted(self._rows.values())]
+            self.retriever.save(path, corpus_fingerprint(rows, self.key, self.on, ROW_KEY))
+        logging.info(f"Saved positional index of {len(rows)} documents to {path}")
+
+    def retrieve(self, query, k=10, batch_size=64):
+        if isinstance(query, str):
+            query = [query]
+        return self._search_live(query, k)
 
 
 '''
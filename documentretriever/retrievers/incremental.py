@@ -0,0 +1,158 @@
+import heapq
+import logging
+import threading
+
+# Internal key the underlying cherche indexes are built on. Every document version gets a new row number, so an
+# updated document never collides with its stale copy inside an index that cannot delete.
+ROW_KEY = "_row"
+
+
+class IncrementalIndex:
+    """
+    upsert/delete for retrievers whose underlying index can only grow (or cannot change at all).
+
+    Subclasses set self.key and implement:
+      _build_index(rows, deadline=None) -> index over the given documents, keyed on ROW_KEY
+      _add_to_index(index, rows) -> True if the rows were added to the index in place, False if it cannot grow
+      _search(index, queries, k) -> for each query a list of {ROW_KEY: row, "similarity": score}
+
+    Replaced and deleted rows are tombstoned and filtered out of results (queries over-fetch by the number of
+    tombstones, so no live document is crowded out of the top k). compact() rebuilds the main index from the live
+    documents in a background thread and swaps it in, which clears the tombstones (until then, collection
+    statistics such as IDF still count the stale rows). When the index cannot take new rows in place, they are
+    queued and a compaction is started: an index built over the new rows alone would score them with its own IDF
+    and length statistics, on a different scale from the main index. Queued rows become searchable when the
+    rebuilt index is swapped in; queries keep running on the current index meanwhile.
+    """
+
+    compaction_ratio = 0.25  # Compact automatically once this share of the main index is stale
+
+    def _init_incremental(self, documents):
+        """Register the initial documents and return them with their row numbers for the first build."""
+        self._lock = threading.RLock()
+        self._next_row = 0
+        self._rows = {}  # Document id -> live row
+        self._documents = {}  # Live row -> document
+        self._tombstones = set()  # Rows still present in the main index whose document was replaced or deleted
+        self._pending = set()  # Live rows waiting for the next rebuild of an index that cannot grow
+        self._indexed = 0  # Rows in the main index, live or not
+        self._compaction = None
+        self._compact_again = False
+        return self._assign_rows(documents)
+
+    def _assign_rows(self, documents):
+        rows = []
+        for document in documents:
+            self._remove(document[self.key])
+            row = self._next_row
+            self._next_row += 1
+            self._rows[document[self.key]] = row
+            self._documents[row] = document
+            rows.append({**document, ROW_KEY: row})
+        return rows
+
+    def _remove(self, doc_id):
+        row = self._rows.pop(doc_id, None)
+        if row is None:
+            return False
+        del self._documents[row]
+        if row in self._pending:
+            self._pending.discard(row)
+        else:
+            self._tombstones.add(row)
+        return True
+
+    def _row_document(self, row):
+        return {**self._documents[row], ROW_KEY: row}
+
+    def _index_rows(self, rows):
+        """Add rows to the main index when it can grow, otherwise queue them for a background rebuild."""
+        if not rows:
+            return
+        if self._add_to_index(self.retriever, rows):
+            self._indexed += len(rows)
+            return
+        self._pending.update(row[ROW_KEY] for row in rows)
+        self.compact()
+
+    def upsert(self, documents):
+        """Add new documents and replace existing ones (matched on self.key); see the class docstring."""
+        with self._lock:
+            self._index_rows(self._assign_rows(documents))
+            self._maybe_compact()
+
+    def delete(self, ids):
+        """Remove documents by id. Returns the number of documents that existed."""
+        with self._lock:
+            removed = sum(self._remove(doc_id) for doc_id in ids)
+            self._maybe_compact()
+            return removed
+
+    def _maybe_compact(self):
+        stale = len(self._tombstones)
+        if stale and stale >= self.compaction_ratio * max(self._indexed, 1):
+            self.compact()
+
+    def compact(self, background=True):
+        """
+        Rebuild the main index from the live documents, dropping tombstones.
+
+        Queries keep using the current index until the new one is swapped in; the lock is only held to snapshot
+        and swap, never while building. Rows added while the rebuild runs are added to the new index in place, or
+        trigger another rebuild when it cannot grow. Returns the compaction thread (already joined when background
+        is False).
+        """
+        with self._lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                self._compact_again = True  # Picked up by the running compaction once it swaps its index in
+                return self._compaction
+            self._compact_again = False
+
+        def run():
+            while True:
+                with self._lock:
+                    snapshot_row = self._next_row
+                    live = [self._row_document(row) for row in sorted(self._rows.values())]
+                    self._compact_again = False
+                try:
+                    index = self._build_index(live)
+                except Exception as e:
+                    logging.error(f"Compaction failed, keeping the current index: {e}")
+                    return
+                with self._lock:
+                    included = {row[ROW_KEY] for row in live}
+                    self.retriever = index
+                    self._indexed = len(live)
+                    self._tombstones = {row for row in self._tombstones if row in included}  # Deleted meanwhile
+                    self._pending = {row for row in self._pending if row >= snapshot_row}
+                    added = [self._row_document(row) for row in sorted(self._rows.values()) if row >= snapshot_row]
+                    if added and self._add_to_index(index, added):
+                        self._indexed += len(added)
+                        self._pending = set()
+                    if not self._pending and not self._compact_again:
+                        break
+                logging.info(f"Compacted index to {len(live)} documents; rebuilding again for changes made meanwhile")
+            logging.info(f"Compacted index to {len(live)} documents")
+
+        self._compaction = threading.Thread(target=run, daemon=True)
+        self._compaction.start()
+        if not background:
+            self._compaction.join()
+        return self._compaction
+
+    def _search_live(self, queries, k):
+        """Search the main index, drop stale rows and map rows back to document ids."""
+        with self._lock:
+            index, stale = self.retriever, len(self._tombstones)
+        results = []
+        for main in self._search(index, queries, k + stale):
+            hits = []
+            for hit in main:
+                document = self._documents.get(hit[ROW_KEY])  # Replaced and deleted rows are no longer here
+                if document is not None:
+                    hits.append({self.key: document[self.key], "similarity": hit["similarity"]})
+            results.append(heapq.nlargest(k, hits, key=lambda hit: hit["similarity"]))
+        return results
+
+    def __len__(self):
+        return len(self._rows)
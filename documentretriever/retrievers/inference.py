@@ -0,0 +1,90 @@
+import logging
+import os
+
+import numpy as np
+from sentence_transformers import SentenceTransformer, CrossEncoder
+
+# torch: float32 PyTorch (reference); int8: PyTorch with Linear layers dynamically quantized to int8;
+# onnx: exported ONNX graph run with ONNX Runtime (needs sentence-transformers >= 3.2 with optimum[onnxruntime])
+INFERENCE_BACKENDS = ("torch", "int8", "onnx")
+DEFAULT_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
+
+
+def resolve_backend(backend=None):
+    backend = backend or DEFAULT_BACKEND
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}; choose from {INFERENCE_BACKENDS}")
+    return backend
+
+
+def model_key(model_name, backend=None):
+    """Name under which a model's outputs are cached; optimized backends do not share the float32 entries."""
+    backend = resolve_backend(backend)
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+def _quantize(module):
+    import torch  # Only needed for the int8 path; sentence-transformers already depends on it
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_sentence_transformer(model_name, device="cpu", backend=None):
+    """
+    SentenceTransformer for model_name on the chosen inference backend; encode() is unchanged.
+
+    Optimized backends only apply on CPU. On CUDA the float32 model is returned.
+    """
+    backend = resolve_backend(backend)
+    if backend == "torch" or device != "cpu":
+        return SentenceTransformer(model_name, device=device)
+    if backend == "onnx":
+        return SentenceTransformer(model_name, device=device, backend="onnx")
+    model = _quantize(SentenceTransformer(model_name, device=device))
+    logging.info(f"Loaded {model_name} with int8 dynamic quantization")
+    return model
+
+
+def load_cross_encoder(model_name, device="cpu", backend=None):
+    """CrossEncoder for model_name on the chosen inference backend; predict() is unchanged."""
+    backend = resolve_backend(backend)
+    if backend == "torch" or device != "cpu":
+        return CrossEncoder(model_name, device=device)
+    if backend == "onnx":
+        return CrossEncoder(model_name, device=device, backend="onnx")  # sentence-transformers >= 4.1
+    cross_encoder = CrossEncoder(model_name, device=device)
+    cross_encoder.model = _quantize(cross_encoder.model)
+    logging.info(f"Loaded {model_name} with int8 dynamic quantization")
+    return cross_encoder
+
+
+def _normalize(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+
+def parity_check(reference, candidate, documents, queries, k=10):
+    """
+    Compare an optimized encoder with the float32 one on the same texts.
+
+    :param reference: encode function of the float32 model.
+    :param candidate: encode function of the optimized model.
+    :param documents: Document texts to embed and rank.
+    :param queries: Query texts ranked against documents.
+    :return: Cosine similarity between paired embeddings (mean and min) and, over the queries, the mean overlap
+        of the top k documents and the share of queries whose top 1 document is unchanged.
+    """
+    reference_documents, candidate_documents = _normalize(reference(documents)), _normalize(candidate(documents))
+    reference_queries, candidate_queries = _normalize(reference(queries)), _normalize(candidate(queries))
+    cosine = np.concatenate([np.sum(reference_documents * candidate_documents, axis=1),
+                             np.sum(reference_queries * candidate_queries, axis=1)])
+
+    k = min(k, len(documents))
+    reference_top = np.argsort(-(reference_queries @ reference_documents.T), axis=1)[:, :k]
+    candidate_top = np.argsort(-(candidate_queries @ candidate_documents.T), axis=1)[:, :k]
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(reference_top, candidate_top)]
+    return {
+        "cosine_mean": float(cosine.mean()),
+        "cosine_min": float(cosine.min()),
+        f"top{k}_overlap": float(np.mean(overlap)),
+        "top1_agreement": float(np.mean(reference_top[:, 0] == candidate_top[:, 0])),
+    }
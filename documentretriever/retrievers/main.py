@@ -2,12 +2,27 @@
 
 import json
 import logging
-from typing import List, Dict, Any
+import os
+import time
+from typing import List, Dict, Any, Optional, Tuple
 
 # Import specific retriever implementations
 from .encoder import DocumentRetriever as EncoderDocumentRetriever
 from .dpr import DPRRetriever
 from .golden import DocumentRetriever as GoldenDocumentRetriever
+from .deadline import Deadline, DeadlineExceeded, FALLBACK_METHODS, estimate_index_seconds, record_index_time
+from .sharded import ShardedRetriever
+from .filters import FilterIndex
+from .embedding_cache import DOCUMENT_EMBEDDINGS_FILE
+
+GOLDEN_METHODS = ["bm25", "tfidf", "flash", "lunr", "fuzz", "embedding", "positional", "bm25_wand", "tfidf_wand"]
+# Methods whose index is saved next to the corpus and reused while the corpus is unchanged
+PERSISTENT_METHODS = ["positional"]
+# Methods that reuse the document embeddings saved next to the corpus by the ingestion pipeline
+PRECOMPUTED_EMBEDDING_METHODS = ["embedding"]
+
+# Metadata bitmaps per processed documents file, keyed by (path, modification time)
+_filter_indexes = {}
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -21,30 +36,159 @@ def load_documents(file_path: str) -> List[Dict[str, Any]]:
         logging.error(f"Error loading documents from {file_path}: {e}")
         raise
 
-def retrieve_golden(documents: List[Dict[str, Any]], query: str, method: str, k: int) -> List[Dict[str, Any]]:
-    """Retrieve documents using the Golden retriever with specified method."""
-    try:
-        retriever = GoldenDocumentRetriever(
+def expand_occurrences(results: List[Any], documents: List[Dict[str, Any]]) -> List[Any]:
+    """Attach the occurrences of collapsed near-duplicate paragraphs to every result that has them."""
+    occurrences = {doc["id"]: doc["occurrences"] for doc in documents if "occurrences" in doc}
+    if not occurrences:
+        return results
+    for item in results:
+        if isinstance(item, list):
+            expand_occurrences(item, documents)
+        elif isinstance(item, dict) and item.get("id") in occurrences:
+            item["occurrences"] = occurrences[item["id"]]
+    return results
+
+def mark_degraded(results: List[Any], method: str) -> List[Any]:
+    """Flag every result as degraded and record the method that actually produced it."""
+    for item in results:
+        if isinstance(item, list):
+            mark_degraded(item, method)
+        elif isinstance(item, dict):
+            item["degraded"] = True
+            item["method"] = method
+    return results
+
+def build_retriever(documents: List[Dict[str, Any]], method: str, deadline: Optional[Deadline] = None,
+                    **kwargs: Any) -> Any:
+    """
+    Build the first-stage index for a method and return the retriever handle.
+
+    The handle exposes retrieve(query, k=...), `partial` and upsert(documents)/delete(ids), so it can be kept,
+    queried repeatedly and updated as the corpus changes, or passed to documentranker's
+    DocumentRanker(retriever=...) to rerank its candidates. Extra keyword arguments (e.g. backend="int8")
+    go to the retriever class.
+    """
+    if method in GOLDEN_METHODS:
+        return GoldenDocumentRetriever(
             method=method,
             documents=documents,
             on=["text"],  # Adjust this based on your document structure
-            use_gpu=False  # Set to True if you want to use GPU
+            use_gpu=False,  # Set to True if you want to use GPU
+            deadline=deadline,
+            **kwargs
         )
-        results = retriever.retrieve(query, k=k)
-        return results
-    except Exception as e:
-        logging.error(f"Error in Golden retrieval with method {method}: {e}")
-        raise
+    elif method == "encoder":
+        return EncoderDocumentRetriever(documents, deadline=deadline, on=["text"], **kwargs)
+    elif method == "dpr":
+        return DPRRetriever(documents, deadline=deadline, on=["text"], **kwargs)
+    raise ValueError(f"Unsupported retrieval method: {method}")
+
+def retrieve_with_method(documents: List[Dict[str, Any]], query: str, method: str, k: int,
+                         deadline: Optional[Deadline] = None, shards: Optional[int] = None,
+                         shard_by: Optional[str] = None,
+                         index_path: Optional[str] = None,
+                         document_embeddings: Optional[str] = None) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Build the index for a single method and run the query. Returns (results, partial).
+
+    index_path is where methods with a persistent index (positional) load it from or save it to.
+    document_embeddings is a document embeddings file (see embedding_cache.save_document_embeddings) whose
+    vectors the embedding method uses instead of encoding those paragraphs again.
+    """
+    # Only the build is timed: that is what estimate_index_seconds predicts for later requests
+    started = time.monotonic()
+    if shards:
+        with ShardedRetriever(documents, method, num_shards=shards, by=shard_by, deadline=deadline) as retriever:
+            build_seconds = time.monotonic() - started
+            results, partial = retriever.retrieve(query, k=k), retriever.partial
+    else:
+        options = {"index_path": index_path} if index_path and method in PERSISTENT_METHODS else {}
+        if document_embeddings and method in PRECOMPUTED_EMBEDDING_METHODS:
+            options["document_embeddings"] = document_embeddings
+        retriever = build_retriever(documents, method, deadline=deadline, **options)
+        build_seconds = time.monotonic() - started
+        results, partial = retriever.retrieve(query, k=k), retriever.partial
+    if not partial:
+        record_index_time(method, shard_size(documents, shards), build_seconds)
+    return results, partial
+
+def index_file(index_dir: str, method: str) -> str:
+    """Where the persistent index of a method is kept for the corpus in index_dir."""
+    return os.path.join(index_dir, f"{method}_index.npz")
+
+def shard_size(documents: List[Dict[str, Any]], shards: Optional[int]) -> int:
+    """Documents per index build; shards build in parallel, so this is what the build time scales with."""
+    return -(-len(documents) // shards) if shards else len(documents)
+
+def retrieve_from_documents(documents: List[Dict[str, Any]], query: str, method: str, k: int,
+                            deadline: Optional[Deadline] = None,
+                            fallbacks: Dict[str, str] = FALLBACK_METHODS,
+                            shards: Optional[int] = None, shard_by: Optional[str] = None,
+                            filters: Optional[Any] = None, filter_index: Optional[FilterIndex] = None,
+                            index_dir: Optional[str] = None) -> List[Any]:
+    """
+    Retrieve from already loaded documents, degrading gracefully under a deadline.
+
+    If the deadline is at risk before indexing starts, the cheaper fallback method is used instead.
+    If it expires while a dense index is being built, the query runs against the documents indexed
+    so far. Results produced either way carry "degraded": True and the "method" actually used.
+    With shards, the corpus is split into that many indexes built and queried in parallel processes
+    (see sharded.ShardedRetriever); shard_by="folder" keeps each source folder in one shard.
+    filters (a dict or string, see filters.parse_filter) restrict the corpus with precomputed metadata
+    bitmaps before any index is built, so a query scoped to one tender only pays for that tender.
+    index_dir is where persistent indexes of the whole corpus are kept (ignored for filtered or sharded runs),
+    and where precomputed document embeddings are picked up from (see pipeline.py; ignored for sharded runs).
+    """
+    if filters:
+        filter_index = filter_index or FilterIndex(documents)
+        documents = filter_index.subset(documents, filters)
+        logging.info(f"Filters {filters} selected {len(documents)} of {filter_index.size} documents")
+        if not documents:
+            return []
+
+    used_method = method
+    if deadline is not None:
+        logging.info(f"{deadline.remaining():.1f}s left for {method} retrieval")
+        while used_method in fallbacks and deadline.at_risk(estimate_index_seconds(used_method, shard_size(documents, shards))):
+            logging.warning(f"Deadline at risk for {used_method}, falling back to {fallbacks[used_method]}")
+            used_method = fallbacks[used_method]
+
+    while True:
+        try:
+            index_path = index_file(index_dir, used_method) if index_dir and not filters and not shards else None
+            # Embeddings are keyed by text, so they stay valid for any filtered subset of the corpus
+            embeddings_path = os.path.join(index_dir, DOCUMENT_EMBEDDINGS_FILE) if index_dir else None
+            if embeddings_path and not os.path.exists(embeddings_path):
+                embeddings_path = None
+            results, partial = retrieve_with_method(documents, query, used_method, k, deadline=deadline,
+                                                    shards=shards, shard_by=shard_by, index_path=index_path,
+                                                    document_embeddings=embeddings_path)
+            break
+        except DeadlineExceeded as e:
+            if used_method not in fallbacks:
+                raise
+            logging.warning(f"{e}; falling back from {used_method} to {fallbacks[used_method]}")
+            used_method = fallbacks[used_method]
+
+    if partial or used_method != method:
+        mark_degraded(results, used_method)
+    return expand_occurrences(results, documents)
 
-def retrieve(processed_docs_path: str, query: str, method: str, k: int) -> List[Dict[str, Any]]:
+def retrieve(processed_docs_path: str, query: str, method: str, k: int,
+             deadline: Optional[Deadline] = None, shards: Optional[int] = None,
+             shard_by: Optional[str] = None, filters: Optional[Any] = None) -> List[Dict[str, Any]]:
     """
     Main function to perform document retrieval.
     
     Args:
     processed_docs_path (str): Path to the processed documents JSON file.
     query (str): The query string for retrieval.
-    method (str): The retrieval method to use (e.g., "bm25", "dpr", "encoder", "tfidf", "flash", "lunr", "fuzz", "embedding").
+    method (str): The retrieval method to use (e.g., "bm25", "dpr", "encoder", "tfidf", "flash", "lunr", "fuzz", "embedding", "positional", "bm25_wand", "tfidf_wand").
     k (int): The number of top results to retrieve.
+    deadline (Deadline, optional): Time limit for the request; see retrieve_from_documents.
+    shards (int, optional): Split the corpus into this many indexes queried in parallel.
+    shard_by (str, optional): "folder" (or a document field) to shard on instead of by size.
+    filters (dict or str, optional): Metadata filter, e.g. "folder=Tender A;doc_type=pdf;modified>=2024-01-01".
     
     Returns:
     list: A list of retrieved documents.
@@ -56,17 +200,19 @@ def retrieve(processed_docs_path: str, query: str, method: str, k: int) -> List[
 
     try:
         documents = load_documents(processed_docs_path)
-        
-        if method in ["bm25", "tfidf", "flash", "lunr", "fuzz", "embedding"]:
-            return retrieve_golden(documents, query, method, k)
-        elif method == "encoder":
-            encoder_retriever = EncoderDocumentRetriever(documents)
-            return encoder_retriever.retrieve(query, k=k)
-        elif method == "dpr":
-            dpr_retriever = DPRRetriever(documents)
-            return dpr_retriever.retrieve(query, k=k)
-        else:
-            raise ValueError(f"Unsupported retrieval method: {method}")
+        if deadline is not None:
+            deadline.check("retrieval")  # Loading a large corpus can use up the whole budget
+        filter_index = None
+        if filters:
+            cache_key = (os.path.abspath(processed_docs_path), os.path.getmtime(processed_docs_path))
+            if cache_key not in _filter_indexes:
+                _filter_indexes.clear()  # Only the latest version of a corpus is worth keeping
+                _filter_indexes[cache_key] = FilterIndex(documents)
+            filter_index = _filter_indexes[cache_key]
+        # Persistent indexes are kept next to the corpus they were built from
+        return retrieve_from_documents(documents, query, method, k, deadline=deadline,
+                                       shards=shards, shard_by=shard_by, filters=filters, filter_index=filter_index,
+                                       index_dir=os.path.dirname(os.path.abspath(processed_docs_path)))
 
     except Exception as e:
         logging.error(f"Error in document retrieval: {e}")
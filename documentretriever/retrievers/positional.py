@@ -0,0 +1,315 @@
+import hashlib
+import logging
+import os
+import re
+from collections import defaultdict
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"\w+")
+# "exact phrase", "any order within slop"~N, "in order within slop"<N
+QUERY_RE = re.compile(r'"([^"]+)"(?:([~<])(\d+))?')
+# Positions are packed below the row number in one int64 so phrase matching is a sorted-array intersection
+POSITION_BITS = 32
+# Weight of plain term coverage next to query bigram coverage; only breaks ties between equal phrase overlap
+TERM_WEIGHT = 0.01
+DECODED_CACHE_SIZE = 4096
+
+
+def tokenize(text):
+    """Lower-cased word tokens; the same tokens are used for documents and queries."""
+    return TOKEN_RE.findall(text.lower())
+
+
+def encode_varints(values):
+    """LEB128-encode non-negative integers (7 bits per byte, high bit set on all but the last byte)."""
+    values = np.asarray(values, dtype=np.uint64)
+    if not len(values):
+        return b""
+    lengths = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        lengths += rest > 0
+        rest >>= np.uint64(7)
+    starts = np.cumsum(lengths) - lengths
+    out = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for byte in range(int(lengths.max())):
+        mask = lengths > byte
+        group = (values[mask] >> np.uint64(7 * byte)) & np.uint64(0x7F)
+        more = np.where(lengths[mask] > byte + 1, 0x80, 0).astype(np.uint64)
+        out[starts[mask] + byte] = (group | more).astype(np.uint8)
+    return out.tobytes()
+
+
+def decode_varints(data):
+    """Inverse of encode_varints, vectorised over the whole buffer."""
+    data = np.frombuffer(data, dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.int64)
+    last = data < 0x80
+    starts = np.flatnonzero(np.concatenate([[True], last[:-1]]))
+    group = np.concatenate([[0], np.cumsum(last)[:-1]])
+    shift = (np.arange(len(data)) - starts[group]) * 7
+    parts = (data & 0x7F).astype(np.uint64) << shift.astype(np.uint64)
+    return np.bitwise_or.reduceat(parts, starts).astype(np.int64)
+
+
+def corpus_fingerprint(documents, key, on, row_key):
+    digest = hashlib.sha1()
+    for doc in documents:
+        digest.update(f"{doc[row_key]}\x1f{doc[key]}\x1f{' '.join(str(doc.get(field, '')) for field in on)}\x1e".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class PositionalIndex:
+    def __init__(self, key, on):
+        """
+        Positional inverted index for phrase, proximity and ordered-window queries.
+
+        Per term, two varint streams: (row gap, term frequency) per document and the position gaps within each
+        document. Rows must be added in increasing order, which is how IncrementalIndex assigns them.
+
+        Query syntax (see search):
+          "exact phrase"            the words adjacent and in order
+          "any order"~3             all words within a window of their count + 3
+          "in order"<3              all words in order with at most 3 other words in between
+          plain text                ranked by the share of its consecutive word pairs found as phrases
+
+        :param key: Document field holding the row number the index is keyed on.
+        :param on: Fields indexed as the document text.
+        """
+        self.key = key
+        self.on = on
+        self._postings = {}  # Term -> [row stream, position stream, last row]; streams are bytearrays grown in place
+        self._decoded = {}
+        self.num_documents = 0
+
+    def _text(self, document):
+        return " ".join(str(document.get(field, "")) for field in self.on)
+
+    def add(self, documents):
+        """Index documents whose rows are all greater than the rows indexed so far."""
+        rows_by_term = defaultdict(list)
+        positions_by_term = defaultdict(list)
+        for document in documents:
+            occurrences = defaultdict(list)
+            for position, token in enumerate(tokenize(self._text(document))):
+                occurrences[token].append(position)
+            for term, positions in occurrences.items():
+                rows_by_term[term].append((document[self.key], len(positions)))
+                positions_by_term[term].append(np.diff(positions, prepend=0))
+        for term, entries in rows_by_term.items():
+            postings = self._postings.setdefault(term, [bytearray(), bytearray(), -1])
+            rows = np.array([row for row, _ in entries], dtype=np.int64)
+            gaps = np.diff(rows, prepend=postings[2])  # The first row of a term is stored as row + 1
+            pairs = np.column_stack([gaps, [tf for _, tf in entries]]).ravel()
+            postings[0] += encode_varints(pairs)
+            postings[1] += encode_varints(np.concatenate(positions_by_term[term]))
+            postings[2] = int(rows[-1])
+            self._decoded.pop(term, None)
+        self.num_documents += len(documents)
+        return self
+
+    def _decode(self, term):
+        """(rows, keys) of a term: its document rows and every occurrence as row << POSITION_BITS | position."""
+        if term in self._decoded:
+            return self._decoded[term]
+        postings = self._postings.get(term)
+        if postings is None:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        # Decode from snapshots: a numpy view would keep the bytearrays from growing on the next add
+        pairs = decode_varints(bytes(postings[0])).reshape(-1, 2)
+        rows = np.cumsum(pairs[:, 0]) - 1
+        frequencies = pairs[:, 1]
+        gaps = decode_varints(bytes(postings[1]))
+        # Positions restart at every document: cumulative sum within each document's segment
+        totals = np.cumsum(gaps)
+        segment_starts = np.cumsum(frequencies) - frequencies
+        positions = totals - np.repeat(totals[segment_starts] - gaps[segment_starts], frequencies)
+        keys = (np.repeat(rows, frequencies) << POSITION_BITS) | positions
+        if len(self._decoded) >= DECODED_CACHE_SIZE:
+            self._decoded.pop(next(iter(self._decoded)))
+        self._decoded[term] = (rows, keys)
+        return rows, keys
+
+    def _positions(self, term, row):
+        _, keys = self._decode(term)
+        lo, hi = np.searchsorted(keys, [row << POSITION_BITS, (row + 1) << POSITION_BITS])
+        return keys[lo:hi] & ((1 << POSITION_BITS) - 1)
+
+    def phrase(self, terms):
+        """(rows, occurrence counts) of the documents containing terms as an exact phrase."""
+        matches = None
+        for offset, term in enumerate(terms):
+            shifted = self._decode(term)[1] - offset
+            matches = shifted if matches is None else np.intersect1d(matches, shifted, assume_unique=True)
+            if not len(matches):
+                break
+        if matches is None or not len(matches):
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        rows, counts = np.unique(matches >> POSITION_BITS, return_counts=True)
+        return rows, counts.astype(float)
+
+    def window(self, terms, slop, ordered=False):
+        """
+        (rows, scores) of the documents with every term inside a window of len(terms) + slop words.
+
+        ordered requires the terms in query order. The score is 1 / (1 + extra words in the tightest window).
+        """
+        distinct = list(dict.fromkeys(terms))
+        candidates = None
+        for term in distinct:
+            rows = self._decode(term)[0]
+            candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+        matched_rows, scores = [], []
+        for row in (candidates if candidates is not None else []):
+            positions = [self._positions(term, row) for term in (terms if ordered else distinct)]
+            slack = self._ordered_slack(positions) if ordered else self._window_slack(positions)
+            if slack is not None and slack <= slop:
+                matched_rows.append(row)
+                scores.append(1.0 / (1 + slack))
+        return np.array(matched_rows, dtype=np.int64), np.array(scores)
+
+    @staticmethod
+    def _window_slack(positions):
+        # Smallest window holding one occurrence of every term (sliding window over the merged occurrences)
+        merged = sorted((position, index) for index, term_positions in enumerate(positions) for position in term_positions)
+        counts, covered, best, left = [0] * len(positions), 0, None, 0
+        for position, index in merged:
+            counts[index] += 1
+            covered += counts[index] == 1
+            while covered == len(positions):
+                start, start_index = merged[left]
+                span = position - start + 1 - len(positions)
+                best = span if best is None else min(best, span)
+                counts[start_index] -= 1
+                covered -= counts[start_index] == 0
+                left += 1
+        return best
+
+    @staticmethod
+    def _ordered_slack(positions):
+        # Earliest in-order completion from every occurrence of the first term
+        best = None
+        for start in positions[0]:
+            current = start
+            for term_positions in positions[1:]:
+                following = np.searchsorted(term_positions, current, side="right")
+                if following == len(term_positions):
+                    current = None
+                    break
+                current = term_positions[following]
+            if current is None:
+                break  # Later starts cannot complete either
+            span = int(current - start + 1 - len(positions))
+            best = span if best is None else min(best, span)
+        return best
+
+    def text_scores(self, terms):
+        """(rows, scores) ranking plain text by the share of its word pairs found as phrases, then of its words."""
+        distinct = list(dict.fromkeys(terms))
+        bigrams = list(dict.fromkeys(zip(terms, terms[1:])))
+        parts = [(self._decode(term)[0], np.full(len(self._decode(term)[0]), TERM_WEIGHT / len(distinct)))
+                 for term in distinct]
+        for bigram in bigrams:
+            rows, _ = self.phrase(list(bigram))
+            parts.append((rows, np.full(len(rows), 1.0 / len(bigrams))))
+        return _sum_scores(parts)
+
+    def search(self, queries, k=10):
+        """
+        Top k rows per query as [{key: row, "similarity": score}].
+
+        Quoted parts are constraints every result must meet (their scores add up); the remaining text ranks the
+        results. If nothing meets the constraints of a query that also has plain text, the plain-text ranking
+        is returned instead, so stray quotes in a clause never empty its results.
+        """
+        results = []
+        for query in queries:
+            constraints = []
+            for phrase, operator, slop in QUERY_RE.findall(query):
+                terms = tokenize(phrase)
+                if len(terms) < 2 and not operator:
+                    continue  # A quoted single word is just a word
+                if not operator:
+                    constraints.append(self.phrase(terms))
+                else:
+                    constraints.append(self.window(terms, int(slop), ordered=operator == "<"))
+            terms = tokenize(QUERY_RE.sub(" ", query) if constraints else query)
+            rows, scores = self.text_scores(terms) if terms else (np.zeros(0, dtype=np.int64), np.zeros(0))
+            if constraints:
+                allowed = constraints[0][0]
+                for constraint_rows, _ in constraints[1:]:
+                    allowed = np.intersect1d(allowed, constraint_rows, assume_unique=True)
+                if len(allowed) or not terms:
+                    constrained_rows, constrained_scores = _sum_scores(constraints + [(rows, scores)])
+                    keep = np.isin(constrained_rows, allowed)
+                    rows, scores = constrained_rows[keep], constrained_scores[keep]
+            top = np.argsort(-scores, kind="stable")[:k]
+            results.append([{self.key: int(rows[i]), "similarity": float(scores[i])} for i in top])
+        return results
+
+    def __call__(self, q, k=10):
+        return self.search([q] if isinstance(q, str) else q, k=k)
+
+    def save(self, path, fingerprint):
+        """Write the compressed postings to an .npz file next to the corpus (atomically; workers share it)."""
+        terms = list(self._postings)
+        row_streams = [bytes(self._postings[term][0]) for term in terms]
+        position_streams = [bytes(self._postings[term][1]) for term in terms]
+        temporary = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(temporary, fingerprint=np.array(fingerprint), terms=np.array(terms, dtype=str),
+                 rows=np.frombuffer(b"".join(row_streams), dtype=np.uint8),
+                 row_offsets=np.cumsum([0] + [len(stream) for stream in row_streams]),
+                 positions=np.frombuffer(b"".join(position_streams), dtype=np.uint8),
+                 position_offsets=np.cumsum([0] + [len(stream) for stream in position_streams]),
+                 last_rows=np.array([self._postings[term][2] for term in terms], dtype=np.int64),
+                 num_documents=np.array(self.num_documents))
+        os.replace(temporary, path)
+        logging.info(f"Saved positional index ({len(terms)} terms) to {path}")
+
+    @classmethod
+    def load(cls, path, key, on, fingerprint=None):
+        """Load an index written by save; None if it was built from a different corpus."""
+        with np.load(path) as data:
+            if fingerprint is not None and str(data["fingerprint"]) != fingerprint:
+                return None
+            index = cls(key, on)
+            rows, positions = data["rows"].tobytes(), data["positions"].tobytes()
+            row_offsets, position_offsets = data["row_offsets"], data["position_offsets"]
+            for i, (term, last_row) in enumerate(zip(data["terms"].tolist(), data["last_rows"].tolist())):
+                index._postings[term] = [bytearray(rows[row_offsets[i]:row_offsets[i + 1]]),
+                                         bytearray(positions[position_offsets[i]:position_offsets[i + 1]]), last_row]
+            index.num_documents = int(data["num_documents"])
+        return index
+
+    @classmethod
+    def open_or_build(cls, documents, key, on, path=None, corpus_key="id"):
+        """Load the index persisted at path if it matches documents, otherwise build it (and save it to path)."""
+        fingerprint = corpus_fingerprint(documents, corpus_key, on, key) if path else None
+        if path and os.path.exists(path):
+            try:
+                index = cls.load(path, key, on, fingerprint)
+            except Exception as e:
+                logging.warning(f"Could not load positional index {path}: {e}")
+                index = None
+            if index is not None:
+                logging.info(f"Loaded positional index from {path}")
+                return index
+        index = cls(key, on).add(documents)
+        if path:
+            try:
+                index.save(path, fingerprint)
+            except OSError as e:
+                logging.warning(f"Could not save positional index to {path}: {e}")
+        return index
+
+
+def _sum_scores(parts):
+    """Add up (rows, scores) pairs per row."""
+    parts = [(rows, scores) for rows, scores in parts if len(rows)]
+    if not parts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    rows, inverse = np.unique(np.concatenate([rows for rows, _ in parts]), return_inverse=True)
+    return rows, np.bincount(inverse, weights=np.concatenate([scores for _, scores in parts]), minlength=len(rows))
@@ -0,0 +1,145 @@
+import logging
+import os
+import random
+
+import numpy as np
+
+from .embedding_cache import text_digest
+
+# pca: leading principal directions of a sample of the corpus embeddings; truncate: the first dimensions as they
+# are, for models trained to keep most of the information there (Matryoshka embeddings)
+PROJECTIONS = ("pca", "truncate")
+# Default projection for the dense retrievers, e.g. "pca:384" or "truncate:256"; unset keeps full-width vectors
+DEFAULT_PROJECTION = os.environ.get("EMBEDDING_PROJECTION")
+SAMPLE_SIZE = 2048  # Corpus documents encoded to fit the projection and check its recall
+CHECK_QUERIES = 100  # Sampled documents held out as queries for the recall check
+CHECK_K = 10
+# Projected recall@CHECK_K below this is logged as a warning rather than info
+MIN_RECALL = 0.9
+
+
+def resolve_projection(dim=None, method=None):
+    """(target dimension, method) from the arguments or EMBEDDING_PROJECTION; a dimension of None means no projection."""
+    if dim is None and DEFAULT_PROJECTION:
+        default_method, _, default_dim = DEFAULT_PROJECTION.rpartition(":")
+        dim, method = int(default_dim), method or default_method or None
+    method = method or "pca"
+    if method not in PROJECTIONS:
+        raise ValueError(f"Unknown embedding projection {method!r}; choose from {PROJECTIONS}")
+    return (int(dim) if dim else None), method
+
+
+class Projection:
+    def __init__(self, dim, method="pca"):
+        """
+        Linear map from full-width embeddings to dim dimensions, applied to documents and queries alike.
+
+        pca keeps the top right singular vectors of the (uncentred) corpus embeddings: the rank-dim subspace that
+        best preserves inner products between vectors drawn like the corpus, which is what cosine and L2 search
+        rank by. Centring would drop the shared mean direction that every score depends on.
+
+        :param dim: Target dimension.
+        :param method: "pca" (fitted with fit) or "truncate" (first dim coordinates, no fitting).
+        """
+        self.dim = dim
+        self.method = method
+        self.components = None  # (full width, dim) for pca
+        self.retained = None  # Share of the sample's energy kept by pca
+        self.recall = None  # Recall@k against full-width search, set by check_recall
+        # Full-width embeddings of the documents fitted on, by text digest, until the first index build uses them
+        self.sample_embeddings = {}
+
+    def fit(self, embeddings):
+        if self.method == "pca":
+            _, singular_values, vt = np.linalg.svd(np.asarray(embeddings, dtype=np.float32), full_matrices=False)
+            self.components = np.ascontiguousarray(vt[:self.dim].T)
+            energy = singular_values ** 2
+            self.retained = float(energy[:self.dim].sum() / energy.sum())
+        return self
+
+    def __call__(self, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if self.method == "truncate":
+            return np.ascontiguousarray(embeddings[..., :self.dim])
+        return embeddings @ self.components
+
+    def wrap(self, encode):
+        """An encode function that returns projected embeddings."""
+        def projected(texts, **kwargs):
+            return self(encode(texts, **kwargs))
+        return projected
+
+    def wrap_documents(self, encode):
+        """Like wrap, but texts of the fitted sample reuse their full-width embeddings instead of being encoded again."""
+        def projected(texts, **kwargs):
+            digests = [text_digest(text) for text in texts]
+            missing = [text for text, digest in zip(texts, digests) if digest not in self.sample_embeddings]
+            if len(missing) == len(texts):
+                return self(encode(texts, **kwargs))
+            encoded = iter(encode(missing, **kwargs) if missing else [])
+            return self(np.stack([self.sample_embeddings[digest] if digest in self.sample_embeddings else next(encoded)
+                                  for digest in digests]))
+        return projected
+
+    def check_recall(self, documents, queries, k=CHECK_K, normalize=True):
+        """
+        Mean share of each query's full-width top k that the projected search also returns in its top k.
+
+        :param documents: Full-width document embeddings.
+        :param queries: Full-width query embeddings.
+        :param normalize: Rank by cosine similarity (as indexes built with normalize=True do) instead of L2 distance.
+        """
+        k = min(k, len(documents))
+        full = _top_k(queries, documents, k, normalize)
+        projected = _top_k(self(queries), self(documents), k, normalize)
+        self.recall = float(np.mean([len(set(a) & set(b)) / k for a, b in zip(full, projected)]))
+        return self.recall
+
+
+def _top_k(queries, documents, k, normalize):
+    queries, documents = np.asarray(queries, dtype=np.float32), np.asarray(documents, dtype=np.float32)
+    if normalize:
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        documents = documents / np.maximum(np.linalg.norm(documents, axis=1, keepdims=True), 1e-12)
+        scores = queries @ documents.T
+    else:
+        scores = 2 * queries @ documents.T - np.sum(documents ** 2, axis=1)  # Negative squared L2 up to a constant
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def document_text(document, on):
+    """The text a dense retriever embeds for a document: its indexed fields joined by spaces."""
+    return " ".join(str(document.get(field, "")) for field in on)
+
+
+def build_projection(documents, on, encode_documents, encode_queries, dim, method="pca", normalize=True, seed=0):
+    """
+    Fit a projection on a sample of the corpus and log the recall it keeps against full-width search.
+
+    CHECK_QUERIES sampled documents are held out and encoded with encode_queries as stand-in queries; the rest
+    of the sample is encoded with encode_documents, fitted on and searched at both widths.
+
+    :return: The fitted Projection (holding the sample's full-width embeddings in sample_embeddings), or None when
+        dim leaves nothing to reduce or the corpus is too small to fit it.
+    """
+    sample = random.Random(seed).sample(documents, min(SAMPLE_SIZE, len(documents)))
+    texts = [document_text(document, on) for document in sample]
+    query_texts, sample_texts = texts[:CHECK_QUERIES], texts[CHECK_QUERIES:]
+    if len(sample_texts) < (dim if method == "pca" else CHECK_K):
+        logging.warning(f"Keeping full-width embeddings: {len(documents)} documents are too few to fit a "
+                        f"{dim}-dimension projection")
+        return None
+    embeddings = np.asarray(encode_documents(sample_texts), dtype=np.float32)
+    width = embeddings.shape[1]
+    if dim >= width:
+        logging.warning(f"Keeping full-width embeddings: projection to {dim} dimensions does not reduce {width}")
+        return None
+    projection = Projection(dim, method).fit(embeddings)
+    projection.sample_embeddings = dict(zip((text_digest(text) for text in sample_texts), embeddings))
+    recall = projection.check_recall(embeddings, encode_queries(query_texts), normalize=normalize)
+    retained = f", {projection.retained:.1%} of the energy kept" if projection.retained is not None else ""
+    logging.log(logging.INFO if recall >= MIN_RECALL else logging.WARNING,
+                f"Embeddings projected {width} -> {dim} dimensions ({method}{retained}): recall@{CHECK_K} "
+                f"{recall:.3f} (loss {1 - recall:.3f}) against full-width search over {len(sample_texts)} "
+                f"sampled documents")
+    return projection
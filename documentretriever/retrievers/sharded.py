@@ -0,0 +1,182 @@
+import heapq
+import logging
+import math
+import multiprocessing
+import os
+from collections import defaultdict
+from itertools import chain
+
+from .deadline import DeadlineExceeded
+
+
+def folder_of(document):
+    """Top-level folder (tender) of a processed document, taken from its relative "source" path."""
+    folder = os.path.dirname(document.get("source", "")).split(os.sep)[0]
+    return folder or "."
+
+
+def partition(documents, num_shards=None, by=None, max_shard_size=None):
+    """
+    Split documents into shards.
+
+    :param num_shards: Number of shards (default: one per CPU, never more than there are documents).
+    :param by: None to split by size, "folder" to keep each source folder in one shard, or the name of a
+        document field to group on. Groups are spread over the shards largest first.
+    :param max_shard_size: When splitting by size, the largest shard allowed; raises num_shards as needed.
+    """
+    if not documents:
+        return []
+    num_shards = num_shards or os.cpu_count() or 1
+    if max_shard_size:
+        num_shards = max(num_shards, math.ceil(len(documents) / max_shard_size))
+    num_shards = max(1, min(num_shards, len(documents)))
+
+    if by is None:
+        size = math.ceil(len(documents) / num_shards)
+        return [documents[start:start + size] for start in range(0, len(documents), size)]
+
+    groups = defaultdict(list)
+    for document in documents:
+        groups[folder_of(document) if by == "folder" else document.get(by)].append(document)
+    shards = [[] for _ in range(min(num_shards, len(groups)))]
+    for group in sorted(groups.values(), key=len, reverse=True):
+        min(shards, key=len).extend(group)
+    return shards
+
+
+def _shard_worker(connection, documents, method, deadline):
+    """Build one shard's index and answer commands from the parent until it closes the pipe."""
+    from .main import build_retriever  # Imported here: main imports this module
+
+    try:
+        retriever = build_retriever(documents, method, deadline=deadline)
+    except DeadlineExceeded as e:
+        connection.send(("deadline", str(e)))
+        return
+    except Exception as e:
+        connection.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    connection.send(("ok", retriever.partial))
+
+    while True:
+        try:
+            command, payload = connection.recv()
+        except EOFError:
+            break
+        if command == "close":
+            break
+        try:
+            if command == "retrieve":
+                queries, k = payload
+                results = retriever.retrieve(queries, k=k)
+                reply = results if results and isinstance(results[0], list) else [results]
+            elif command == "upsert":
+                reply = retriever.upsert(payload)
+            elif command == "delete":
+                reply = retriever.delete(payload)
+            else:
+                raise ValueError(f"Unknown shard command: {command}")
+            connection.send(("ok", reply))
+        except Exception as e:
+            connection.send(("error", f"{type(e).__name__}: {e}"))
+    connection.close()
+
+
+class ShardedRetriever:
+    def __init__(self, documents, method, num_shards=None, by=None, max_shard_size=None, deadline=None, key="id"):
+        """
+        Retriever over independently built shard indexes, one process per shard.
+
+        Shards build their indexes in parallel; queries are sent to every shard at once and the per-shard
+        top k lists are merged with a heap. Dense similarities are comparable across shards; lexical scores
+        (BM25, TF-IDF) use per-shard term statistics, so merged lexical rankings are approximate.
+
+        :param documents: Processed documents.
+        :param method: Retrieval method built in every shard (see retrievers.main.build_retriever).
+        :param num_shards, by, max_shard_size: How the corpus is split; see partition().
+        :param deadline: Optional Deadline shared by all shard builds.
+        :param key: Document identifier field, used to route upserts and deletes.
+        """
+        self.method = method
+        self.key = key
+        shards = partition(documents, num_shards=num_shards, by=by, max_shard_size=max_shard_size)
+        self.sizes = [len(shard) for shard in shards]
+        self.owner = {document[key]: i for i, shard in enumerate(shards) for document in shard}
+        context = multiprocessing.get_context("spawn")  # Forking a process that holds torch/faiss threads is unsafe
+        self.connections, self.processes = [], []
+        for shard in shards:
+            parent, child = context.Pipe()
+            process = context.Process(target=_shard_worker, args=(child, shard, method, deadline), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+        logging.info(f"Building {len(shards)} {method} shards of sizes {self.sizes}")
+        try:
+            self.partial = any(self._gather(self.connections))
+        except Exception:
+            self.close()
+            raise
+
+    def _gather(self, connections):
+        """Collect one reply per connection; every reply is read before failing so the pipes stay in step."""
+        replies = [connection.recv() for connection in connections]
+        for status, payload in replies:
+            if status == "deadline":
+                raise DeadlineExceeded(payload)
+            if status != "ok":
+                raise RuntimeError(f"Shard failed: {payload}")
+        return [payload for _, payload in replies]
+
+    def retrieve(self, query, k=10):
+        """Scatter the query to every shard and merge the shard top k lists into the global top k."""
+        queries = [query] if isinstance(query, str) else query
+        for connection in self.connections:
+            connection.send(("retrieve", (queries, k)))
+        shard_results = self._gather(self.connections) or [[[] for _ in queries]]  # No shards for an empty corpus
+        results = [heapq.nlargest(k, chain.from_iterable(per_query), key=lambda hit: hit["similarity"])
+                   for per_query in zip(*shard_results)]
+        return results[0] if isinstance(query, str) else results
+
+    def upsert(self, documents):
+        """Replace documents in the shard that holds them; new documents go to the smallest shard."""
+        routed = defaultdict(list)
+        for document in documents:
+            if document[self.key] not in self.owner:
+                shard = min(range(len(self.sizes)), key=self.sizes.__getitem__)
+                self.sizes[shard] += 1
+                self.owner[document[self.key]] = shard
+            routed[self.owner[document[self.key]]].append(document)
+        for shard, shard_documents in routed.items():
+            self.connections[shard].send(("upsert", shard_documents))
+        self._gather([self.connections[shard] for shard in routed])
+
+    def delete(self, ids):
+        routed = defaultdict(list)
+        for doc_id in ids:
+            if doc_id in self.owner:
+                shard = self.owner.pop(doc_id)
+                self.sizes[shard] -= 1
+                routed[shard].append(doc_id)
+        for shard, shard_ids in routed.items():
+            self.connections[shard].send(("delete", shard_ids))
+        return sum(self._gather([self.connections[shard] for shard in routed]))
+
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.send(("close", None))
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.connections, self.processes = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
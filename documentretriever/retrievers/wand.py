@@ -0,0 +1,201 @@
+import math
+from collections import Counter
+
+import numpy as np
+
+from .positional import tokenize
+
+BLOCK_SIZE = 128  # Postings per block; each block stores the highest impact inside it
+# A binary-search lookup costs about this many sequential posting updates; beyond that, scanning is cheaper
+LOOKUP_COST = 16
+
+
+class TopKIndex:
+    def __init__(self, documents, key, on, scoring="bm25", k1=1.5, b=0.75):
+        """
+        Impact-ordered inverted index with dynamic pruning for top-k BM25 / TF-IDF retrieval.
+
+        Every posting stores its precomputed impact (BM25 term-frequency component times idf, or the
+        L2-normalised TF-IDF weight), so a document's score is the sum of query weight x impact over the
+        query terms. Postings are cut into blocks of BLOCK_SIZE with the maximum impact of each block,
+        and every term keeps its global maximum: the upper bounds that let search() skip documents that
+        cannot reach the top k (see top_k).
+
+        :param key: Document field returned as the result key.
+        :param on: Fields indexed as the document text.
+        :param scoring: "bm25" or "tfidf".
+        """
+        if scoring not in ("bm25", "tfidf"):
+            raise ValueError(f"Unknown scoring {scoring!r}; choose bm25 or tfidf")
+        self.key = key
+        self.on = on
+        self.scoring = scoring
+        self.keys = [document[key] for document in documents]
+        self.num_documents = len(documents)
+
+        counts = [Counter(tokenize(" ".join(str(document.get(field, "")) for field in on))) for document in documents]
+        lengths = np.array([sum(count.values()) for count in counts], dtype=np.float64)
+        self.vocabulary = {}
+        postings = []
+        for row, count in enumerate(counts):
+            for term, tf in count.items():
+                postings.append((self.vocabulary.setdefault(term, len(self.vocabulary)), row, tf))
+        postings = np.array(postings, dtype=np.int64).reshape(-1, 3)
+        order = np.lexsort((postings[:, 1], postings[:, 0]))  # By term, then row
+        terms, rows, frequencies = postings[order].T
+        self.offsets = np.searchsorted(terms, np.arange(len(self.vocabulary) + 1))
+        self.rows = rows.astype(np.int32)
+        document_frequency = np.diff(self.offsets)
+
+        if scoring == "bm25":
+            self.idf = np.log(1 + (self.num_documents - document_frequency + 0.5) / (document_frequency + 0.5))
+            average_length = lengths.mean() if len(lengths) else 0.0
+            norm = k1 * (1 - b + b * lengths[rows] / max(average_length, 1e-9))
+            impacts = self.idf[terms] * frequencies * (k1 + 1) / (frequencies + norm)
+        else:
+            self.idf = np.log((1 + self.num_documents) / (1 + document_frequency)) + 1
+            weights = frequencies * self.idf[terms]
+            norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=self.num_documents))
+            impacts = weights / np.maximum(norms[rows], 1e-12)
+        self.impacts = impacts.astype(np.float32)
+
+        # Block bounds: first/last row and highest impact of every block of every term
+        block_starts = [np.arange(start, end, BLOCK_SIZE) for start, end in zip(self.offsets[:-1], self.offsets[1:])]
+        self.block_offsets = np.cumsum([0] + [len(starts) for starts in block_starts])
+        block_starts = np.concatenate(block_starts) if block_starts else np.zeros(0, dtype=np.int64)
+        block_ends = np.minimum(block_starts + BLOCK_SIZE, np.repeat(self.offsets[1:], np.diff(self.block_offsets)))
+        self.block_first = self.rows[block_starts]
+        self.block_last = self.rows[block_ends - 1]
+        self.block_max = (np.maximum.reduceat(self.impacts, block_starts) if len(block_starts)
+                          else np.zeros(0, dtype=np.float32))
+        self.term_max = np.array([self.block_max[start:end].max() if end > start else 0.0
+                                  for start, end in zip(self.block_offsets[:-1], self.block_offsets[1:])])
+        self.stats = {"postings_scored": 0, "postings_total": 0}
+
+    def query_weights(self, text):
+        """{term id: weight} for a query; unknown terms are dropped."""
+        counts = Counter(term for term in tokenize(text) if term in self.vocabulary)
+        if self.scoring == "bm25":
+            return {self.vocabulary[term]: float(count) for term, count in counts.items()}
+        weights = {self.vocabulary[term]: count * self.idf[self.vocabulary[term]] for term, count in counts.items()}
+        norm = math.sqrt(sum(weight ** 2 for weight in weights.values())) or 1.0
+        return {term: weight / norm for term, weight in weights.items()}
+
+    def _postings(self, term):
+        start, end = self.offsets[term], self.offsets[term + 1]
+        return self.rows[start:end], self.impacts[start:end]
+
+    def _block_bound(self, term, candidates):
+        """Per candidate, the highest impact of the block of term that could contain it (0 if none can)."""
+        start, end = self.block_offsets[term], self.block_offsets[term + 1]
+        block = np.searchsorted(self.block_last[start:end], candidates)
+        inside = block < end - start
+        block = np.minimum(block, end - start - 1)
+        inside &= self.block_first[start:end][block] <= candidates
+        return np.where(inside, self.block_max[start:end][block], 0.0)
+
+    def score_all(self, weights, k):
+        """Exhaustive top k: every posting of every query term is scored. The reference for exactness checks."""
+        scores = np.zeros(self.num_documents)
+        for term, weight in weights.items():
+            rows, impacts = self._postings(term)
+            scores[rows] += weight * impacts
+        touched = np.flatnonzero(scores)
+        top = touched[np.argsort(-scores[touched], kind="stable")[:k]]
+        return top, scores[top]
+
+    def top_k(self, weights, k):
+        """
+        Exact top k with MaxScore-style pruning and block-max bounds, term at a time.
+
+        Terms are visited by decreasing upper bound. While the upper bounds of the terms not yet visited can
+        still lift an unseen document above the current k-th score, a term's postings are all scored. After
+        that, only the documents already collected can make the top k: each term first drops the candidates
+        that cannot reach the k-th score even with the block maximum of this term and the global maxima of the
+        later ones, then looks the survivors up in its postings instead of scanning them (or scans when there
+        are too many survivors for lookups to pay off).
+        """
+        terms = sorted(weights, key=lambda term: -weights[term] * self.term_max[term])
+        bounds = np.array([weights[term] * self.term_max[term] for term in terms])
+        remaining = np.concatenate([np.cumsum(bounds[::-1])[::-1], [0.0]])
+        accumulator = np.zeros(self.num_documents)
+        is_leader = np.zeros(self.num_documents, dtype=bool)
+        leaders = np.zeros(0, dtype=np.int64)  # Rows holding the k best partial scores so far
+        threshold = -np.inf  # k-th best partial score; scores only grow, so it is a lower bound of the final one
+        candidates = None
+        for i, term in enumerate(terms):
+            rows, impacts = self._postings(term)
+            weight = weights[term]
+            self.stats["postings_total"] += len(rows)
+            if candidates is None and remaining[i] > threshold:
+                # An unseen document could still enter the top k: score every posting of this term
+                accumulator[rows] += weight * impacts
+                self.stats["postings_scored"] += len(rows)
+                pool = np.concatenate([leaders, rows[~is_leader[rows]]])
+                if len(pool) >= k:
+                    is_leader[leaders] = False
+                    leaders = pool[np.argpartition(-accumulator[pool], k - 1)[:k]]
+                    is_leader[leaders] = True
+                    threshold = accumulator[leaders].min()
+                continue
+            if candidates is None:
+                # Only the documents collected so far can make the top k
+                candidates = np.flatnonzero(accumulator)
+                scores = accumulator[candidates]
+            keep = scores + remaining[i] >= threshold
+            candidates, scores = candidates[keep], scores[keep]
+            if len(candidates) * LOOKUP_COST >= len(rows):
+                accumulator[rows] += weight * impacts
+                scores = accumulator[candidates]
+                self.stats["postings_scored"] += len(rows)
+            else:
+                keep = scores + weight * self._block_bound(term, candidates) + remaining[i + 1] >= threshold
+                candidates, scores = candidates[keep], scores[keep]
+                position = np.searchsorted(rows, candidates)
+                found = position < len(rows)
+                found[found] = rows[position[found]] == candidates[found]
+                gained = weight * impacts[position[found]]
+                scores[found] += gained
+                accumulator[candidates[found]] += gained
+                self.stats["postings_scored"] += int(found.sum())
+            if len(scores) >= k:
+                threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        if candidates is None:
+            candidates = np.flatnonzero(accumulator)
+            scores = accumulator[candidates]
+        top = np.argsort(-scores, kind="stable")[:k]
+        return candidates[top], scores[top]
+
+    def search(self, queries, k=10, exhaustive=False):
+        """Top k per query as [{key: ..., "similarity": score}]."""
+        results = []
+        for query in queries:
+            weights = self.query_weights(query)
+            rows, scores = self.score_all(weights, k) if exhaustive else self.top_k(weights, k)
+            results.append([{self.key: self.keys[row], "similarity": float(score)} for row, score in zip(rows, scores)])
+        return results
+
+    def __call__(self, q, k=10):
+        return self.search([q] if isinstance(q, str) else q, k=k)
+
+
+def check_exactness(index, queries, k=10, tolerance=1e-5):
+    """
+    Compare pruned and exhaustive top k for every query.
+
+    Returns the queries whose top k scores differ (ties at the k-th score may legitimately swap documents, so
+    documents are compared only above the k-th score).
+    """
+    mismatches = []
+    for query in queries:
+        weights = index.query_weights(query)
+        rows, scores = index.top_k(weights, k)
+        reference_rows, reference_scores = index.score_all(weights, k)
+        if len(scores) != len(reference_scores) or not np.allclose(scores, reference_scores, atol=tolerance):
+            mismatches.append(query)
+            continue
+        if len(scores):
+            above = reference_scores > reference_scores[-1] + tolerance
+            if set(rows[scores > reference_scores[-1] + tolerance]) != set(reference_rows[above]):
+                mismatches.append(query)
+    return mismatches
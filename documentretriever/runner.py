@@ -1,4 +1,5 @@
 from documentretriever.retrievers.main import retrieve
+from documentretriever.retrievers.deadline import Deadline
 import logging
 
 # Set up logging
@@ -7,7 +8,9 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 def main(args):
     """Main function to handle the document retrieval."""
     try:
-        results = retrieve(args['processed_docs_path'], args['query'], args['method'], args['k'])
+        deadline = Deadline(args['deadline']) if args.get('deadline') else None
+        results = retrieve(args['processed_docs_path'], args['query'], args['method'], args['k'], deadline=deadline,
+                           shards=args.get('shards'), shard_by=args.get('shard_by'), filters=args.get('filter'))
         return results
     except Exception as e:
         logging.error(f"Error in document retrieval: {str(e)}")
@@ -20,5 +23,10 @@ if __name__ == "__main__":
     parser.add_argument("query", help="Query for document retrieval.")
     parser.add_argument("method", choices=["bm25", "dpr", "encoder"], help="Retrieval method.")
     parser.add_argument("k", type=int, help="Number of results to retrieve.")
+    parser.add_argument("--deadline", type=float, default=None, help="Per-request deadline in seconds.")
+    parser.add_argument("--shards", type=int, default=None, help="Split the corpus into this many parallel indexes.")
+    parser.add_argument("--shard_by", default=None, help='Shard on "folder" (or a document field) instead of by size.')
+    parser.add_argument("--filter", default=None,
+                        help='Metadata filter, e.g. "folder=Tender A;doc_type=pdf,docx;modified>=2024-01-01".')
     args = parser.parse_args()
     main(vars(args))
@@ -9,7 +9,7 @@ from datetime import datetime
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def save_files_to_timestamped_folder(folder_path):
+def make_destination_folder():
     # Create the main "all_files" folder if it doesn't exist
     main_folder = "all_files"
     os.makedirs(main_folder, exist_ok=True)
@@ -35,7 +35,10 @@ def save_files_to_timestamped_folder(folder_path):
     
     if retry_count == max_retries:
         raise RuntimeError(f"Failed to create a unique destination folder after {max_retries} attempts")
+    return destination_folder
 
+def iter_copied_files(folder_path, destination_folder):
+    """Copy every file under folder_path into destination_folder, yielding each destination path once copied."""
     # Walk through the provided folder path and save each file
     for root, _, files in os.walk(folder_path):
         for file_name in files:
@@ -52,7 +55,13 @@ def save_files_to_timestamped_folder(folder_path):
                 logging.info(f"Copied file: {file_path} to {destination_path}")
             except Exception as e:
                 logging.error(f"Error copying file {file_path}: {str(e)}")
+                continue
+            yield destination_path
 
+def save_files_to_timestamped_folder(folder_path):
+    destination_folder = make_destination_folder()
+    for _ in iter_copied_files(folder_path, destination_folder):
+        pass
     return destination_folder
 
 def main():
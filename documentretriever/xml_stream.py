@@ -0,0 +1,164 @@
+import zipfile
+import xml.etree.ElementTree as ET
+
+# OpenDocument (content.xml) tags
+ODF_OFFICE = "urn:oasis:names:tc:opendocument:xmlns:office:1.0"
+ODF_TEXT = "urn:oasis:names:tc:opendocument:xmlns:text:1.0"
+ODF_TABLE = "urn:oasis:names:tc:opendocument:xmlns:table:1.0"
+ODT_BODY = f"{{{ODF_OFFICE}}}text"
+ODT_PARAGRAPH = f"{{{ODF_TEXT}}}p"
+ODT_SPACE = f"{{{ODF_TEXT}}}s"
+ODT_TAB = f"{{{ODF_TEXT}}}tab"
+ODT_LINE_BREAK = f"{{{ODF_TEXT}}}line-break"
+ODT_TABLE = f"{{{ODF_TABLE}}}table"
+ODT_ROW = f"{{{ODF_TABLE}}}table-row"
+ODT_CELL = f"{{{ODF_TABLE}}}table-cell"
+
+# WordprocessingML (word/document.xml) tags
+WORD = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+DOCX_BODY = f"{{{WORD}}}body"
+DOCX_PARAGRAPH = f"{{{WORD}}}p"
+DOCX_TEXT = f"{{{WORD}}}t"
+DOCX_TAB = f"{{{WORD}}}tab"
+DOCX_BREAKS = {f"{{{WORD}}}br", f"{{{WORD}}}cr"}
+DOCX_TABLE = f"{{{WORD}}}tbl"
+DOCX_ROW = f"{{{WORD}}}tr"
+DOCX_CELL = f"{{{WORD}}}tc"
+
+
+def _iterparse_member(path, member):
+    """
+    Stream (event, element, parent) tuples from one XML file inside a zip archive.
+
+    The caller is expected to detach finished elements from their parent so the tree never grows.
+    """
+    with zipfile.ZipFile(path) as archive, archive.open(member) as xml_file:
+        stack = []
+        for event, elem in ET.iterparse(xml_file, events=("start", "end")):
+            if event == "start":
+                stack.append(elem)
+                yield event, elem, stack[-2] if len(stack) > 1 else None
+            else:
+                stack.pop()
+                yield event, elem, stack[-1] if stack else None
+
+
+def _odt_text(elem):
+    """Text of an ODF paragraph, expanding <text:s>, <text:tab> and <text:line-break>."""
+    parts = [elem.text or '']
+    for child in elem:
+        if child.tag == ODT_SPACE:
+            parts.append(' ' * int(child.get(f"{{{ODF_TEXT}}}c", 1)))
+        elif child.tag == ODT_TAB:
+            parts.append('\t')
+        elif child.tag == ODT_LINE_BREAK:
+            parts.append('\n')
+        else:
+            parts.append(_odt_text(child))
+        parts.append(child.tail or '')
+    return ''.join(parts)
+
+
+def _docx_text(elem):
+    """Text of a WordprocessingML paragraph the way python-docx reports it (runs, tabs and breaks)."""
+    parts = []
+    for node in elem.iter():
+        if node.tag == DOCX_TEXT:
+            parts.append(node.text or '')
+        elif node.tag == DOCX_TAB:
+            parts.append('\t')
+        elif node.tag in DOCX_BREAKS:
+            parts.append('\n')
+    return ''.join(parts)
+
+
+def iter_odt(path):
+    """
+    Yield ("paragraph", text) for every <text:p> and ("table", rows) for every table of an ODT file.
+
+    Paragraphs inside tables are yielded too (like odfpy's getElementsByType(P)); a cell's text is the
+    concatenation of its paragraphs. Memory stays constant because finished elements are dropped.
+    """
+    tables = []  # Stack of tables being read: each is {"rows": [...], "row": [...], "cell": [...]}
+    for event, elem, parent in _iterparse_member(path, "content.xml"):
+        tag = elem.tag
+        if event == "start":
+            if tag == ODT_TABLE:
+                tables.append({"rows": [], "row": None, "cell": None})
+            elif tables and tag == ODT_ROW:
+                tables[-1]["row"] = []
+            elif tables and tag == ODT_CELL:
+                tables[-1]["cell"] = []
+            continue
+
+        if tag == ODT_PARAGRAPH:
+            text = _odt_text(elem)
+            if tables and tables[-1]["cell"] is not None:
+                tables[-1]["cell"].append(text)
+            yield "paragraph", text
+        elif tables and tag == ODT_CELL:
+            tables[-1]["row"].append(''.join(tables[-1]["cell"]))
+            tables[-1]["cell"] = None
+        elif tables and tag == ODT_ROW:
+            tables[-1]["rows"].append(tables[-1]["row"])
+            tables[-1]["row"] = None
+        elif tag == ODT_TABLE:
+            yield "table", tables.pop()["rows"]
+        elif parent is None or parent.tag != ODT_BODY:
+            continue
+        if parent is not None:
+            parent.remove(elem)
+
+
+def iter_docx(path):
+    """
+    Yield ("paragraph", text) for every body-level paragraph and ("table", rows) for every table of a DOCX file.
+
+    Matches python-docx: Document.paragraphs excludes paragraphs inside tables, and a cell's text is its
+    paragraphs joined by newlines. Memory stays constant because finished elements are dropped.
+    """
+    tables = []
+    for event, elem, parent in _iterparse_member(path, "word/document.xml"):
+        tag = elem.tag
+        if event == "start":
+            if tag == DOCX_TABLE:
+                tables.append({"rows": [], "row": None, "cell": None})
+            elif tables and tag == DOCX_ROW:
+                tables[-1]["row"] = []
+            elif tables and tag == DOCX_CELL:
+                tables[-1]["cell"] = []
+            continue
+
+        if tag == DOCX_PARAGRAPH:
+            if tables and tables[-1]["cell"] is not None:
+                tables[-1]["cell"].append(_docx_text(elem))
+            elif parent is not None and parent.tag == DOCX_BODY:
+                yield "paragraph", _docx_text(elem)
+        elif tables and tag == DOCX_CELL:
+            tables[-1]["row"].append('\n'.join(tables[-1]["cell"]))
+            tables[-1]["cell"] = None
+        elif tables and tag == DOCX_ROW:
+            tables[-1]["rows"].append(tables[-1]["row"])
+            tables[-1]["row"] = None
+        elif tag == DOCX_TABLE:
+            yield "table", tables.pop()["rows"]
+        elif parent is None or parent.tag != DOCX_BODY:
+            continue
+        if parent is not None:
+            parent.remove(elem)
+
+
+def iter_paragraphs(path):
+    """Yield the paragraph texts of an ODT or DOCX file."""
+    reader = iter_odt if path.endswith('.odt') else iter_docx
+    for kind, value in reader(path):
+        if kind == "paragraph":
+            yield value
+
+
+def iter_tables(path):
+    """Yield the tables (lists of rows of cell strings) of an ODT or DOCX file."""
+    reader = iter_odt if path.endswith('.odt') else iter_docx
+    for kind, value in reader(path):
+        if kind == "table":
+            yield value
@@ -1,5 +1,5 @@
 import os
-import sys
+import argparse
 import subprocess
 
 def run_script(script_name, *args):
@@ -25,11 +25,22 @@ def process_all_documents(tenderdocs):
     
     return json_output_path
 
+def process_all_documents_pipelined(tenderdocs, *pipeline_args):
+    # Copy, extract, chunk, embed and index run concurrently instead of one phase after the other
+    pipeline_output = run_script('pipeline', tenderdocs, *pipeline_args)
+    return extract_path(pipeline_output, "Files have been saved to")
+
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python initial_processor.py <path_to_tenderdocs>")
-        sys.exit(1)
-    
-    tenderdocs = sys.argv[1]
-    processed_docs_path = process_all_documents(tenderdocs)
+    parser = argparse.ArgumentParser(description="Upload and extract tender documents.")
+    parser.add_argument('tenderdocs', help="Path to the tender documents")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Stream files through copy/extract/chunk/embed stages (see documentretriever/pipeline.py)")
+    args, pipeline_args = parser.parse_known_args()
+    if pipeline_args and not args.pipeline:
+        parser.error(f"unrecognized arguments: {' '.join(pipeline_args)}")
+
+    if args.pipeline:
+        processed_docs_path = process_all_documents_pipelined(args.tenderdocs, *pipeline_args)
+    else:
+        processed_docs_path = process_all_documents(args.tenderdocs)
     print(f"All documents processed. Output saved to: {processed_docs_path}")
@@ -0,0 +1,51 @@
+import os
+import sys
+import time
+import random
+import argparse
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'documentretriever'))
+from textnorm import format_frame
+from runner import advanced_format_text
+
+def synthetic_frame(rows, seed=0):
+    """Two text columns that look like letter-spaced OCR output with missing punctuation spacing."""
+    rng = random.Random(seed)
+    words = ["Contractor", "shall", "provide", "the", "Services", "in", "accordance", "with", "Clause", "4.2,",
+             "Payment", "terms.", "Authority", "may", "terminate", "this", "Agreement!", "insurance", "cover"]
+
+    def cell():
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(3, 30)))
+        return " ".join(text) if rng.random() < 0.3 else text  # Letter-spaced like the stream tables
+    return pd.DataFrame({"Clause": [cell() for _ in range(rows)], "Response": [cell() for _ in range(rows)]})
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched text normalization against advanced_format_text.")
+    parser.add_argument('--input', default=None, help="ODS/XLSX file to benchmark on (default: synthetic data)")
+    parser.add_argument('--rows', type=int, default=50000, help="Rows of synthetic data")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = pd.read_excel(args.input, engine="odf" if args.input.endswith('.ods') else None) if args.input else synthetic_frame(args.rows)
+    cells = df.size
+
+    elementwise = df.map if hasattr(df, 'map') else df.applymap  # applymap was renamed to map in pandas 2.1
+    timings = {}
+    for name, run in [("applymap(advanced_format_text)", lambda: elementwise(advanced_format_text)),
+                      ("format_frame", lambda: format_frame(df))]:
+        best = float('inf')
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = run()
+            best = min(best, time.perf_counter() - started)
+        timings[name] = (best, result)
+
+    legacy = timings["applymap(advanced_format_text)"][1]
+    batched = timings["format_frame"][1]
+    print(f"{cells} cells; identical output: {legacy.equals(batched)}")
+    for name, (seconds, _) in timings.items():
+        print(f"{name:<34}{seconds:>8.3f}s {cells / seconds:>12.0f} cells/s")
+
+if __name__ == "__main__":
+    main()
@@ -4,18 +4,38 @@ pip uninstall camelot-py
 pip install camelot-py[cv]
 pip install PyPDF2==1.26.0
 pip install xlsxwriter
+pip install pyarrow
 
 '''
 
 import os
 import re
+import sys
+import json
+import hashlib
+import argparse
 import pandas as pd
 import camelot
 import csv
-from odf.opendocument import load
-from odf.table import Table, TableRow, TableCell
-from odf.text import P
+import xlsxwriter
 from collections import defaultdict  # Import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PyPDF2 import PdfFileReader
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'documentretriever'))
+from xml_stream import iter_tables
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Only needed for the streaming Parquet grouping
+    pa = None
+    pq = None
+
+try:
+    import pdfplumber  # Used to spot ruled tables per page; without it each page tries stream and then lattice
+except ImportError:
+    pdfplumber = None
 
 # Get the current PATH
 current_path = os.environ.get('PATH', '')
@@ -33,30 +53,13 @@ def sanitize_filename(filename):
 
 
 def extract_tables_from_odt(odt_path, output_folder):
-    # Load the ODT file
-    doc = load(odt_path)
     sanitized_name = sanitize_filename(os.path.splitext(os.path.basename(odt_path))[0])
-    
-    # Iterate through the elements in the document
-    for element in doc.getElementsByType(Table):
+
+    # Stream the tables out of content.xml one at a time instead of loading the full odfpy DOM
+    for table_index, table_data in enumerate(iter_tables(odt_path), 1):
         print(f"Extracting table from {odt_path}")
-        table_data = []
-        for row in element.getElementsByType(TableRow):
-            row_data = []
-            for cell in row.getElementsByType(TableCell):
-                cell_text = ""
-                for paragraph in cell.getElementsByType(P):
-                    # Iterate through child nodes of the paragraph
-                    for node in paragraph.childNodes:
-                        if node.nodeType == 3:  # Node is a text node
-                            cell_text += node.data
-                        elif node.nodeType == 1:  # Node is an element node
-                            cell_text += ''.join(child.data for child in node.childNodes if child.nodeType == 3)
-                row_data.append(cell_text)
-            table_data.append(row_data)
-        
+
         # Save the table as CSV
-        table_index = doc.getElementsByType(Table).index(element) + 1
         output_file = os.path.join(output_folder, f'{sanitized_name}_table_odt_{table_index}.csv')
         with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
             writer = csv.writer(csvfile)
@@ -93,6 +96,126 @@ def extract_tables_from_pdf(pdf_path, output_folder):
             print(f"Failed to extract tables from {pdf_path} using both stream and lattice methods. Error: {str(e)}")
 
 
+# Ruling lines/rectangles on a page above which the page is parsed with the lattice flavor
+LATTICE_RULING_THRESHOLD = 4
+
+
+def file_hash(path):
+    """SHA-1 of a file's content, used to key the per-page table cache."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def count_pdf_pages(pdf_path):
+    with open(pdf_path, 'rb') as f:
+        return PdfFileReader(f, strict=False).getNumPages()
+
+
+def detect_flavor(pdf_path, page_number):
+    """Pick the camelot flavor for one page: lattice for ruled tables, stream otherwise (None if unknown)."""
+    if pdfplumber is None:
+        return None
+    with pdfplumber.open(pdf_path, pages=[page_number]) as pdf:
+        page = pdf.pages[0]
+        rulings = len(page.lines) + len(page.rects)
+    return 'lattice' if rulings >= LATTICE_RULING_THRESHOLD else 'stream'
+
+
+def stream_table_rows(table):
+    """Rows written for a stream table: the header row and every column's remaining cells concatenated."""
+    headers = table.df.iloc[0].tolist()
+    concatenated_row = [' '.join(table.df[col].iloc[1:].str.cat(sep='')) for col in table.df.columns]
+    return [headers, concatenated_row]
+
+
+def extract_page_tables(pdf_path, page_number):
+    """
+    Extract the tables of a single PDF page, parsing the page once with the flavor that applies.
+
+    Returns a list of {"flavor", "rows"} dictionaries.
+    """
+    flavor = detect_flavor(pdf_path, page_number)
+    if flavor in (None, 'stream'):
+        try:
+            tables = camelot.read_pdf(pdf_path, pages=str(page_number), flavor='stream')
+            return [{"flavor": "stream", "rows": stream_table_rows(table)} for table in tables]
+        except IndexError:
+            pass  # Same fallback as extract_tables_from_pdf, limited to this page
+    tables = camelot.read_pdf(pdf_path, pages=str(page_number), flavor='lattice')
+    return [{"flavor": "lattice", "rows": table.df.values.tolist()} for table in tables]
+
+
+def write_page_tables(pdf_path, page_number, tables, output_folder):
+    sanitized_name = sanitize_filename(os.path.splitext(os.path.basename(pdf_path))[0])
+    for i, table in enumerate(tables):
+        output_file = os.path.join(output_folder, f'{sanitized_name}_table_{table["flavor"]}_p{page_number}_{i+1}.csv')
+        quoting = csv.QUOTE_ALL if table["flavor"] == 'lattice' else csv.QUOTE_MINIMAL  # Matches camelot's to_csv
+        with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile, quoting=quoting)
+            writer.writerows(table["rows"])
+        print(f"Table {i+1} on page {page_number} of {pdf_path} ({table['flavor']}) saved as {output_file}.")
+
+
+def plan_pdf(pdf_path):
+    return pdf_path, file_hash(pdf_path), count_pdf_pages(pdf_path)
+
+
+def process_folder_parallel(folder_path, output_folder, workers=None, cache_dir=None):
+    """
+    Extract tables from every PDF (per page, across a process pool) and ODT file under folder_path.
+
+    Page results are cached as JSON under cache_dir keyed by file hash and page number, so re-runs and
+    resumed runs only parse pages that have not been seen before, even if files were moved or renamed.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    cache_dir = cache_dir or os.path.join(output_folder, '.table_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+
+    pdf_outputs = {}
+    for root, _, files in os.walk(folder_path):
+        for file in files:
+            file_path = os.path.join(root, file)
+            relative_path = os.path.relpath(file_path, folder_path)
+            output_subfolder = os.path.join(output_folder, os.path.dirname(relative_path))
+            os.makedirs(output_subfolder, exist_ok=True)
+            if file.endswith('.odt'):
+                extract_tables_from_odt(file_path, output_subfolder)
+            elif file.endswith('.pdf'):
+                pdf_outputs[file_path] = output_subfolder
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        page_tasks = {}
+        plan_tasks = {executor.submit(plan_pdf, path): path for path in pdf_outputs}
+        for future in as_completed(plan_tasks):
+            try:
+                pdf_path, digest, num_pages = future.result()
+            except Exception as e:
+                print(f"Failed to read {plan_tasks[future]}: {str(e)}")
+                continue
+            for page_number in range(1, num_pages + 1):
+                cache_file = os.path.join(cache_dir, f'{digest}_p{page_number}.json')
+                if os.path.exists(cache_file):
+                    with open(cache_file, 'r', encoding='utf-8') as f:
+                        write_page_tables(pdf_path, page_number, json.load(f), pdf_outputs[pdf_path])
+                else:
+                    page_future = executor.submit(extract_page_tables, pdf_path, page_number)
+                    page_tasks[page_future] = (pdf_path, page_number, cache_file)
+
+        for future in as_completed(page_tasks):
+            pdf_path, page_number, cache_file = page_tasks[future]
+            try:
+                tables = future.result()
+            except Exception as e:
+                print(f"Failed to extract tables from page {page_number} of {pdf_path}. Error: {str(e)}")
+                continue
+            with open(cache_file, 'w', encoding='utf-8') as f:
+                json.dump(tables, f)
+            write_page_tables(pdf_path, page_number, tables, pdf_outputs[pdf_path])
+
+
 def process_folder(folder_path, output_folder):
     # Create the output directory if it doesn't exist
     os.makedirs(output_folder, exist_ok=True)
@@ -139,6 +262,81 @@ def find_and_group_csv_files(folder_path):
     return grouped_dataframes
 
 
+def stream_group_csv_files(folder_path, dataset_folder, row_group_size=50000):
+    """
+    Append every CSV under folder_path to a Parquet file per column count, one file at a time.
+
+    Only a bounded buffer (at most row_group_size rows per column count) is held in memory.
+    All cells are stored as strings. Returns {num_columns: parquet_path}.
+    """
+    if pq is None:
+        raise ImportError("pyarrow is required for streaming grouping: pip install pyarrow")
+    os.makedirs(dataset_folder, exist_ok=True)
+    writers, buffers, buffered_rows, paths = {}, defaultdict(list), defaultdict(int), {}
+
+    def flush(num_columns):
+        if buffers[num_columns]:
+            writers[num_columns].write_table(pa.concat_tables(buffers[num_columns]))
+            buffers[num_columns], buffered_rows[num_columns] = [], 0
+
+    try:
+        for root, _, files in os.walk(folder_path):
+            for file in files:
+                if not file.endswith('.csv'):
+                    continue
+                file_path = os.path.join(root, file)
+                try:
+                    # Read the CSV file without headers, keeping every cell as text so schemas line up
+                    df = pd.read_csv(file_path, header=None, skiprows=1, dtype=str)
+                except pd.errors.EmptyDataError:
+                    continue
+                except pd.errors.ParserError as e:
+                    print(f"Error parsing {file_path}: {str(e)}")
+                    continue
+                except Exception as e:
+                    print(f"Error reading {file_path}: {str(e)}")
+                    continue
+
+                num_columns = df.shape[1]
+                df.columns = [str(i) for i in range(num_columns)]
+                if num_columns not in writers:
+                    schema = pa.schema([(column, pa.string()) for column in df.columns])
+                    paths[num_columns] = os.path.join(dataset_folder, f'columns_{num_columns}.parquet')
+                    writers[num_columns] = pq.ParquetWriter(paths[num_columns], schema)
+                buffers[num_columns].append(pa.Table.from_pandas(df, schema=writers[num_columns].schema, preserve_index=False))
+                buffered_rows[num_columns] += len(df)
+                if buffered_rows[num_columns] >= row_group_size:
+                    flush(num_columns)
+    finally:
+        for num_columns, writer in writers.items():
+            flush(num_columns)
+            writer.close()
+    return paths
+
+
+def export_parquet_to_excel(parquet_path, output_file, batch_size=10000):
+    """Write a grouped Parquet file to Excel in constant-memory mode with Times New Roman font."""
+    parquet_file = pq.ParquetFile(parquet_path)
+    workbook = xlsxwriter.Workbook(output_file, {'constant_memory': True, 'strings_to_numbers': True})
+    worksheet = workbook.add_worksheet('Sheet1')
+    times_new_roman_format = workbook.add_format({'font_name': 'Times New Roman'})
+    header_format = workbook.add_format({'font_name': 'Times New Roman', 'bold': True, 'border': 1})
+    worksheet.set_column('A:Z', None, times_new_roman_format)
+    worksheet.set_default_row(None, times_new_roman_format)
+
+    # Header row with the column numbers, as DataFrame.to_excel writes it
+    worksheet.write_row(0, 0, [int(name) for name in parquet_file.schema_arrow.names], header_format)
+    row_number = 1
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        columns = batch.to_pydict()
+        for row in zip(*columns.values()):
+            for column_number, value in enumerate(row):
+                if value is not None:
+                    worksheet.write(row_number, column_number, value)
+            row_number += 1
+    workbook.close()
+
+
 def save_dataframe_with_times_new_roman(df, output_file):
     # Save the DataFrame to an Excel file with Times New Roman font
     with pd.ExcelWriter(output_file, engine='xlsxwriter') as writer:
@@ -156,24 +354,48 @@ def save_dataframe_with_times_new_roman(df, output_file):
 
 
 
-folder_path = '/home/alok/Documents/alok/files/files/SalesProject/Data/G-Drive'
-output_folder = '/home/alok/Documents/alok/files/files/SalesProject/Data/G-Drive-Output'
-process_folder(folder_path, output_folder)
-grouped_dataframes = find_and_group_csv_files(output_folder)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract tables from PDF/ODT files and group them by column count.")
+    parser.add_argument('--input', default='/home/alok/Documents/alok/files/files/SalesProject/Data/G-Drive')
+    parser.add_argument('--output', default='/home/alok/Documents/alok/files/files/SalesProject/Data/G-Drive-Output')
+    parser.add_argument('--parallel', action='store_true', help="Extract PDF tables per page across a process pool")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes (default: all cores)")
+    parser.add_argument('--stream', action='store_true', help="Group CSVs into per-column-count Parquet files as they are read")
+    parser.add_argument('--dataset_folder', default=None, help="Where --stream writes Parquet files (default: <output>/grouped)")
+    parser.add_argument('--excel', action='store_true', help="With --stream, also export the groups to Excel in constant-memory mode")
+    args = parser.parse_args()
+
+    folder_path = args.input
+    output_folder = args.output
+    if args.parallel:
+        process_folder_parallel(folder_path, output_folder, workers=args.workers)
+    else:
+        process_folder(folder_path, output_folder)
+
+    if args.stream:
+        # Group into Parquet without holding the tables in memory; Excel export is optional
+        grouped_paths = stream_group_csv_files(output_folder, args.dataset_folder or os.path.join(output_folder, 'grouped'))
+        print(f"Grouped tables written to {sorted(grouped_paths.values())}")
+        if args.excel:
+            for num_columns, name in [(1, 'one'), (2, 'two'), (3, 'three')]:
+                if num_columns in grouped_paths:
+                    export_parquet_to_excel(grouped_paths[num_columns], f'/home/alok/Documents/working_tenders/v2/pastcod/output_{name}_columns.xlsx')
+    else:
+        grouped_dataframes = find_and_group_csv_files(output_folder)
 
-#print(grouped_dataframes)
+        #print(grouped_dataframes)
 
-if 1 in grouped_dataframes:
-    df_one_columns = grouped_dataframes[1]
-    save_dataframe_with_times_new_roman(df_one_columns, '/home/alok/Documents/working_tenders/v2/pastcod/output_one_columns.xlsx')
+        if 1 in grouped_dataframes:
+            df_one_columns = grouped_dataframes[1]
+            save_dataframe_with_times_new_roman(df_one_columns, '/home/alok/Documents/working_tenders/v2/pastcod/output_one_columns.xlsx')
     
-if 2 in grouped_dataframes:
-    df_two_columns = grouped_dataframes[2]
-    save_dataframe_with_times_new_roman(df_two_columns, '/home/alok/Documents/working_tenders/v2/pastcod/output_two_columns.xlsx')
+        if 2 in grouped_dataframes:
+            df_two_columns = grouped_dataframes[2]
+            save_dataframe_with_times_new_roman(df_two_columns, '/home/alok/Documents/working_tenders/v2/pastcod/output_two_columns.xlsx')
 
-if 3 in grouped_dataframes:
-    df_three_columns = grouped_dataframes[3]
-    save_dataframe_with_times_new_roman(df_three_columns, '/home/alok/Documents/working_tenders/v2/pastcod/output_three_columns.xlsx')
+        if 3 in grouped_dataframes:
+            df_three_columns = grouped_dataframes[3]
+            save_dataframe_with_times_new_roman(df_three_columns, '/home/alok/Documents/working_tenders/v2/pastcod/output_three_columns.xlsx')
 
 
-print("DONE")
+    print("DONE")
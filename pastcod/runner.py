@@ -1,5 +1,8 @@
 import pandas as pd
-import re, json
+import re, json, os, sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'documentretriever'))
+from textnorm import format_frame
 
 
 
@@ -20,18 +23,19 @@ def advanced_format_text(text):
 
     return text
 
-# Load the ODS file into a pandas DataFrame
-df = pd.read_excel('pastcod/output_two_columns.ods', engine="odf")
+if __name__ == "__main__":
+    # Load the ODS file into a pandas DataFrame
+    df = pd.read_excel('pastcod/output_two_columns.ods', engine="odf")
 
-# Apply the first cleaning function to remove single spaces
-df = df.applymap(advanced_format_text)
+    # Apply the cleaning rules to every cell in one batch (same output as df.applymap(advanced_format_text))
+    df = format_frame(df)
 
-# Convert the filtered DataFrame to a dictionary with 1-based indexing
-data_dict = df.reset_index().rename(columns={'index': 'ID'}).set_index('ID').to_dict(orient='index')
+    # Convert the filtered DataFrame to a dictionary with 1-based indexing
+    data_dict = df.reset_index().rename(columns={'index': 'ID'}).set_index('ID').to_dict(orient='index')
 
-# Display the resulting dictionary
-print(data_dict)
+    # Display the resulting dictionary
+    print(data_dict)
 
-# Assuming `data_dict` is your dictionary
-with open('pastcod/output_two_columns.json', 'w') as json_file:
-    json.dump(data_dict, json_file, indent=4)  # `indent=4` makes the JSON file more readable
+    # Assuming `data_dict` is your dictionary
+    with open('pastcod/output_two_columns.json', 'w') as json_file:
+        json.dump(data_dict, json_file, indent=4)  # `indent=4` makes the JSON file more readable
@@ -0,0 +1,193 @@
+import json
+import logging
+import argparse
+
+import numpy as np
+
+# Array names inside the .npz file are "<method>__<column>"
+SEPARATOR = "__"
+MISSING_ID = -1
+
+
+def iter_records(path):
+    """
+    Yield {'clause_id', 'method', 'result'} records from a runner output file.
+
+    Accepts the JSON Lines sink written by runner.py and the nested {clause_id: {method: result}} JSON
+    written by --export_json (and by earlier runs).
+    """
+    with open(path, 'r') as f:
+        first = f.read(1)
+        f.seek(0)
+        if first == '{' and not path.endswith('.jsonl'):
+            for clause_id, methods in json.load(f).items():
+                for method, result in methods.items():
+                    yield {'clause_id': clause_id, 'method': method, 'result': result}
+            return
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def _hits(result):
+    """The ranked hits of one result; single-query retrievers wrap them in an extra list."""
+    if result and isinstance(result[0], list):
+        return result[0]
+    return result or []
+
+
+def write_npz(records, path, k=None):
+    """
+    Write retrieval records as columnar arrays: per method the clause ids, a (clauses x k) array of document
+    ids padded with -1, the matching similarity scores padded with NaN, and per-clause degraded/missing flags.
+
+    When a (clause, method) pair appears more than once (e.g. after --resume), the last non-null result wins.
+    """
+    by_method = {}
+    for record in records:
+        rows = by_method.setdefault(record['method'], {})
+        clause_id = str(record['clause_id'])
+        if record['result'] is not None or clause_id not in rows:
+            rows[clause_id] = record['result']
+
+    arrays = {}
+    for method, rows in by_method.items():
+        clause_ids = sorted(rows, key=lambda clause_id: (len(clause_id), clause_id))  # Numeric ids in order
+        width = k or max((len(_hits(result)) for result in rows.values()), default=0)
+        doc_ids = np.full((len(clause_ids), width), MISSING_ID, dtype=np.int64)
+        scores = np.full((len(clause_ids), width), np.nan, dtype=np.float32)
+        degraded = np.zeros(len(clause_ids), dtype=bool)
+        missing = np.zeros(len(clause_ids), dtype=bool)
+        for row, clause_id in enumerate(clause_ids):
+            result = rows[clause_id]
+            missing[row] = result is None
+            hits = _hits(result)[:width]
+            doc_ids[row, :len(hits)] = [hit['id'] for hit in hits]
+            scores[row, :len(hits)] = [hit['similarity'] for hit in hits]
+            degraded[row] = any(hit.get('degraded') for hit in hits)
+        arrays.update({
+            f"{method}{SEPARATOR}clause_ids": np.array(clause_ids, dtype=str),
+            f"{method}{SEPARATOR}doc_ids": doc_ids,
+            f"{method}{SEPARATOR}scores": scores,
+            f"{method}{SEPARATOR}degraded": degraded,
+            f"{method}{SEPARATOR}missing": missing,
+        })
+    # Uncompressed, so a reader only pays for the members it touches
+    np.savez(path, **arrays)
+    logging.info(f"Wrote {sum(len(rows) for rows in by_method.values())} results for {len(by_method)} methods to {path}")
+
+
+class ResultsStore:
+    def __init__(self, path):
+        """
+        Random access to a results file written by write_npz.
+
+        Arrays are read from the archive the first time a method is accessed and kept afterwards.
+        """
+        self.path = path
+        self._npz = np.load(path)
+        self.methods = sorted({name.split(SEPARATOR)[0] for name in self._npz.files})
+        self._columns = {}
+        self._rows = {}
+
+    def close(self):
+        self._npz.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def column(self, method, name):
+        """One array of a method: clause_ids, doc_ids, scores, degraded or missing."""
+        key = (method, name)
+        if key not in self._columns:
+            if method not in self.methods:
+                raise KeyError(f"No results for method {method!r}; available: {self.methods}")
+            self._columns[key] = self._npz[f"{method}{SEPARATOR}{name}"]
+        return self._columns[key]
+
+    def row(self, method, clause_id):
+        """Row index of a clause in a method's arrays, or None if the clause was not run with that method."""
+        if method not in self._rows:
+            self._rows[method] = {clause_id: row for row, clause_id in enumerate(self.column(method, "clause_ids"))}
+        return self._rows[method].get(str(clause_id))
+
+    def get(self, clause_id, method):
+        """Ranked hits [{'id', 'similarity'}] for a clause and method; None if missing or not run."""
+        row = self.row(method, clause_id)
+        if row is None or self.column(method, "missing")[row]:
+            return None
+        doc_ids, scores = self.column(method, "doc_ids")[row], self.column(method, "scores")[row]
+        return [{'id': int(doc_id), 'similarity': float(score)}
+                for doc_id, score in zip(doc_ids, scores) if doc_id != MISSING_ID]
+
+    def clause_ids(self, method):
+        return [str(clause_id) for clause_id in self.column(method, "clause_ids")]
+
+    def to_nested(self):
+        """The nested {clause_id: {method: [hits]}} layout of retrieval_results.json."""
+        nested = {}
+        for method in self.methods:
+            for clause_id in self.clause_ids(method):
+                nested.setdefault(clause_id, {})[method] = self.get(clause_id, method)
+        return nested
+
+
+def diff(store, other, method, k=None):
+    """
+    Compare two runs of one method clause by clause.
+
+    Returns {clause_id: overlap} where overlap is the share of the top k document ids of store that are also in
+    the top k of other (1.0 = same set), for clauses present in both runs.
+    """
+    overlaps = {}
+    for clause_id in store.clause_ids(method):
+        row, other_row = store.row(method, clause_id), other.row(method, clause_id)
+        if other_row is None:
+            continue
+        ids = store.column(method, "doc_ids")[row][:k]
+        other_ids = other.column(method, "doc_ids")[other_row][:k]
+        ids, other_ids = set(ids[ids != MISSING_ID].tolist()), set(other_ids[other_ids != MISSING_ID].tolist())
+        overlaps[clause_id] = len(ids & other_ids) / len(ids) if ids else float(not other_ids)
+    return overlaps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build, query and diff columnar retrieval result files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Convert a runner output (JSON Lines or nested JSON) to .npz")
+    build.add_argument("input")
+    build.add_argument("output")
+    build.add_argument("--k", type=int, default=None, help="Keep at most k hits per result")
+    show = commands.add_parser("show", help="Print the hits of one clause")
+    show.add_argument("store")
+    show.add_argument("clause_id")
+    show.add_argument("--method", default=None, help="Only this method (default: all)")
+    compare = commands.add_parser("diff", help="Top-k overlap per method between two result files")
+    compare.add_argument("store")
+    compare.add_argument("other")
+    compare.add_argument("--k", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.command == "build":
+        write_npz(iter_records(args.input), args.output, k=args.k)
+    elif args.command == "show":
+        with ResultsStore(args.store) as store:
+            for method in [args.method] if args.method else store.methods:
+                print(json.dumps({"method": method, "result": store.get(args.clause_id, method)}))
+    else:
+        with ResultsStore(args.store) as store, ResultsStore(args.other) as other:
+            for method in sorted(set(store.methods) & set(other.methods)):
+                overlaps = diff(store, other, method, k=args.k)
+                changed = sum(overlap < 1.0 for overlap in overlaps.values())
+                mean = np.mean(list(overlaps.values())) if overlaps else float('nan')
+                print(f"{method:<12}{len(overlaps):>8} clauses{mean:>8.3f} mean overlap{changed:>8} changed")
+
+
+if __name__ == "__main__":
+    main()
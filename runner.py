@@ -5,7 +5,10 @@ import sys
 import os
 import traceback
 import argparse
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import functools
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 
 # Add the current directory to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -13,6 +16,10 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+from workqueue import WorkQueue, work
+from core_budget import CoreBudget, METHOD_THREADS, limit_threads
+from results_store import iter_records, write_npz
+
 try:
     from documentretriever import runner as doc_retriever
 except ImportError as e:
@@ -20,7 +27,7 @@ except ImportError as e:
     logging.error("Please ensure that the documentretriever folder is in the same directory as this script.")
     sys.exit(1)
 
-def process_clause(clause_data, json_output_path, method, k=5):
+def process_clause(clause_data, json_output_path, method, k=5, deadline=None):
     """Process a single clause using the document retriever."""
     try:
         clause_id = clause_data['id']
@@ -29,7 +36,8 @@ def process_clause(clause_data, json_output_path, method, k=5):
             'processed_docs_path': json_output_path,
             'query': clause_text,
             'method': method,
-            'k': k
+            'k': k,
+            'deadline': deadline
         })
         return clause_id, method, result
     except Exception as e:
@@ -37,14 +45,54 @@ def process_clause(clause_data, json_output_path, method, k=5):
         logging.error(f"Traceback: {traceback.format_exc()}")
         return clause_data['id'], method, None
 
-def main(json_output_path, retrieval_methods):
-    # Check if the processed documents file exists
-    if not os.path.exists(json_output_path):
-        logging.error(f"Processed documents file not found: {json_output_path}")
-        logging.error("Please run the initial_processor.py script first to generate this file.")
-        sys.exit(1)
+def json_default(obj):
+    """Serialize numpy scalars and arrays returned by the dense retrievers."""
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def load_completed(output_path):
+    """Return the (clause_id, method) pairs that already have a result in the output file."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logging.warning(f"Ignoring unreadable line {line_number} in {output_path}")
+                continue
+            if record.get('result') is not None:
+                completed.add((str(record['clause_id']), record['method']))
+    return completed
+
+def load_results(output_path):
+    """Load a streamed results file into the nested {clause_id: {method: result}} layout."""
+    results = {}
+    with open(output_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            results.setdefault(str(record['clause_id']), {})[record['method']] = record['result']
+    return results
+
+def open_results_sink(output_path, resume):
+    """Open the results file for appending (resume) or writing, repairing a line cut off by a crash."""
+    if resume and os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        with open(output_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b'\n'
+        sink = open(output_path, 'a')
+        if needs_newline:
+            sink.write('\n')
+        return sink
+    return open(output_path, 'w')
 
-    # Load the JSON file into a list of dictionaries
+def load_clauses():
+    """Load the clauses extracted by pastcod as a list of dictionaries with an 'id'."""
     try:
         with open('pastcod/output_two_columns.json', 'r') as json_file:
             data_list = json.load(json_file)
@@ -58,41 +106,183 @@ def main(json_output_path, retrieval_methods):
     # Ensure data_list is a list of dictionaries
     if isinstance(data_list, dict):
         data_list = [{'id': k, **v} for k, v in data_list.items()]
+    return data_list
 
-    # Set up multiprocessing pool
-    num_processes = multiprocessing.cpu_count()
-    
-    # Create a list of all tasks (clause, method combinations)
-    tasks = [(clause, json_output_path, method, 5) for clause in data_list for method in retrieval_methods]
+def run_batch(payload, heartbeat, attempt=1, final_attempt=True, budget=None):
+    """Work-queue handler: retrieve every clause of a batch with one method."""
+    if budget:
+        limit_threads(budget.threads_for(payload['method']))
+    records = []
+    for clause in payload['clauses']:
+        clause_id, method, result = process_clause(clause, payload['processed_docs'], payload['method'],
+                                                   payload['k'], payload['deadline'])
+        records.append({'clause_id': clause_id, 'method': method, 'result': result})
+        heartbeat()
+    failed = sum(record['result'] is None for record in records)
+    if failed and not final_attempt:
+        raise RuntimeError(f"{failed} of {len(records)} clauses failed")  # Retry the batch, possibly on another host
+    return json.loads(json.dumps(records, default=json_default))
 
-    # Process clauses and methods in parallel
-    results = {}
-    with ProcessPoolExecutor(max_workers=num_processes) as executor:
-        future_to_task = {executor.submit(process_clause, *task): task for task in tasks}
-        for future in as_completed(future_to_task):
-            clause_id, method, result = future.result()
-            if clause_id not in results:
-                results[clause_id] = {}
-            results[clause_id][method] = result
-
-    # Collect and process results
-    for clause_id, method_results in results.items():
-        for method, result in method_results.items():
-            if result is not None:
-                logging.info(f"Process output for clause ID {clause_id}, method {method}: {result}")
-            else:
-                logging.warning(f"No result for clause ID {clause_id}, method {method}")
-
-    # Save results to a file
-    with open('retrieval_results.json', 'w') as f:
-        json.dump(results, f, indent=2)
+def batch_key(method, clauses):
+    """Stable task key, so enqueueing the same batch twice is a no-op."""
+    ids = ','.join(str(clause['id']) for clause in clauses)
+    return f"{method}:{hashlib.sha1(ids.encode('utf-8')).hexdigest()}"
+
+def enqueue_batches(queue_path, json_output_path, retrieval_methods, completed=frozenset(), batch_size=10,
+                    deadline=None):
+    """Enqueue the remaining (clause, method) pairs as batches of batch_size clauses per method."""
+    data_list = load_clauses()
+    with WorkQueue(queue_path) as queue:
+        added = 0
+        for method in retrieval_methods:
+            remaining = [clause for clause in data_list if (str(clause['id']), method) not in completed]
+            batches = (remaining[start:start + batch_size] for start in range(0, len(remaining), batch_size))
+            added += queue.enqueue((batch_key(method, batch), {'clauses': batch, 'method': method, 'k': 5,
+                                                               'processed_docs': json_output_path,
+                                                               'deadline': deadline})
+                                   for batch in batches)
+        logging.info(f"Enqueued {added} new batches in {queue_path}; queue status: {queue.counts()}")
+
+def run_workers(queue_path, num_workers=None, budget=None):
+    """Run worker processes on this host until the queue is drained."""
+    # Any worker may get a dense batch, so size the pool for the most thread-hungry method
+    budget = budget or CoreBudget()
+    threads = budget.threads_for(max(METHOD_THREADS, key=budget.threads_for))
+    num_workers = num_workers or budget.cores // threads
+    handler = functools.partial(run_batch, budget=budget)
+    workers = [multiprocessing.Process(target=work, args=(queue_path, handler)) for _ in range(num_workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+def collect_results(queue_path, output_path, resume=False):
+    """Write the results of every completed batch to the JSON Lines output, skipping pairs already there."""
+    completed = load_completed(output_path) if resume else set()
+    written = 0
+    with WorkQueue(queue_path) as queue, open_results_sink(output_path, resume) as sink:
+        for _, records in queue.results():
+            for record in records:
+                if (str(record['clause_id']), record['method']) in completed:
+                    continue
+                sink.write(json.dumps(record) + '\n')
+                written += 1
+        for key, payload, error in queue.failures():
+            logging.error(f"Batch {key} ({len(payload['clauses'])} clauses, {payload['method']}) failed: {error}")
+        if not queue.finished():
+            logging.warning(f"Queue still has unfinished batches: {queue.counts()}")
+    logging.info(f"Collected {written} results into {output_path}")
+
+def main(json_output_path, retrieval_methods, output_path='retrieval_results.jsonl', resume=False, export_json=None,
+         deadline=None, backend='local', queue_path=None, role='all', batch_size=10, num_workers=None,
+         budget=None, export_npz=None):
+    # Check if the processed documents file exists
+    if role in ('all', 'enqueue') and not os.path.exists(json_output_path):
+        logging.error(f"Processed documents file not found: {json_output_path}")
+        logging.error("Please run the initial_processor.py script first to generate this file.")
+        sys.exit(1)
+
+    # Skip (clause, method) pairs that already have a result from an earlier run
+    completed = load_completed(output_path) if resume else set()
+    if completed:
+        logging.info(f"Resuming: {len(completed)} results already present in {output_path}")
+
+    if backend == 'queue':
+        # Batches go through a durable queue that worker hosts (runner.py --role worker) pull from
+        if role in ('all', 'enqueue'):
+            enqueue_batches(queue_path, json_output_path, retrieval_methods, completed, batch_size, deadline)
+        if role in ('all', 'worker'):
+            run_workers(queue_path, num_workers, budget)
+        if role in ('all', 'collect'):
+            collect_results(queue_path, output_path, resume)
+        if role in ('enqueue', 'worker'):
+            return
+    else:
+        run_local(json_output_path, retrieval_methods, output_path, resume, completed, deadline, num_workers, budget)
+
+    logging.info(f"Results written to {output_path}")
+
+    # Optionally write the nested JSON layout used by earlier runs
+    if export_json:
+        with open(export_json, 'w') as f:
+            json.dump(load_results(output_path), f, indent=2)
+        logging.info(f"Exported results to {export_json}")
+
+    # Optionally write the columnar store (see results_store.py) for random access by clause and method
+    if export_npz:
+        write_npz(iter_records(output_path), export_npz)
+
+def run_local(json_output_path, retrieval_methods, output_path, resume, completed, deadline, num_processes=None,
+              budget=None):
+    """
+    Run every remaining (clause, method) pair in process pools on this machine.
+
+    Each method gets its own pool sized by the core budget: lexical methods run one single-threaded worker
+    per core, dense methods fewer workers with several intra-op threads each, so workers x threads stays
+    within the budget instead of every worker starting cpu_count() threads.
+    """
+    data_list = load_clauses()
+    budget = budget or CoreBudget()
+
+    with open_results_sink(output_path, resume) as sink:
+        for method in retrieval_methods:
+            # Lazily generate the remaining tasks for this method
+            tasks = ((clause, json_output_path, method, 5, deadline) for clause in data_list
+                     if (str(clause['id']), method) not in completed)
+            num_workers = num_processes or budget.workers_for(method)
+            initializer, initargs = budget.initializer(method, multiprocessing.Value('i', 0) if budget.pin else None)
+            logging.info(f"{method}: {num_workers} workers x {budget.threads_for(method)} threads "
+                         f"on {budget.cores} cores{' (pinned)' if budget.pin else ''}")
+
+            # Keep only a bounded number of tasks in flight and append every result to the output file
+            # as soon as it completes
+            max_in_flight = 2 * num_workers
+            with ProcessPoolExecutor(max_workers=num_workers, initializer=initializer, initargs=initargs) as executor:
+                in_flight = {executor.submit(process_clause, *task) for task in itertools.islice(tasks, max_in_flight)}
+                while in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        clause_id, method, result = future.result()
+                        sink.write(json.dumps({'clause_id': clause_id, 'method': method, 'result': result}, default=json_default) + '\n')
+                        sink.flush()
+                        if result is not None:
+                            logging.info(f"Process output for clause ID {clause_id}, method {method}: {result}")
+                        else:
+                            logging.warning(f"No result for clause ID {clause_id}, method {method}")
+                    in_flight |= {executor.submit(process_clause, *task) for task in itertools.islice(tasks, len(done))}
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run the document retrieval process.")
     parser.add_argument("--processed_docs", type=str, help="Path to the processed documents JSON file.", 
                         default="all_files/20240906_121937/sys/temp/extracted_data.json")
-    parser.add_argument("--method", type=str, nargs='+', choices=["bm25", "tfidf", "flash", "lunr", "fuzz", "embedding", "encoder", "dpr"],
+    parser.add_argument("--method", type=str, nargs='+', choices=["bm25", "tfidf", "flash", "lunr", "fuzz", "embedding", "encoder", "dpr", "positional", "bm25_wand", "tfidf_wand"],
                         default=["bm25"], help="Retrieval methods to use")
+    parser.add_argument("--output", type=str, default="retrieval_results.jsonl",
+                        help="JSON Lines file that results are appended to as they complete.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip (clause, method) pairs that already have a result in the output file.")
+    parser.add_argument("--export_json", type=str, default=None,
+                        help="Also write the results as a nested JSON file (e.g. retrieval_results.json).")
+    parser.add_argument("--export_npz", type=str, default=None,
+                        help="Also write the results as columnar arrays (e.g. retrieval_results.npz); see results_store.py.")
+    parser.add_argument("--deadline", type=float, default=None,
+                        help="Per-clause deadline in seconds; slow methods degrade to a cheaper fallback.")
+    parser.add_argument("--backend", choices=["local", "queue"], default="local",
+                        help="local: process pool on this machine; queue: batches in a durable queue shared by hosts.")
+    parser.add_argument("--queue", type=str, default="retrieval_queue.sqlite",
+                        help="Queue database for --backend queue; put it on storage every worker host can reach.")
+    parser.add_argument("--role", choices=["all", "enqueue", "worker", "collect"], default="all",
+                        help="With --backend queue: enqueue batches, work on them, collect results, or all three.")
+    parser.add_argument("--batch_size", type=int, default=10, help="Clauses per queued batch.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes on this host (default: derived from the core budget per method).")
+    parser.add_argument("--cores", type=int, default=None, help="Core budget on this host (default: all available).")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Intra-op threads per worker for every method (default: per-method setting).")
+    parser.add_argument("--pin", action="store_true", help="Pin each local worker to its own cores (Linux).")
     args = parser.parse_args()
     
-    main(args.processed_docs, args.method)
+    main(args.processed_docs, args.method, output_path=args.output, resume=args.resume, export_json=args.export_json,
+         deadline=args.deadline, backend=args.backend, queue_path=args.queue, role=args.role,
+         batch_size=args.batch_size, num_workers=args.workers,
+         budget=CoreBudget(cores=args.cores, threads=args.threads, pin=args.pin), export_npz=args.export_npz)
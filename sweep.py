@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import itertools
+import multiprocessing
+
+import numpy as np
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from results_store import ResultsStore, iter_records, _hits
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+METHODS = ["bm25", "tfidf", "flash", "lunr", "fuzz", "embedding", "encoder", "dpr", "positional", "bm25_wand", "tfidf_wand"]
+
+
+def load_labels(labels_path, clauses_path='pastcod/output_two_columns.json'):
+    """
+    Load the labelled set as a list of {'id', 'query', 'relevant'}.
+
+    The labels file is either a list of {'id', 'query', 'relevant'} or a {clause_id: relevant} mapping whose
+    query texts come from the pastcod clauses file. A relevant item is a paragraph id, or a span
+    {'source', 'unit', 'start', 'end'} that stays valid when the corpus is re-chunked.
+    """
+    with open(labels_path, 'r') as f:
+        labels = json.load(f)
+    if isinstance(labels, list):
+        return [{'id': str(item['id']), 'query': item.get('query'), 'relevant': item['relevant']} for item in labels]
+    with open(clauses_path, 'r') as f:
+        clauses = json.load(f)
+    if isinstance(clauses, dict):
+        clauses = [{'id': k, **v} for k, v in clauses.items()]
+    texts = {str(clause['id']): clause['Clause'] for clause in clauses}
+    return [{'id': str(clause_id), 'query': texts.get(str(clause_id)), 'relevant': relevant}
+            for clause_id, relevant in labels.items()]
+
+
+def _spans_overlap(document, span):
+    """Whether a paragraph (or one of its collapsed occurrences) overlaps a labelled span."""
+    for location in [document] + document.get('occurrences', []):
+        if (location.get('source') == span['source'] and location.get('unit') == span.get('unit', location.get('unit'))
+                and location.get('start', 0) < span['end'] and span['start'] < location.get('end', 0)):
+            return True
+    return False
+
+
+def is_relevant(doc_id, relevant, documents_by_id=None):
+    """Whether a retrieved paragraph id matches one of the relevant ids or spans of a query."""
+    for item in relevant:
+        if isinstance(item, dict):
+            document = documents_by_id.get(doc_id) if documents_by_id else None
+            if document is not None and _spans_overlap(document, item):
+                return True
+        elif str(item) == str(doc_id):
+            return True
+    return False
+
+
+def score_rankings(rankings, labels, ks, documents_by_id=None):
+    """
+    recall@k for every k and MRR over the labelled queries.
+
+    :param rankings: {clause_id: [doc ids, best first]}; queries without a ranking count as misses.
+    :return: {'recall@k': ..., 'mrr': ..., 'queries': n}
+    """
+    recalls = {k: [] for k in ks}
+    reciprocal_ranks = []
+    for label in labels:
+        ranking = rankings.get(label['id']) or []
+        hits = [is_relevant(doc_id, label['relevant'], documents_by_id) for doc_id in ranking]
+        first = next((rank for rank, hit in enumerate(hits, 1) if hit), None)
+        reciprocal_ranks.append(1.0 / first if first else 0.0)
+        for k in ks:
+            # Span labels can be covered by several paragraphs, so recall counts labels found, not paragraphs
+            found = sum(any(is_relevant(doc_id, [item], documents_by_id) for doc_id in ranking[:k])
+                        for item in label['relevant'])
+            recalls[k].append(found / len(label['relevant']) if label['relevant'] else 0.0)
+    scores = {f"recall@{k}": float(np.mean(values)) if values else 0.0 for k, values in recalls.items()}
+    scores['mrr'] = float(np.mean(reciprocal_ranks)) if reciprocal_ranks else 0.0
+    scores['queries'] = len(labels)
+    return scores
+
+
+def load_rankings(results_path):
+    """{method: {clause_id: [doc ids]}} from a past run (JSON Lines, nested JSON or a results_store .npz)."""
+    rankings = {}
+    if results_path.endswith('.npz'):
+        with ResultsStore(results_path) as store:
+            for method in store.methods:
+                rankings[method] = {clause_id: [hit['id'] for hit in store.get(clause_id, method) or []]
+                                    for clause_id in store.clause_ids(method)}
+        return rankings
+    for record in iter_records(results_path):
+        if record['result'] is not None or str(record['clause_id']) not in rankings.get(record['method'], {}):
+            rankings.setdefault(record['method'], {})[str(record['clause_id'])] = [
+                hit['id'] for hit in _hits(record['result'])]
+    return rankings
+
+
+def load_documents_by_id(processed_docs_path):
+    with open(processed_docs_path, 'r') as f:
+        return {doc['id']: doc for doc in json.load(f)}
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB."""
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # kilobytes on Linux
+
+
+def run_config(config, labels, k):
+    """
+    Build one configuration and run every labelled query; runs in a fresh process so memory is per config.
+
+    Returns index build time, per-query latencies and the rankings.
+    """
+    from documentretriever.retrievers.main import build_retriever
+
+    with open(config['corpus'], 'r') as f:
+        documents = json.load(f)
+    started = time.perf_counter()
+    retriever = build_retriever(documents, config['method'], **config['options'])
+    index_seconds = time.perf_counter() - started
+
+    rankings, latencies = {}, []
+    for label in labels:
+        started = time.perf_counter()
+        result = retriever.retrieve(label['query'], k=k)
+        latencies.append(time.perf_counter() - started)
+        rankings[label['id']] = [hit['id'] for hit in _hits(result)]
+    return {'index_seconds': index_seconds, 'latencies': latencies, 'rankings': rankings,
+            'peak_mb': peak_rss_mb(), 'documents': len(documents)}
+
+
+def pareto_front(rows, quality, costs):
+    """Indices of the rows that no other row beats on quality without costing more on every cost column."""
+    front = []
+    for i, row in enumerate(rows):
+        dominated = any(
+            other[quality] >= row[quality] and all(other[cost] <= row[cost] for cost in costs)
+            and (other[quality] > row[quality] or any(other[cost] < row[cost] for cost in costs))
+            for j, other in enumerate(rows) if j != i)
+        if not dominated:
+            front.append(i)
+    return front
+
+
+def print_table(rows, ks, quality):
+    columns = [f"recall@{k}" for k in ks] + ['mrr']
+    timed = 'latency_p50_ms' in rows[0]
+    header = f"  {'configuration':<44}" + ''.join(f"{column:>11}" for column in columns)
+    if timed:
+        header += f"{'p50 ms':>9}{'p95 ms':>9}{'q/s':>8}{'index s':>9}{'peak MB':>9}"
+    print(header)
+    costs = ['latency_p50_ms', 'peak_mb'] if timed else []
+    front = set(pareto_front(rows, quality, costs)) if costs else set()
+    for i, row in sorted(enumerate(rows), key=lambda item: -item[1][quality]):
+        line = f"{'*' if i in front else ' '} {row['name']:<44}" + ''.join(f"{row[column]:>11.3f}" for column in columns)
+        if timed:
+            line += (f"{row['latency_p50_ms']:>9.1f}{row['latency_p95_ms']:>9.1f}{row['throughput']:>8.1f}"
+                     f"{row['index_seconds']:>9.1f}{row['peak_mb']:>9.0f}")
+        print(line)
+    if front:
+        print(f"* Pareto-optimal on {quality} vs. p50 latency and peak memory")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep retrieval methods and settings for recall/MRR vs. latency and memory.")
+    parser.add_argument('labels', help="Labelled clause -> paragraph set (see load_labels)")
+    parser.add_argument('--clauses', default='pastcod/output_two_columns.json', help="Clause texts for id-only labels")
+    parser.add_argument('--processed_docs', nargs='+', default=[],
+                        help="One or more extracted_data.json files, e.g. built with different chunking settings")
+    parser.add_argument('--method', nargs='+', choices=METHODS, default=["bm25"])
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 5, 10], help="Cut-offs for recall@k")
+    parser.add_argument('--backends', nargs='+', default=["torch"],
+                        help="Inference backends tried for the dense methods (torch, int8, onnx)")
+    parser.add_argument('--options', type=str, default=None,
+                        help='JSON {method: [kwargs, ...]} of extra retriever settings to sweep, e.g. {"bm25": [{"k": 1.2}]}')
+    parser.add_argument('--score', nargs='+', default=[],
+                        help="Score past runs (retrieval_results.json, .jsonl or .npz) instead of, or as well as, running")
+    parser.add_argument('--quality', default=None, help="Metric the Pareto front uses (default: recall@<largest k>)")
+    parser.add_argument('--output', default=None, help="Write all rows as JSON here")
+    args = parser.parse_args()
+
+    labels = load_labels(args.labels, args.clauses)
+    ks = sorted(set(args.k))
+    quality = args.quality or f"recall@{ks[-1]}"
+    extra_options = json.loads(args.options) if args.options else {}
+    # Span labels need paragraph locations; past runs are scored against the first corpus
+    documents_by_id = load_documents_by_id(args.processed_docs[0]) if args.processed_docs else {}
+
+    # Past runs: quality only
+    scored = []
+    for results_path in args.score:
+        for method, rankings in load_rankings(results_path).items():
+            scored.append({'name': f"{os.path.basename(results_path)}:{method}",
+                           **score_rankings(rankings, labels, ks, documents_by_id)})
+    if scored:
+        print_table(scored, ks, quality)
+
+    # New runs: every corpus x method x settings, each in its own process
+    configs = []
+    for corpus, method in itertools.product(args.processed_docs, args.method):
+        variants = [{'backend': backend} if backend != "torch" else {} for backend in args.backends] \
+            if method in ("embedding", "encoder", "dpr") else [{}]
+        variants = [{**variant, **extra} for variant in variants for extra in extra_options.get(method, [{}])]
+        for options in variants:
+            label = ','.join(f"{key}={value}" for key, value in options.items())
+            name = f"{method}{f'[{label}]' if label else ''}"
+            if len(args.processed_docs) > 1:
+                name += f" @{corpus}"
+            configs.append({'name': name, 'corpus': corpus, 'method': method, 'options': options})
+
+    rows = []
+    context = multiprocessing.get_context("spawn")
+    for config in configs:
+        logging.info(f"Running {config['name']}")
+        try:
+            with context.Pool(1) as pool:
+                run = pool.apply(run_config, (config, labels, ks[-1]))
+        except Exception as e:
+            logging.error(f"{config['name']} failed: {e}")
+            continue
+        corpus_documents = documents_by_id
+        if config['corpus'] != args.processed_docs[0]:
+            corpus_documents = load_documents_by_id(config['corpus'])
+        latencies = np.array(run['latencies']) * 1000
+        rows.append({
+            'name': config['name'], **score_rankings(run['rankings'], labels, ks, corpus_documents),
+            'latency_p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            'latency_p95_ms': float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+            'throughput': len(latencies) / (latencies.sum() / 1000) if latencies.sum() else 0.0,
+            'index_seconds': run['index_seconds'], 'peak_mb': run['peak_mb'],
+        })
+    if rows:
+        print_table(rows, ks, quality)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'scored': scored, 'runs': rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import random
+
+import pytest
+
+from documentretriever.retrievers.wand import TopKIndex, check_exactness
+
+
+def zipf_corpus(num_documents=5000, vocabulary=2000, seed=0):
+    """Synthetic documents whose word frequencies follow Zipf's law, like natural text."""
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(vocabulary)]
+    weights = [1 / (i + 1) for i in range(vocabulary)]
+    return [{"_row": row, "text": " ".join(rng.choices(words, weights, k=rng.randint(10, 150)))}
+            for row in range(num_documents)]
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    documents = zipf_corpus()
+    rng = random.Random(1)
+    # Short and long queries taken from the documents, plus a term-less query
+    queries = [" ".join(rng.choice(documents)["text"].split()[:rng.choice([2, 10, 50])]) for _ in range(100)]
+    return documents, queries + ["unknownterm"]
+
+
+@pytest.mark.parametrize("scoring", ["bm25", "tfidf"])
+@pytest.mark.parametrize("k", [1, 5, 10, 50])
+def test_pruned_top_k_matches_exhaustive(corpus, scoring, k):
+    documents, queries = corpus
+    index = TopKIndex(documents, key="_row", on=["text"], scoring=scoring)
+    assert check_exactness(index, queries, k=k) == []
+
+
+def test_pruning_skips_postings(corpus):
+    documents, queries = corpus
+    index = TopKIndex(documents, key="_row", on=["text"], scoring="bm25")
+    index.search(queries, k=5)
+    assert index.stats["postings_scored"] < index.stats["postings_total"]
@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_expires);
+"""
+
+
+def worker_name():
+    """Identifier of this worker process, unique across hosts sharing a queue."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    def __init__(self, path, lease_seconds=900, max_attempts=3):
+        """
+        Durable task queue in an SQLite file that any number of worker processes and hosts pull from.
+
+        A claimed task is leased to its worker until lease_expires; a worker that dies simply lets the lease
+        lapse and the task is handed out again. Failed tasks are retried until max_attempts, then marked failed.
+        Results are stored with the task so one process can collect them all into a single output.
+
+        The file must be on storage whose locking SQLite can rely on: a local disk when testing, or a shared
+        filesystem with working POSIX locks for multi-host runs.
+
+        :param path: Path of the queue database; created if missing.
+        :param lease_seconds: How long a claimed task stays with its worker without a heartbeat.
+        :param max_attempts: Number of times a task is handed out before it is marked failed.
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute("PRAGMA busy_timeout = 60000")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can never claim the same task
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.connection
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def enqueue(self, tasks):
+        """
+        Add (key, payload) tasks; keys already in the queue are left untouched, so enqueueing is idempotent.
+
+        Returns the number of tasks added.
+        """
+        now = time.time()
+        with self._transaction():
+            cursor = self.connection.executemany(
+                "INSERT OR IGNORE INTO tasks (key, payload, updated) VALUES (?, ?, ?)",
+                ((key, json.dumps(payload), now) for key, payload in tasks))
+        return cursor.rowcount
+
+    def claim(self, worker):
+        """Lease the next pending (or abandoned) task to worker. Returns (task_id, payload, attempt) or None."""
+        now = time.time()
+        with self._transaction():
+            while True:
+                row = self.connection.execute(
+                    "SELECT id, payload, attempts FROM tasks "
+                    "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                    "ORDER BY id LIMIT 1", (now,)).fetchone()
+                if row is None:
+                    return None
+                task_id, payload, attempts = row
+                if attempts < self.max_attempts:
+                    break
+                # The last worker holding it disappeared on its final attempt
+                self.connection.execute(
+                    "UPDATE tasks SET status = 'failed', lease_owner = NULL, updated = ?, "
+                    "error = COALESCE(error, 'lease expired') WHERE id = ?", (now, task_id))
+            self.connection.execute(
+                "UPDATE tasks SET status = 'leased', attempts = attempts + 1, lease_owner = ?, lease_expires = ?, "
+                "updated = ? WHERE id = ?", (worker, now + self.lease_seconds, now, task_id))
+        return task_id, json.loads(payload), attempts + 1
+
+    def heartbeat(self, task_id, worker):
+        """Extend the lease on a task. Returns False if the task is no longer leased to worker."""
+        now = time.time()
+        with self._transaction():
+            cursor = self.connection.execute(
+                "UPDATE tasks SET lease_expires = ?, updated = ? "
+                "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (now + self.lease_seconds, now, task_id, worker))
+        return cursor.rowcount == 1
+
+    def complete(self, task_id, worker, result):
+        """Store the result of a task. Returns False if the lease was lost and another worker took over."""
+        with self._transaction():
+            cursor = self.connection.execute(
+                "UPDATE tasks SET status = 'done', result = ?, error = NULL, lease_owner = NULL, updated = ? "
+                "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (json.dumps(result), time.time(), task_id, worker))
+        return cursor.rowcount == 1
+
+    def fail(self, task_id, worker, error):
+        """Release a task after an error: back to pending for a retry, or failed after max_attempts."""
+        with self._transaction():
+            self.connection.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, lease_owner = NULL, updated = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (self.max_attempts, str(error), time.time(), task_id, worker))
+
+    def counts(self):
+        """Number of tasks per status."""
+        return dict(self.connection.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+
+    def finished(self):
+        """Whether every task is done or failed (nothing pending or leased)."""
+        counts = self.counts()
+        return not counts.get('pending') and not counts.get('leased')
+
+    def results(self):
+        """Yield (key, result) for every completed task, in enqueue order."""
+        cursor = self.connection.execute("SELECT key, result FROM tasks WHERE status = 'done' ORDER BY id")
+        for key, result in cursor:
+            yield key, json.loads(result)
+
+    def failures(self):
+        """Yield (key, payload, error) for every task that exhausted its attempts."""
+        cursor = self.connection.execute("SELECT key, payload, error FROM tasks WHERE status = 'failed' ORDER BY id")
+        for key, payload, error in cursor:
+            yield key, json.loads(payload), error
+
+
+def work(queue_path, handler, poll_seconds=5, **queue_kwargs):
+    """
+    Pull tasks from the queue and run handler(payload, heartbeat, attempt=n, final_attempt=bool) on each
+    until the queue is drained.
+
+    handler returns the result to store (JSON serializable), or raises to have the task retried. It may call
+    heartbeat() between steps of long tasks to keep its lease. Returns the number of tasks completed by this worker.
+    """
+    worker = worker_name()
+    completed = 0
+    with WorkQueue(queue_path, **queue_kwargs) as queue:
+        while True:
+            claimed = queue.claim(worker)
+            if claimed is None:
+                if queue.finished():
+                    break
+                time.sleep(poll_seconds)  # Other workers hold leases that may still lapse and come back
+                continue
+            task_id, payload, attempt = claimed
+            try:
+                result = handler(payload, lambda: queue.heartbeat(task_id, worker), attempt=attempt,
+                                 final_attempt=attempt >= queue.max_attempts)
+            except Exception as e:
+                logging.error(f"Task {task_id} failed on attempt {attempt} in {worker}: {e}")
+                queue.fail(task_id, worker, e)
+                continue
+            if queue.complete(task_id, worker, result):
+                completed += 1
+            else:
+                logging.warning(f"Lost the lease on task {task_id}; its result was discarded")
+    logging.info(f"Worker {worker} completed {completed} tasks")
+    return completed